@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""接口基准：先用 Flask 测试客户端逐个测量路由，再启动真实的 waitress 服务器做并发读写压测
+
+用法: python bench/bench_api.py [--rows 10000] [--readers 8] [--writers 2] [--duration 5] [--threads 8] [-o result.json]
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+
+from common import import_app, make_account, report, seed, setup_db, start_server, summarize, timed
+
+READ_PAGE = '/accounts?limit=100'
+
+
+def bench_test_client(app, revision, rows, args):
+    from cache import list_cache
+    client = app.test_client()
+    rng = random.Random(1)
+
+    def bench(fn):
+        return timed(fn, args.iterations, args.max_seconds)
+
+    def get(path, **kw):
+        def call():
+            response = client.get(path, **kw)
+            assert response.status_code in (200, 304), response.status_code
+        return call
+
+    results = {}
+    if rows <= args.full_scan_limit:
+        results['GET /accounts'] = bench(get('/accounts', headers={'Accept-Encoding': 'gzip'}))
+        full_list = get('/accounts', headers={'Accept-Encoding': 'gzip'})
+        results['GET /accounts uncached'] = bench(lambda: (list_cache.invalidate(), full_list()))
+        results['GET /accounts/changes?since=0'] = bench(get('/accounts/changes?since=0'))
+    results['GET ' + READ_PAGE] = bench(get(READ_PAGE, headers={'Accept-Encoding': 'gzip'}))
+    results['GET /accounts?sort=availability&limit=100'] = bench(get('/accounts?sort=availability&limit=100'))
+    results['GET /accounts/search'] = bench(get('/accounts/search?q=user12&limit=50'))
+    results['GET /accounts/changes recent'] = bench(get('/accounts/changes?since={}'.format(revision)))
+    results['POST /accounts'] = bench(lambda: client.post('/accounts', json=make_account(rng.randint(0, 10 ** 9))))
+    results['PATCH /accounts/<id>'] = bench(lambda: client.patch(
+        '/accounts/{}'.format(rng.randint(1, rows)), json={'remark': 'patched'}))
+    results['POST /accounts/<id>/usage:increment'] = bench(lambda: client.post(
+        '/accounts/{}/usage:increment'.format(rng.randint(1, rows))))
+    results['POST /accounts/checkout'] = bench(lambda: client.post('/accounts/checkout', json={}))
+    return results
+
+
+def worker(port, deadline, operations, latencies, errors, lock):
+    """持续发送请求直到 deadline，使用一个 keep-alive 连接"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    local = {}
+    local_errors = {}
+    while time.perf_counter() < deadline:
+        name, method, path, body = random.choice(operations)()
+        headers = {'Accept-Encoding': 'gzip'}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            ok = response.status < 500
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            ok = False
+        elapsed = time.perf_counter() - start
+        if ok:
+            local.setdefault(name, []).append(elapsed)
+        else:
+            local_errors[name] = local_errors.get(name, 0) + 1
+    conn.close()
+    with lock:
+        for name, values in local.items():
+            latencies.setdefault(name, []).extend(values)
+        for name, count in local_errors.items():
+            errors[name] = errors.get(name, 0) + count
+
+
+def run_phase(port, readers, writers, duration, rows):
+    rng = random.Random()
+    read_ops = [
+        lambda: ('GET ' + READ_PAGE, 'GET', READ_PAGE, None),
+        lambda: ('GET /accounts/search', 'GET', '/accounts/search?q=user{}&limit=50'.format(rng.randint(1, 99)), None),
+    ]
+    write_ops = [
+        lambda: ('PATCH /accounts/<id>', 'PATCH', '/accounts/{}'.format(rng.randint(1, rows)), {'remark': 'load'}),
+        lambda: ('POST /accounts/<id>/usage:increment', 'POST',
+                 '/accounts/{}/usage:increment'.format(rng.randint(1, rows)), None),
+    ]
+    latencies, errors, lock = {}, {}, threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=worker, args=(port, deadline, read_ops, latencies, errors, lock))
+               for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=(port, deadline, write_ops, latencies, errors, lock))
+                for _ in range(writers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    result = {name: summarize(values, elapsed, errors.get(name, 0)) for name, values in sorted(latencies.items())}
+    total = sum(len(values) for values in latencies.values())
+    result['total'] = {
+        'requests': total,
+        'errors': sum(errors.values()),
+        'requests_per_sec': round(total / elapsed, 1),
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000, help='seeded accounts (1k - 1M)')
+    parser.add_argument('--iterations', type=int, default=100, help='test client iterations per route')
+    parser.add_argument('--max-seconds', type=float, default=2.0, help='test client time budget per route')
+    parser.add_argument('--full-scan-limit', type=int, default=200000,
+                        help='skip whole-table routes above this many rows')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per concurrent phase')
+    parser.add_argument('--threads', type=int, default=8, help='server worker threads')
+    parser.add_argument('-o', '--output')
+    args = parser.parse_args()
+
+    db = setup_db()
+    seed_seconds = seed(db, args.rows)
+    app = import_app().app
+
+    results = {'test_client': bench_test_client(app, db.get_revision(), args.rows, args)}
+    server, port = start_server(app, args.threads)
+    try:
+        results['server_read_only'] = run_phase(port, args.readers, 0, args.duration, args.rows)
+        results['server_mixed'] = run_phase(port, args.readers, args.writers, args.duration, args.rows)
+    finally:
+        server.close()
+
+    params = {
+        'rows': args.rows,
+        'seed_seconds': round(seed_seconds, 2),
+        'readers': args.readers,
+        'writers': args.writers,
+        'duration': args.duration,
+        'server_threads': args.threads,
+    }
+    report('api', params, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""连接保持基准：对比 Flask（waitress）与 ASGI 入口在大量 SSE 长连接占用时还能否正常处理请求
+
+每种模式、每个长连接数各启动一个新的服务器子进程：先打开 N 个 /accounts/events 连接，
+统计在 2 秒内收到首个事件（retry）的连接数，再用若干 keep-alive 客户端并发请求 GET /accounts?limit=50，
+记录延迟、吞吐和超时数。
+
+用法: python bench/bench_async.py [--rows 10000] [--holds 0,8,64,512] [--clients 16] [--duration 5] [--threads 8] [-o result.json]
+"""
+import argparse
+import http.client
+import os
+import select
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from common import SERVER_DIR, free_port, report, seed, setup_db, summarize
+
+LOAD_PATH = '/accounts?limit=50'
+REQUEST_TIMEOUT = 5
+
+
+def start(mode, port, threads):
+    env = dict(os.environ, ACCOUNTS_MAX_SUBSCRIBERS='100000', ACCOUNTS_ASGI_MAX_SUBSCRIBERS='100000')
+    if mode == 'flask':
+        command = [sys.executable, 'main.py', '--port', str(port), '--threads', str(threads)]
+    else:
+        command = [sys.executable, 'asgi.py', '--port', str(port)]
+    process = subprocess.Popen(command, cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/accounts?limit=1')
+            conn.getresponse().read()
+            conn.close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("{} server did not start".format(mode))
+
+
+def open_streams(port, count):
+    """打开 count 个 SSE 连接，返回 (sockets, 2 秒内收到首个事件的连接数)"""
+    streams = []
+    for _ in range(count):
+        try:
+            s = socket.create_connection(('127.0.0.1', port), timeout=2)
+            s.sendall(b'GET /accounts/events HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n')
+            streams.append(s)
+        except OSError:
+            break
+    held = 0
+    received = {s: b'' for s in streams}
+    deadline = time.time() + 2
+    while received and time.time() < deadline:
+        readable, _, _ = select.select(list(received), [], [], max(0, deadline - time.time()))
+        for s in readable:
+            try:
+                data = s.recv(4096)
+            except OSError:
+                data = b''
+            received[s] += data
+            if b'retry' in received[s]:
+                held += 1
+                del received[s]
+            elif not data:
+                del received[s]
+    return streams, held
+
+
+def load_client(port, deadline, latencies, errors, lock):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=REQUEST_TIMEOUT)
+    local = []
+    failed = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request('GET', LOAD_PATH, headers={'Accept-Encoding': 'gzip'})
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                local.append(time.perf_counter() - start)
+            else:
+                failed += 1
+        except OSError:
+            # 超时或连接被拒绝，重新建立连接
+            failed += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=REQUEST_TIMEOUT)
+    conn.close()
+    with lock:
+        latencies.extend(local)
+        errors.append(failed)
+
+
+def run_load(port, clients, duration):
+    latencies, errors, lock = [], [], threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=load_client, args=(port, deadline, latencies, errors, lock)) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, time.perf_counter() - start, sum(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--holds', default='0,8,64,512', help='comma separated numbers of open SSE connections')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--threads', type=int, default=8, help='waitress worker threads for the Flask mode')
+    parser.add_argument('--modes', default='flask,asgi')
+    parser.add_argument('-o', '--output')
+    args = parser.parse_args()
+
+    db = setup_db()
+    seed(db, args.rows)
+    holds = [int(n) for n in args.holds.split(',')]
+
+    results = {}
+    for mode in args.modes.split(','):
+        results[mode] = {}
+        for hold in holds:
+            port = free_port()
+            process = start(mode, port, args.threads)
+            try:
+                streams, held = open_streams(port, hold)
+                result = run_load(port, args.clients, args.duration)
+                result['streams_held'] = held
+                results[mode][str(hold)] = result
+                for s in streams:
+                    s.close()
+            finally:
+                process.kill()
+                process.wait()
+            print('{} hold={}: held={} ops/s={} p99={} errors={}'.format(
+                mode, hold, held, result['ops_per_sec'], result['p99_ms'], result['errors']), file=sys.stderr)
+
+    params = {
+        'rows': args.rows,
+        'clients': args.clients,
+        'duration': args.duration,
+        'flask_threads': args.threads,
+        'path': LOAD_PATH,
+        'request_timeout': REQUEST_TIMEOUT,
+    }
+    report('async_connections', params, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
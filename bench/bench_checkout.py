@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""并发 checkout 基准：多个客户端同时租用账户，确认没有账户被重复分配
+
+用法: python bench/bench_checkout.py [--clients 16] [--checkouts 50] [--threads 8]
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server')
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def checkout(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())['account']
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+
+
+def run(url, clients, checkouts, body):
+    results = []
+    lock = threading.Lock()
+
+    def client():
+        got = [checkout(url, body) for _ in range(checkouts)]
+        with lock:
+            results.extend(got)
+
+    workers = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--checkouts', type=int, default=50, help='checkouts per client')
+    parser.add_argument('--threads', type=int, default=8, help='server worker threads')
+    args = parser.parse_args()
+    total = args.clients * args.checkouts
+
+    os.environ['ACCOUNTS_DB'] = os.path.join(tempfile.mkdtemp(), 'checkout.db')
+    sys.path.insert(0, SERVER_DIR)
+    import db
+    import main as server_main
+    from waitress.server import create_server
+
+    logging.getLogger('waitress').setLevel(logging.ERROR)
+    db.ensure_db()
+    # 账户数与租用次数相同：每次租用都必须拿到不同的账户
+    db.add_accounts([{
+        'username': 'user{}@example.com'.format(i), 'password': 'password', 'gpt_status': True,
+        'midjourney_status': True, 'custom_platforms': {}, 'usage_count': 0,
+        'added_time': '2024-01-01 00:00:00', 'remark': '',
+    } for i in range(total)])
+
+    port = free_port()
+    server = create_server(server_main.app, host='127.0.0.1', port=port, threads=args.threads)
+    threading.Thread(target=server.run, daemon=True).start()
+    url = 'http://127.0.0.1:{}/accounts/checkout'.format(port)
+
+    leased, elapsed = run(url, args.clients, args.checkouts, {'lease_seconds': 600, 'owner': 'bench'})
+    ids = [a['id'] for a in leased if a]
+    # 所有账户都已被租用，再租必须失败
+    extra = checkout(url, {'lease_seconds': 600})
+
+    # 不租用时测试计数不丢失：总 usage_count 增量应等于 checkout 次数
+    for account_id in ids:
+        db.release_account(account_id)
+    before = sum(a['usage_count'] for a in db.get_accounts())
+    plain, plain_elapsed = run(url, args.clients, args.checkouts, {})
+    after = sum(a['usage_count'] for a in db.get_accounts())
+    server.close()
+
+    print(json.dumps({
+        'clients': args.clients,
+        'server_threads': args.threads,
+        'leased_checkouts': len(ids),
+        'leased_checkouts_per_sec': round(total / elapsed, 1),
+        'duplicate_allocations': len(ids) - len(set(ids)),
+        'checkout_after_exhausted': extra,
+        'plain_checkouts_per_sec': round(total / plain_elapsed, 1),
+        'plain_checkouts': sum(1 for a in plain if a),
+        'lost_usage_increments': total - (after - before),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
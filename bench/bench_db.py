@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""db 层微基准：在临时库中造数据后逐个测量 server/db.py 的读写函数
+
+用法: python bench/bench_db.py [--rows 10000] [--iterations 200] [--max-seconds 2] [-o result.json]
+"""
+import argparse
+import itertools
+import random
+
+from common import make_account, report, seed, setup_db, timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000, help='seeded accounts (1k - 1M)')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--max-seconds', type=float, default=2.0, help='time budget per benchmark')
+    parser.add_argument('--full-scan-limit', type=int, default=200000,
+                        help='skip whole-table reads above this many rows')
+    parser.add_argument('-o', '--output')
+    args = parser.parse_args()
+
+    db = setup_db()
+    seed_seconds = seed(db, args.rows)
+    rng = random.Random(1)
+    ids = lambda: rng.randint(1, args.rows)
+    middle = db.query_accounts({}, 'id', args.rows // 2 or 1)[1]
+    revision = db.get_revision()
+    # 供删除使用的额外账户，删除不会影响其他基准的数据量
+    spare = iter(db.add_accounts([make_account(args.rows + i) for i in range(args.iterations + 10)]))
+    counter = itertools.count(args.rows * 2)
+
+    def bench(fn):
+        return timed(fn, args.iterations, args.max_seconds)
+
+    results = {}
+    results['get_revision'] = bench(db.get_revision)
+    if args.rows <= args.full_scan_limit:
+        results['get_accounts'] = bench(db.get_accounts)
+        results['iter_accounts'] = bench(lambda: sum(1 for _ in db.iter_accounts()))
+        results['get_changes_full'] = bench(lambda: db.get_changes(0))
+    results['query_accounts_first_page'] = bench(lambda: db.query_accounts({}, 'id', 100))
+    results['query_accounts_middle_page'] = bench(lambda: db.query_accounts({}, 'id', 100, middle))
+    results['query_accounts_availability'] = bench(lambda: db.query_accounts({}, 'availability', 100))
+    results['query_accounts_filtered'] = bench(lambda: db.query_accounts(
+        {'gpt_status': True, 'midjourney_status': True, 'max_usage': 3}, 'usage', 100))
+    results['query_accounts_username_prefix'] = bench(lambda: db.query_accounts({'username_prefix': 'user12'}, 'username', 100))
+    results['query_accounts_platform'] = bench(lambda: db.query_accounts({'platform': 'claude'}, 'id', 100))
+    results['search_accounts'] = bench(lambda: db.search_accounts('user12', 50))
+    results['get_changes_recent'] = bench(lambda: db.get_changes(revision))
+    results['add_account'] = bench(lambda: db.add_account(make_account(next(counter))))
+    results['add_accounts_100'] = bench(lambda: db.add_accounts([make_account(next(counter)) for _ in range(100)]))
+    results['update_account'] = bench(lambda: db.update_account(ids(), make_account(next(counter))))
+    results['patch_account'] = bench(lambda: db.patch_account(ids(), {'remark': 'patched', 'usage_count': 1}))
+    results['update_accounts_100'] = bench(lambda: db.update_accounts([(ids(), {'remark': 'bulk'}) for _ in range(100)]))
+    results['increment_usage'] = bench(lambda: db.increment_usage(ids()))
+    results['checkout_release'] = bench(lambda: db.release_account(
+        db.checkout_account({}, lease_seconds=60, owner='bench')['id'], 'bench'))
+    results['delete_account'] = timed(lambda: db.delete_account(next(spare)), args.iterations, args.max_seconds, warmup=0)
+
+    report('db', {'rows': args.rows, 'seed_seconds': round(seed_seconds, 2), 'iterations': args.iterations}, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
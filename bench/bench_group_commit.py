@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""组提交基准：多个客户端并发写入，对比每个请求各自提交与写线程合并提交的吞吐量
+
+用法: python bench/bench_group_commit.py [--clients 16] [--duration 5] [--threads 16] [--synchronous NORMAL] [-o result.json]
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+
+from common import import_app, make_account, report, seed, setup_db, start_server, summarize
+
+ROWS = 10000
+
+
+def writer_client(port, deadline, latencies, errors, lock):
+    """交替发送 POST /accounts、PATCH 和 usage:increment，使用一个 keep-alive 连接"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    rng = random.Random()
+    local = []
+    failed = 0
+    while time.perf_counter() < deadline:
+        choice = rng.randrange(3)
+        if choice == 0:
+            method, path, body = 'POST', '/accounts', make_account(rng.randint(ROWS, 10 ** 9))
+        elif choice == 1:
+            method, path, body = 'PATCH', '/accounts/{}'.format(rng.randint(1, ROWS)), {'remark': 'group'}
+        else:
+            method, path, body = 'POST', '/accounts/{}/usage:increment'.format(rng.randint(1, ROWS)), {}
+        start = time.perf_counter()
+        conn.request(method, path, body=json.dumps(body), headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        if response.status == 200:
+            local.append(time.perf_counter() - start)
+        else:
+            failed += 1
+    conn.close()
+    with lock:
+        latencies.extend(local)
+        errors.append(failed)
+
+
+def run(port, clients, duration):
+    latencies, errors, lock = [], [], threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=writer_client, args=(port, deadline, latencies, errors, lock)) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, time.perf_counter() - start, sum(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per mode')
+    parser.add_argument('--threads', type=int, default=16, help='server worker threads')
+    parser.add_argument('--synchronous', default='NORMAL', choices=('OFF', 'NORMAL', 'FULL'),
+                        help='PRAGMA synchronous; FULL fsyncs on every commit')
+    parser.add_argument('--max-wait-ms', type=float, default=None, help='override the writer linger time')
+    parser.add_argument('-o', '--output')
+    args = parser.parse_args()
+
+    db = setup_db()
+    import pool
+    # 已建立的连接关闭后按新的 PRAGMA 重新建立
+    pool.pool.pragmas = tuple((name, args.synchronous if name == 'synchronous' else value) for name, value in pool.PRAGMAS)
+    pool.close_all()
+    seed(db, ROWS)
+    app = import_app().app
+    from writer import writer
+    if args.max_wait_ms is not None:
+        writer.max_wait = args.max_wait_ms / 1000
+
+    server, port = start_server(app, args.threads)
+    results = {}
+    try:
+        writer.enabled = False
+        results['commit_per_request'] = run(port, args.clients, args.duration)
+        writer.enabled = True
+        results['group_commit'] = run(port, args.clients, args.duration)
+    finally:
+        server.close()
+    results['group_commit']['batches'] = writer.batches
+    results['group_commit']['mean_batch_size'] = round(writer.mutations / writer.batches, 2) if writer.batches else None
+    results['speedup'] = round(results['group_commit']['ops_per_sec'] / results['commit_per_request']['ops_per_sec'], 2)
+
+    params = {
+        'clients': args.clients,
+        'duration': args.duration,
+        'server_threads': args.threads,
+        'synchronous': args.synchronous,
+        'max_batch': writer.max_batch,
+        'max_wait_ms': writer.max_wait * 1000,
+    }
+    report('group_commit', params, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""维护任务基准：删除部分账户制造空闲页后逐个执行维护任务，记录每个任务的报告，
+以及任务执行期间并发写入（PATCH 单个账户）的延迟，用来确认维护不会长时间阻塞写入
+
+用法: python bench/bench_maintenance.py [--rows 100000] [--delete 0.5] [--writers 2] [-o result.json]
+"""
+import argparse
+import random
+import tempfile
+import threading
+import time
+
+from common import report, seed, setup_db, summarize
+
+
+def writer_loop(db, rows, stop, latencies):
+    rng = random.Random()
+    while not stop.is_set():
+        start = time.perf_counter()
+        db.patch_account(rng.randint(1, rows), {'remark': 'maintenance'})
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.001)
+
+
+def with_writers(db, rows, writers, fn):
+    """在 writers 个线程持续写入的同时执行 fn，返回 (fn 的结果, 写入延迟统计)"""
+    stop = threading.Event()
+    latencies = []
+    threads = [threading.Thread(target=writer_loop, args=(db, rows, stop, latencies)) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(0.2)
+    try:
+        result = fn()
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    stats = summarize(latencies)
+    stats['max_ms'] = round(max(latencies) * 1000, 3) if latencies else None
+    return result, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--delete', type=float, default=0.5, help='fraction of accounts deleted before vacuuming')
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('-o', '--output')
+    args = parser.parse_args()
+
+    db = setup_db()
+    seed(db, args.rows)
+    # 只删除 id 较大的一部分，写入线程修改的账户始终存在
+    keep = int(args.rows * (1 - args.delete))
+    db.delete_accounts(list(range(keep + 1, args.rows + 1)))
+
+    from maintenance import backup, checkpoint, incremental_vacuum, optimize, run_task
+    backup_dir = tempfile.mkdtemp()
+
+    results = {}
+    _, results['baseline_writes'] = with_writers(db, keep, args.writers, lambda: time.sleep(2))
+    for name, fn in (('optimize', optimize), ('vacuum', incremental_vacuum), ('checkpoint', checkpoint),
+                     ('backup', lambda: backup(backup_dir))):
+        task_report, writes = with_writers(db, keep, args.writers, lambda: run_task(name, fn))
+        results[name] = {'report': task_report, 'writes_during_task': writes}
+
+    params = {'rows': args.rows, 'deleted': args.rows - keep, 'writers': args.writers}
+    report('maintenance', params, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
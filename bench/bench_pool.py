@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""连接池前后对比：并发写入线程下每秒完成的 add_account 次数
+
+用法: python bench/bench_pool.py [--writers 8] [--ops 200]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server')
+SCHEMA_FILE = os.path.join(SERVER_DIR, '..', 'database', 'schema.sql')
+
+SAMPLE = {
+    'username': 'bench@example.com',
+    'password': 'password123',
+    'gpt_status': True,
+    'midjourney_status': False,
+    'custom_platforms': {},
+    'usage_count': 0,
+    'added_time': '2024-01-01 00:00:00',
+    'remark': '',
+}
+
+
+def legacy_add_account(db_file, data):
+    # 旧实现：每次调用都新建连接，回滚日志模式下每次提交都 fsync
+    conn = sqlite3.connect(db_file)
+    c = conn.cursor()
+    c.execute("INSERT INTO accounts (username, password, gpt_status, midjourney_status, custom_platforms, usage_count, added_time, remark) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+              (data['username'], data['password'], data['gpt_status'], data['midjourney_status'], json.dumps(data['custom_platforms']), data['usage_count'], data['added_time'], data['remark']))
+    conn.commit()
+    conn.close()
+
+
+def legacy_get_accounts(db_file):
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute("SELECT * FROM accounts").fetchall()
+    accounts = [{
+        'id': row[0],
+        'username': row[1],
+        'password': row[2],
+        'gpt_status': bool(row[3]),
+        'midjourney_status': bool(row[4]),
+        'custom_platforms': json.loads(row[5]),
+        'usage_count': row[6],
+        'added_time': row[7],
+        'remark': row[8]
+    } for row in rows]
+    conn.close()
+    return accounts
+
+
+def run_threads(writers, ops, func):
+    def worker():
+        for _ in range(ops):
+            func()
+
+    threads = [threading.Thread(target=worker) for _ in range(writers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return writers * ops / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    legacy_db = os.path.join(tmp, 'legacy.db')
+    pooled_db = os.path.join(tmp, 'pooled.db')
+
+    with open(SCHEMA_FILE) as f:
+        schema = f.read()
+    conn = sqlite3.connect(legacy_db)
+    conn.executescript(schema)
+    conn.close()
+
+    legacy = run_threads(args.writers, args.ops, lambda: legacy_add_account(legacy_db, SAMPLE))
+    legacy_read = run_threads(args.writers, 20, lambda: legacy_get_accounts(legacy_db))
+
+    # db 模块在导入时读取 ACCOUNTS_DB
+    os.environ['ACCOUNTS_DB'] = pooled_db
+    os.environ['ACCOUNTS_LOG_PAYLOADS'] = '0'  # 屏蔽写入时的日志输出，避免影响计时
+    sys.path.insert(0, SERVER_DIR)
+    import db
+    db.init_db()
+
+    pooled = run_threads(args.writers, args.ops, lambda: db.add_account(SAMPLE))
+    pooled_read = run_threads(args.writers, 20, db.get_accounts)
+
+    print(json.dumps({
+        'writers': args.writers,
+        'ops_per_writer': args.ops,
+        'legacy_writes_per_sec': round(legacy, 1),
+        'pooled_writes_per_sec': round(pooled, 1),
+        'write_speedup': round(pooled / legacy, 2),
+        'legacy_reads_per_sec': round(legacy_read, 1),
+        'pooled_reads_per_sec': round(pooled_read, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""启动耗时基准：每次测量都启动新的子进程
+
+- 服务端（main.py / asgi.py）：导入入口模块的耗时，以及从启动进程到第一个 GET /accounts 成功返回的耗时
+- 客户端：在子进程中导入 ui、创建并显示主窗口、等到表格中出现第一行，分别记录距进程启动的耗时；
+  cold 为没有本地缓存的首次启动，warm 为已有本地缓存的再次启动
+  （无显示环境下可设置 QT_QPA_PLATFORM=offscreen）
+
+结果取各次的中位数。测量的是源码运行：子进程把字节码缓存写到临时目录，正式计时前先运行一次，
+与打包后的程序一样不需要编译源码；打包后的程序可以设置 ACCOUNTS_STARTUP_PROFILE 得到分阶段数据。
+
+用法: python bench/bench_startup.py [--rows 10000] [--runs 5] [-o result.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import SERVER_DIR, free_port, report, seed, setup_db
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client')
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared')
+ENTRY_POINTS = {'flask': 'main', 'asgi': 'asgi'}
+PYCACHE_DIR = tempfile.mkdtemp()
+
+
+def child_env(**extra):
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=PYCACHE_DIR, ACCOUNTS_MAINTENANCE='0', **extra)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def wait_ready(port, process, timeout=30):
+    """轮询直到 GET /accounts 返回 200，返回距 process 启动的秒数"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited with code {}".format(process.returncode))
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/accounts?limit=1')
+            status = conn.getresponse().status
+            conn.close()
+            if status == 200:
+                return time.perf_counter()
+        except OSError:
+            pass
+        time.sleep(0.002)
+    raise RuntimeError("server did not become ready")
+
+
+def start_server(mode, port):
+    """启动服务端子进程，返回 (process, 启动到可以处理请求的秒数)"""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, ENTRY_POINTS[mode] + '.py', '--port', str(port)], cwd=SERVER_DIR,
+                               env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = wait_ready(port, process)
+    except Exception:
+        process.kill()
+        raise
+    return process, ready - start
+
+
+def server_runs(mode, runs):
+    imports, ready = [], []
+    # 第一次运行只用来写入字节码缓存
+    for i in range(runs + 1):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import ' + ENTRY_POINTS[mode]], cwd=SERVER_DIR, check=True,
+                       env=child_env(), stdout=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        process, seconds = start_server(mode, free_port())
+        process.kill()
+        process.wait()
+        if i:
+            imports.append(elapsed)
+            ready.append(seconds)
+    return {'import_ms': median_ms(imports), 'ready_ms': median_ms(ready)}
+
+
+def client_run(url):
+    """子进程：记录导入、显示窗口和出现第一行的时间点（距 Python 开始执行本脚本），输出一行 JSON"""
+    start = time.perf_counter()
+    sys.path[:0] = [CLIENT_DIR, SHARED_DIR]
+    from PyQt5 import QtCore, QtWidgets
+    import ui
+    import api
+    api.BASE_URL = url
+    result = {'import_ms': (time.perf_counter() - start) * 1000}
+    app = QtWidgets.QApplication([])
+    window = ui.AccountManagementApp()
+    window.show()
+    app.processEvents()
+    result['shown_ms'] = (time.perf_counter() - start) * 1000
+
+    def poll():
+        if 'first_rows_ms' not in result and window.account_model.rowCount() > 0:
+            result['first_rows_ms'] = (time.perf_counter() - start) * 1000
+        # 等第一次同步完成（本地缓存已写入）再退出，下一次启动才是真正的热启动
+        if 'first_rows_ms' in result and window.loaded_once:
+            print(json.dumps(result))
+            sys.stdout.flush()
+            # 后台线程可能仍在同步，直接退出
+            os._exit(0)
+
+    timer = QtCore.QTimer()
+    timer.timeout.connect(poll)
+    timer.start(2)
+    QtCore.QTimer.singleShot(60000, lambda: os._exit(1))
+    app.exec_()
+
+
+def client_runs(url, runs, store):
+    """store 为 None 时每次使用新的本地缓存文件（冷启动）"""
+    samples = []
+    for _ in range(runs):
+        path = store or os.path.join(tempfile.mkdtemp(), 'client_cache.db')
+        env = child_env(ACCOUNTS_CLIENT_DB=path)
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, __file__, '--client-run', url], env=env, capture_output=True,
+                             text=True, check=True).stdout
+        wall = time.perf_counter() - start
+        sample = json.loads(out.strip().splitlines()[-1])
+        sample['process_ms'] = wall * 1000
+        samples.append(sample)
+    return {name: round(statistics.median(s[name] for s in samples), 1)
+            for name in ('import_ms', 'shown_ms', 'first_rows_ms', 'process_ms')}
+
+
+def median_ms(values):
+    return round(statistics.median(values) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--skip-client', action='store_true')
+    parser.add_argument('--client-run', metavar='URL', help=argparse.SUPPRESS)
+    parser.add_argument('-o', '--output')
+    args = parser.parse_args()
+
+    if args.client_run:
+        client_run(args.client_run)
+        return
+
+    db = setup_db()
+    seed(db, args.rows)
+
+    results = {}
+    for mode in ENTRY_POINTS:
+        results[mode] = server_runs(mode, args.runs)
+        print('{}: {}'.format(mode, results[mode]), file=sys.stderr)
+
+    if not args.skip_client:
+        port = free_port()
+        process, _ = start_server('asgi', port)
+        try:
+            url = 'http://127.0.0.1:{}'.format(port)
+            client_runs(url, 1, None)
+            results['client_cold'] = client_runs(url, args.runs, None)
+            # 先运行一次写入本地缓存，之后的启动都从本地缓存开始
+            store = os.path.join(tempfile.mkdtemp(), 'client_cache.db')
+            client_runs(url, 1, store)
+            results['client_warm'] = client_runs(url, args.runs, store)
+        finally:
+            process.kill()
+            process.wait()
+        print('client: cold {} warm {}'.format(results['client_cold'], results['client_warm']), file=sys.stderr)
+
+    report('startup', {'rows': args.rows, 'runs': args.runs}, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""账户表格渲染基准：旧的 QTableWidget + 单元格控件 与 QAbstractTableModel + 委托 对比
+
+每种组合在单独的子进程中运行，报告首次渲染耗时和 RSS 增量（MB）。
+无显示环境下可设置 QT_QPA_PLATFORM=offscreen。
+
+用法: python bench/bench_table_model.py [--rows 1000,10000,100000] [--legacy-max 10000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client')
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_accounts(n):
+    return [{
+        'id': i,
+        'username': 'user{}@example.com'.format(i),
+        'password': 'password{}'.format(i),
+        'gpt_status': i % 2 == 0,
+        'midjourney_status': i % 3 == 0,
+        'custom_platforms': {},
+        'usage_count': i % 5,
+        'added_time': '2024-01-01 00:00:00',
+        'remark': '',
+    } for i in range(1, n + 1)]
+
+
+def render_legacy(app, accounts):
+    # 旧实现：每行两个 LED 控件（这里用同尺寸的空 QWidget 代替）、三个按钮
+    from PyQt5 import QtWidgets, QtGui
+    from models import calculate_time_diff
+
+    table = QtWidgets.QTableWidget()
+    table.setColumnCount(9)
+    table.resize(1024, 768)
+    table.show()
+    table.setRowCount(len(accounts))
+    for row, account in enumerate(accounts):
+        table.setItem(row, 0, QtWidgets.QTableWidgetItem(account['username']))
+        table.setItem(row, 1, QtWidgets.QTableWidgetItem(account['password']))
+        for column, key in ((2, 'gpt_status'), (3, 'midjourney_status')):
+            led = QtWidgets.QWidget()
+            led.setFixedSize(20, 20)
+            led.setProperty('state', account[key])
+            table.setCellWidget(row, column, led)
+        usage_count_item = QtWidgets.QTableWidgetItem(str(account['usage_count']))
+        usage_count_item.setBackground(QtGui.QColor('red') if account['usage_count'] >= 3 else QtGui.QColor('green'))
+        table.setItem(row, 4, usage_count_item)
+        table.setItem(row, 5, QtWidgets.QTableWidgetItem(calculate_time_diff(account['added_time'])))
+        for column, text in ((6, 'Edit Remark'), (7, 'Edit'), (8, 'Delete')):
+            table.setCellWidget(row, column, QtWidgets.QPushButton(text))
+    app.processEvents()
+    return table
+
+
+def render_model(app, accounts):
+    from PyQt5 import QtWidgets
+    from models import AccountTableModel, LedDelegate, ButtonDelegate
+
+    model = AccountTableModel()
+    view = QtWidgets.QTableView()
+    view.setModel(model)
+    view.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+    for column in (2, 3):
+        view.setItemDelegateForColumn(column, LedDelegate(view))
+    for column in (6, 7, 8):
+        view.setItemDelegateForColumn(column, ButtonDelegate(view))
+    view.resize(1024, 768)
+    view.show()
+    model.set_accounts(accounts)
+    app.processEvents()
+    view.model_ref = model
+    return view
+
+
+def run_one(mode, rows):
+    sys.path.insert(0, CLIENT_DIR)
+    from PyQt5 import QtWidgets
+
+    app = QtWidgets.QApplication([])
+    accounts = make_accounts(rows)
+    before = rss_mb()
+    start = time.perf_counter()
+    widget = (render_legacy if mode == 'legacy' else render_model)(app, accounts)
+    elapsed = time.perf_counter() - start
+    result = {'mode': mode, 'rows': rows, 'render_sec': round(elapsed, 3), 'rss_delta_mb': round(rss_mb() - before, 1)}
+
+    if mode == 'model':
+        # 刷新时只修改 1% 的行，测量增量更新耗时
+        changed = [dict(a, usage_count=a['usage_count'] + 1) if a['id'] % 100 == 0 else a for a in accounts]
+        start = time.perf_counter()
+        widget.model_ref.set_accounts(changed)
+        app.processEvents()
+        result['diff_update_sec'] = round(time.perf_counter() - start, 3)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', default='1000,10000,100000')
+    parser.add_argument('--legacy-max', type=int, default=10000, help='legacy widgets above this row count are skipped')
+    parser.add_argument('--run', nargs=2, metavar=('MODE', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(args.run[0], int(args.run[1]))
+        return
+
+    results = []
+    for rows in [int(n) for n in args.rows.split(',')]:
+        for mode in ('legacy', 'model'):
+            if mode == 'legacy' and rows > args.legacy_max:
+                results.append({'mode': mode, 'rows': rows, 'skipped': True})
+                continue
+            out = subprocess.run([sys.executable, __file__, '--run', mode, str(rows)],
+                                 capture_output=True, text=True, check=True).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""列表响应格式基准：账户对象数组（JSON）与紧凑列格式（JSON / MessagePack）对比
+
+对全表（不分页、按 availability 排序）分别记录：
+- 服务端查询加编码耗时、响应体大小（原始 / gzip）
+- 客户端解码耗时（解析响应体，列格式再构造 AccountColumns）
+- 为全部行计算 Added Time 列的耗时（字符串 strptime 与 epoch 整数）
+- 交给表格模型的耗时（set_accounts 与 set_columns，需要 PyQt5，可设置 QT_QPA_PLATFORM=offscreen）
+
+用法: python bench/bench_wire_format.py [--rows 100000] [-o result.json]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+from common import report, seed, setup_db, timed
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client')
+
+
+def encode(fmt):
+    from db import get_revision, query_account_columns, query_accounts
+    from service import encode_columns, encode_json
+    if fmt == 'json':
+        accounts, _ = query_accounts(sort='availability')
+        return encode_json(accounts)
+    columns, platforms, _ = query_account_columns(sort='availability')
+    return encode_columns(columns, platforms, get_revision(), fmt == 'msgpack')
+
+
+def decode(fmt, body):
+    from columns import AccountColumns
+    if fmt == 'json':
+        return json.loads(body)
+    if fmt == 'msgpack':
+        import msgpack
+        return AccountColumns.decode(msgpack.unpackb(body, raw=False))
+    return AccountColumns.decode(json.loads(body))
+
+
+def time_column(fmt, data):
+    from models import calculate_time_diff
+    if fmt == 'json':
+        return lambda: [calculate_time_diff(account['added_time']) for account in data]
+    # 与表格模型相同，经由行视图取值
+    return lambda: [calculate_time_diff(data[row]['added_time']) for row in range(len(data))]
+
+
+def model_load(fmt, data):
+    try:
+        from PyQt5 import QtWidgets
+    except ImportError:
+        return None
+    from models import AccountTableModel
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+    def load():
+        model = AccountTableModel()
+        if fmt == 'json':
+            model.set_accounts(data)
+        else:
+            model.set_columns(data)
+        app.processEvents()
+    return timed(load, iterations=5, max_seconds=5.0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('-o', '--output')
+    args = parser.parse_args()
+
+    db = setup_db()
+    seed(db, args.rows)
+    sys.path.insert(0, CLIENT_DIR)
+    from service import msgpack
+
+    formats = ['json', 'columns'] + (['msgpack'] if msgpack is not None else [])
+    results = {}
+    for fmt in formats:
+        body = encode(fmt)
+        data = decode(fmt, body)
+        assert len(data) == args.rows
+        start = time.perf_counter()
+        compressed = gzip.compress(body, compresslevel=5)
+        gzip_sec = time.perf_counter() - start
+        results[fmt] = {
+            'bytes': len(body),
+            'gzip_bytes': len(compressed),
+            'gzip_ms': round(gzip_sec * 1000, 1),
+            'server_encode': timed(lambda: encode(fmt), iterations=5, max_seconds=5.0),
+            'client_decode': timed(lambda: decode(fmt, body), iterations=5, max_seconds=5.0),
+            'client_decode_gzip': timed(lambda: decode(fmt, gzip.decompress(compressed)), iterations=5, max_seconds=5.0),
+            'time_column_all_rows': timed(time_column(fmt, data), iterations=5, max_seconds=5.0),
+            'model_load': model_load(fmt, data),
+        }
+        print('{}: {} bytes ({} gzip), decode p50 {} ms'.format(
+            fmt, len(body), len(compressed), results[fmt]['client_decode']['p50_ms']), file=sys.stderr)
+    if msgpack is None:
+        results['msgpack'] = {'skipped': 'msgpack not installed'}
+
+    report('wire_format', {'rows': args.rows, 'sort': 'availability'}, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
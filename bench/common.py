@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""基准测试公用函数：临时数据库、造数据、计时统计和 JSON 报告"""
+import json
+import os
+import platform
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server')
+
+
+def setup_db(path=None):
+    """指向临时数据库并导入 db 模块（必须在导入任何 server 模块之前调用）"""
+    os.environ['ACCOUNTS_DB'] = path or os.path.join(tempfile.mkdtemp(), 'bench.db')
+    # 关闭请求体日志，避免 stdout 写入影响计时
+    os.environ['ACCOUNTS_LOG_PAYLOADS'] = '0'
+    sys.path.insert(0, SERVER_DIR)
+    import db
+    db.init_db()
+    return db
+
+
+def import_app():
+    import main
+    return main
+
+
+def make_account(i):
+    return {
+        'username': 'user{}@example.com'.format(i),
+        'password': 'password{}'.format(i),
+        'gpt_status': i % 3 != 0,
+        'midjourney_status': i % 2 == 0,
+        'custom_platforms': {'claude': i % 4 == 0} if i % 10 == 0 else {},
+        'usage_count': i % 7,
+        'added_time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(1700000000 + i * 60)),
+        'remark': 'batch {} seeded'.format(i % 100),
+    }
+
+
+def seed(db, rows, chunk=10000):
+    """写入 rows 个账户，返回耗时（秒）"""
+    start = time.perf_counter()
+    for first in range(0, rows, chunk):
+        db.add_accounts([make_account(i) for i in range(first, min(first + chunk, rows))])
+    return time.perf_counter() - start
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def summarize(latencies, elapsed=None, errors=0):
+    """latencies 为秒；返回毫秒的 p50/p95/p99 和每秒操作数"""
+    values = sorted(latencies)
+    total = elapsed if elapsed is not None else sum(values)
+    result = {'count': len(values), 'errors': errors}
+    for name, p in (('p50_ms', 50), ('p95_ms', 95), ('p99_ms', 99)):
+        value = percentile(values, p)
+        result[name] = round(value * 1000, 3) if value is not None else None
+    result['mean_ms'] = round(sum(values) / len(values) * 1000, 3) if values else None
+    result['ops_per_sec'] = round(len(values) / total, 1) if total else None
+    return result
+
+
+def timed(fn, iterations=200, max_seconds=2.0, warmup=1):
+    """重复调用 fn，最多 iterations 次或 max_seconds 秒（至少 3 次），返回统计结果"""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    deadline = time.perf_counter() + max_seconds
+    while len(latencies) < iterations and (len(latencies) < 3 or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def start_server(app, threads):
+    """在后台线程用 waitress 启动应用，返回 (server, port)"""
+    import logging
+    from waitress.server import create_server
+
+    # 客户端数多于线程数时 waitress 会不断输出队列深度警告
+    logging.getLogger('waitress').setLevel(logging.ERROR)
+    port = free_port()
+    server = create_server(app, host='127.0.0.1', port=port, threads=threads)
+    threading.Thread(target=server.run, daemon=True).start()
+    return server, port
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(name, params, results, output=None):
+    """输出 JSON 报告；指定 output 时同时写入文件，便于用 bench/compare.py 对比"""
+    data = {
+        'benchmark': name,
+        'meta': {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+        },
+        'params': params,
+        'results': results,
+    }
+    text = json.dumps(data, indent=2)
+    print(text)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    return data
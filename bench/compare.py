@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""对比两次基准测试的 JSON 报告（bench_db.py / bench_api.py 等的 -o 输出）
+
+用法: python bench/compare.py before.json after.json [--threshold 10]
+"""
+import argparse
+import json
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'ops_per_sec', 'requests_per_sec')
+# 这些指标越大越好，其余（延迟）越小越好
+HIGHER_IS_BETTER = ('ops_per_sec', 'requests_per_sec')
+
+
+def flatten(results, prefix=''):
+    """把嵌套的结果展开为 {'阶段/名称': {指标: 值}}"""
+    rows = {}
+    for name, value in results.items():
+        if not isinstance(value, dict):
+            continue
+        key = prefix + name
+        metrics = {m: value[m] for m in METRICS if isinstance(value.get(m), (int, float))}
+        if metrics:
+            rows[key] = metrics
+        else:
+            rows.update(flatten(value, key + '/'))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10.0, help='percent change reported as a regression')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    old, new = flatten(before['results']), flatten(after['results'])
+
+    print('{} ({}) -> {} ({})'.format(args.before, before['meta'].get('commit'), args.after, after['meta'].get('commit')))
+    regressions = 0
+    for key in sorted(set(old) & set(new)):
+        for metric in METRICS:
+            a, b = old[key].get(metric), new[key].get(metric)
+            if a is None or b is None or not a:
+                continue
+            change = (b - a) / a * 100
+            worse = change < -args.threshold if metric in HIGHER_IS_BETTER else change > args.threshold
+            regressions += worse
+            print('{:<60} {:<16} {:>12.3f} {:>12.3f} {:>+8.1f}%{}'.format(
+                key, metric, a, b, change, '  REGRESSION' if worse else ''))
+    for key in sorted(set(old) ^ set(new)):
+        print('{:<60} only in {}'.format(key, 'before' if key in old else 'after'))
+    print('{} regression(s) over {}%'.format(regressions, args.threshold))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Flask 接口压测：确认每个请求只执行一次数据库操作，并测量不同工作线程数下的吞吐量
+
+用法: python bench/load_test.py [--threads 1,2,4,8] [--clients 16] [--requests 100] [--rows 500]
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server')
+
+SAMPLE = {
+    'username': 'load@example.com',
+    'password': 'password123',
+    'gpt_status': True,
+    'midjourney_status': False,
+    'custom_platforms': {},
+    'usage_count': 0,
+    'added_time': '2024-01-01 00:00:00',
+    'remark': '',
+}
+
+
+def count_calls(module, name, counter):
+    original = getattr(module, name)
+
+    def wrapper(*args, **kwargs):
+        counter[name] = counter.get(name, 0) + 1
+        return original(*args, **kwargs)
+
+    setattr(module, name, wrapper)
+
+
+def check_single_execution(main):
+    # 每个路由各请求一次，统计实际调用 db 函数的次数
+    import service
+    counter = {}
+    # 列表查询在 service.load_account_list 中执行
+    count_calls(service, 'query_accounts', counter)
+    for name in ('add_account', 'update_account', 'delete_account'):
+        count_calls(main, name, counter)
+    client = main.app.test_client()
+    client.post('/accounts', json=SAMPLE)
+    account_id = client.get('/accounts').get_json()[-1]['id']
+    client.put('/accounts/{}'.format(account_id), json=SAMPLE)
+    client.delete('/accounts/{}'.format(account_id))
+    return dict(counter)
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def measure(main, threads, clients, requests_per_client):
+    from waitress.server import create_server
+
+    # 客户端数多于线程数时 waitress 会不断输出队列深度警告
+    logging.getLogger('waitress').setLevel(logging.ERROR)
+
+    port = free_port()
+    server = create_server(main.app, host='127.0.0.1', port=port, threads=threads)
+    t = threading.Thread(target=server.run, daemon=True)
+    t.start()
+    url = 'http://127.0.0.1:{}/accounts'.format(port)
+    urllib.request.urlopen(url).read()
+
+    errors = []
+
+    def client():
+        for _ in range(requests_per_client):
+            try:
+                urllib.request.urlopen(url).read()
+            except Exception as e:
+                errors.append(str(e))
+
+    workers = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    server.close()
+    return {
+        'threads': threads,
+        'requests_per_sec': round(clients * requests_per_client / elapsed, 1),
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', default='1,2,4,8')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ['ACCOUNTS_DB'] = os.path.join(tempfile.mkdtemp(), 'load.db')
+    os.environ['ACCOUNTS_LOG_PAYLOADS'] = '0'
+    sys.path.insert(0, SERVER_DIR)
+    import db
+    import main as server_main
+
+    db.ensure_db()
+    for _ in range(args.rows):
+        db.add_account(SAMPLE)
+
+    calls = check_single_execution(server_main)
+    results = [measure(server_main, int(n), args.clients, args.requests) for n in args.threads.split(',')]
+    print(json.dumps({
+        'db_calls_per_route': calls,
+        'rows': args.rows,
+        'clients': args.clients,
+        'throughput': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,10 +5,10 @@ block_cipher = None
 
 a = Analysis(
     ['client/main.py'],  # 确保路径正确
-    pathex=['./client'],  # 确保路径正确
+    pathex=['./client', './shared'],  # 确保路径正确；shared 中为客户端和服务端共用的模块
     binaries=[],
     datas=[],
-    hiddenimports=['PyQt5'],
+    hiddenimports=['PyQt5', 'requests'],  # requests 在 api.get_session() 中才导入
     hookspath=[],
     runtime_hooks=[],
     excludes=[],
@@ -28,7 +28,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,  # UPX 压缩的 DLL 每次启动都要解压，明显拖慢冷启动
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,  # 设置为 False 以隐藏控制台窗口
@@ -39,7 +39,7 @@ coll = COLLECT(
     a.zipfiles,
     a.datas,
     strip=False,
-    upx=True,
+    upx=False,
     upx_exclude=[],
     name='client',
 )
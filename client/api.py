@@ -1,23 +1,265 @@
-import requests
+import logging
+import threading
+import time
+from columns import AccountColumns
+
+try:
+    import msgpack
+except ImportError:
+    # 未安装 msgpack 时请求 JSON 形式的列格式
+    msgpack = None
 
 BASE_URL = 'http://1.tcp.cpolar.cn:20272'
 
-def get_accounts():
-    response = requests.get(f'{BASE_URL}/accounts')
+# 每次请求的耗时记录为 DEBUG 日志，默认不输出
+log = logging.getLogger(__name__)
+
+# 连接/读取超时（秒），避免隧道卡住时工作线程永久挂起
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# 失败重试次数与退避系数（第 n 次重试前等待 backoff * 2^(n-1) 秒）
+RETRIES = 3
+BACKOFF = 0.5
+
+POOL_SIZE = 8
+
+# requests（连同 urllib3、charset_normalizer 等）的导入占客户端导入时间的一大半，
+# 由后台线程在第一次请求时导入并创建会话，界面不必等待
+_session = None
+_session_lock = threading.Lock()
+
+class OfflineError(ConnectionError):
+    """建立连接失败时抛出（重试耗尽后），此时请求还没有发出，写操作可以保存到本地稍后重发
+
+    连接建立之后的失败（连接被重置、读取中断等）服务端可能已经执行了请求，
+    不转换为 OfflineError，原样抛出 requests 的异常，调用方不应自动重发写操作。
+    """
+
+def _never_sent(error):
+    """requests 的 ConnectionError 是否发生在连接阶段（请求一定没有发出）"""
+    import requests
+    from urllib3.exceptions import NewConnectionError
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    # 经过 urllib3 重试时原因包在 MaxRetryError.reason 中
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, NewConnectionError)
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                session = requests.Session()
+                _mount(session)
+                _session = session
+    return _session
+
+def configure(connect_timeout=None, read_timeout=None, retries=None, backoff=None, pool_size=None):
+    """调整超时、重试和连接池大小；会话已创建时重新挂载连接适配器"""
+    global CONNECT_TIMEOUT, READ_TIMEOUT, RETRIES, BACKOFF, POOL_SIZE
+    if connect_timeout is not None:
+        CONNECT_TIMEOUT = connect_timeout
+    if read_timeout is not None:
+        READ_TIMEOUT = read_timeout
+    if retries is not None:
+        RETRIES = retries
+    if backoff is not None:
+        BACKOFF = backoff
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+    if _session is not None:
+        _mount(_session)
+
+def _mount(session):
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    # POST 和 PATCH 只在连接建立失败时重试：POST 不是幂等的；PATCH 已提交但响应丢失时，
+    # 带着同一个 If-Match 重发会得到一个并不存在的 409 冲突
+    retry = Retry(total=RETRIES, connect=RETRIES, read=RETRIES, status=RETRIES, backoff_factor=BACKOFF,
+                  status_forcelist=(502, 503, 504), allowed_methods=frozenset(['GET', 'PUT', 'DELETE', 'HEAD']),
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+# 每个接口的调用耗时统计：name -> {'count', 'total', 'max', 'last'}（毫秒）
+latency_stats = {}
+_stats_lock = threading.Lock()
+
+def _request(method, path, **kwargs):
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    start = time.perf_counter()
+    status = 'error'
+    session = get_session()
+    import requests
+    try:
+        response = session.request(method, f'{BASE_URL}{path}', **kwargs)
+        status = response.status_code
+        return response
+    except requests.ConnectionError as e:
+        if _never_sent(e):
+            raise OfflineError(str(e)) from e
+        raise
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        name = f'{method} {path.split("?")[0]}'
+        with _stats_lock:
+            stats = latency_stats.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0})
+            stats['count'] += 1
+            stats['total'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            stats['last'] = elapsed
+        log.debug("%s -> %s in %.0f ms", name, status, elapsed)
+
+def latency_report():
+    """返回各接口的调用次数、平均/最大/最近一次耗时（毫秒）"""
+    with _stats_lock:
+        return {name: {'count': s['count'], 'avg_ms': round(s['total'] / s['count'], 1),
+                       'max_ms': round(s['max'], 1), 'last_ms': round(s['last'], 1)}
+                for name, s in latency_stats.items()}
+
+PAGE_SIZE = 500
+
+# GET /accounts 的紧凑列格式（见 columns.AccountColumns）
+COLUMNS_MIMETYPE = 'application/vnd.accounts.columns+json'
+COLUMNS_MSGPACK_MIMETYPE = 'application/vnd.accounts.columns+msgpack'
+
+# 查询参数 -> (ETag, accounts, next_cursor)，用于 If-None-Match 条件请求
+_page_cache = {}
+PAGE_CACHE_SIZE = 256
+
+def _decode_columns(response):
+    content_type = response.headers.get('Content-Type', '')
+    if msgpack is not None and content_type.startswith(COLUMNS_MSGPACK_MIMETYPE):
+        return AccountColumns.decode(msgpack.unpackb(response.content, raw=False))
+    if not content_type.startswith(COLUMNS_MIMETYPE):
+        # 旧版本服务端忽略 Accept，返回的是账户数组
+        raise ValueError("server does not support the columnar format")
+    return AccountColumns.decode(response.json())
+
+def get_accounts_page(limit=PAGE_SIZE, cursor=None, sort='availability', compact=False, **filters):
+    """获取一页账户，返回 (accounts, next_cursor)，next_cursor 为 None 表示没有下一页
+
+    compact 为真时请求列格式，accounts 为 AccountColumns；limit 为 None 时一次返回全部。
+    """
+    params = {'sort': sort}
+    if limit is not None:
+        params['limit'] = limit
+    if cursor:
+        params['cursor'] = cursor
+    params.update({k: v for k, v in filters.items() if v is not None})
+    key = (compact,) + tuple(sorted(params.items()))
+    headers = {}
+    if compact:
+        headers['Accept'] = COLUMNS_MSGPACK_MIMETYPE + ', ' + COLUMNS_MIMETYPE if msgpack is not None else COLUMNS_MIMETYPE
+    cached = _page_cache.get(key)
+    if cached:
+        headers['If-None-Match'] = cached[0]
+    response = _request('GET', '/accounts', params=params, headers=headers)
+    if response.status_code == 304 and cached:
+        # 数据未变化，复用上次的结果
+        return cached[1], cached[2]
+    # 错误响应不能进入 ETag 缓存
+    response.raise_for_status()
+    accounts = _decode_columns(response) if compact else response.json()
+    next_cursor = response.headers.get('X-Next-Cursor') or None
+    etag = response.headers.get('ETag')
+    if etag:
+        if len(_page_cache) >= PAGE_CACHE_SIZE:
+            _page_cache.clear()
+        _page_cache[key] = (etag, accounts, next_cursor)
+    return accounts, next_cursor
+
+def get_accounts(sort='availability', compact=False, **filters):
+    """按服务端排序逐页获取全部账户；compact 为真时返回拼接后的 AccountColumns"""
+    accounts, cursor = get_accounts_page(sort=sort, compact=compact, **filters)
+    pages = [accounts]
+    while cursor:
+        page, cursor = get_accounts_page(cursor=cursor, sort=sort, compact=compact, **filters)
+        pages.append(page)
+    if compact:
+        return AccountColumns.concat(pages)
+    # 不修改缓存中的列表
+    return [account for page in pages for account in page]
+
+def get_account_columns(sort='availability', **filters):
+    """一次请求取全部账户的列格式（AccountColumns），用于冷启动时的全量加载"""
+    return get_accounts_page(limit=None, sort=sort, compact=True, **filters)[0]
+
+def get_changes(since):
+    """获取版本号 since 之后的增量：{'revision', 'accounts', 'deleted'}"""
+    response = _request('GET', '/accounts/changes', params={'since': since})
     return response.json()
 
+def search_accounts(query, limit=100):
+    """按用户名/备注搜索，只返回匹配的账户"""
+    response = _request('GET', '/accounts/search', params={'q': query, 'limit': limit})
+    return response.json()
+
+def checkout_account(lease_seconds=0, owner=None, **filters):
+    """取出当前最优的账户并将 usage_count 加一，没有可用账户时返回 None"""
+    body = {'lease_seconds': lease_seconds, 'owner': owner}
+    body.update({k: v for k, v in filters.items() if v is not None})
+    response = _request('POST', '/accounts/checkout', json=body)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()['account']
+
+def release_account(account_id, owner=None):
+    response = _request('POST', f'/accounts/{account_id}/release', json={'owner': owner})
+    return response.json().get('status') == 'success'
+
 def create_account(account):
-    response = requests.post(f'{BASE_URL}/accounts', json=account)
+    response = _request('POST', '/accounts', json=account)
     return response.json()
 
 def update_account(account_id, account):
-    response = requests.put(f'{BASE_URL}/accounts/{account_id}', json=account)
+    response = _request('PUT', f'/accounts/{account_id}', json=account)
+    return response.json()
+
+def patch_account(account_id, changes, revision=None):
+    """只发送修改过的字段；给出 revision 时服务端发现账户已被他人修改会返回 status 为 conflict"""
+    headers = {'If-Match': f'"{revision}"'} if revision is not None else {}
+    response = _request('PATCH', f'/accounts/{account_id}', json=changes, headers=headers)
     return response.json()
 
+def increment_usage(account_id, amount=1):
+    response = _request('POST', f'/accounts/{account_id}/usage:increment', json={'amount': amount})
+    return response.json().get('usage_count')
+
 def delete_account(account_id):
-    response = requests.delete(f'{BASE_URL}/accounts/{account_id}')
+    response = _request('DELETE', f'/accounts/{account_id}')
     return response.json()
 
+BULK_SIZE = 1000
+
+def _bulk(method, items):
+    """分批发送批量请求，合并逐项结果（index 为在 items 中的位置）"""
+    results = []
+    for start in range(0, len(items), BULK_SIZE):
+        response = _request(method, '/accounts/bulk', json=items[start:start + BULK_SIZE])
+        # 整个请求被拒绝（如请求体不是数组）时没有 results
+        response.raise_for_status()
+        for result in response.json()['results']:
+            result['index'] += start
+            results.append(result)
+    return results
+
+def create_accounts(accounts):
+    return _bulk('POST', accounts)
+
+def update_accounts(changes):
+    """changes 为 [{'id': ..., 需要修改的字段...}]"""
+    return _bulk('PATCH', changes)
+
+def delete_accounts(account_ids):
+    return _bulk('DELETE', account_ids)
+
 def verify_admin(username, password):
-    response = requests.post(f'{BASE_URL}/verify_admin', json={'username': username, 'password': password})
+    response = _request('POST', '/verify_admin', json={'username': username, 'password': password})
     return response.json().get('status') == 'success'
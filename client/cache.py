@@ -0,0 +1,66 @@
+import threading
+from api import get_changes
+
+class AccountCache:
+    """本地账户缓存，只拉取服务端版本号之后的增量"""
+
+    def __init__(self, store=None):
+        self.store = store
+        self.accounts_by_id = {}
+        self.revision = 0
+        self.lock = threading.Lock()
+        self.loaded = store is None
+
+    def load(self):
+        """读取上次保存的数据，之后只需同步增量；读取大量账户较慢，由后台线程在第一次同步前调用"""
+        with self.lock:
+            if not self.loaded:
+                self.accounts_by_id, self.revision = self.store.load()
+                self.loaded = True
+
+    def sync(self):
+        """拉取并应用增量，返回本次是否有变化"""
+        self.load()
+        changes = get_changes(self.revision)
+        if changes['revision'] < self.revision:
+            # 服务端版本号比本地还旧（数据库被替换或恢复），丢弃本地缓存重新全量同步
+            self.reset()
+            changes = get_changes(0)
+        return self.apply(changes)
+
+    def reset(self):
+        with self.lock:
+            self.accounts_by_id = {}
+            self.revision = 0
+            if self.store is not None:
+                self.store.reset()
+
+    def load_columns(self, columns):
+        """用列格式的全量数据（api.get_account_columns）替换本地缓存，之后从它所在的版本同步增量"""
+        accounts = columns.accounts()
+        with self.lock:
+            self.accounts_by_id = {account['id']: account for account in accounts}
+            self.revision = columns.revision
+            if self.store is not None:
+                self.store.reset()
+                self.store.save(accounts, [], columns.revision)
+
+    def apply(self, changes):
+        """应用一批增量（来自 /accounts/changes 或 SSE 事件），返回是否有变化"""
+        changed = False
+        with self.lock:
+            for account in changes['accounts']:
+                self.accounts_by_id[account['id']] = account
+                changed = True
+            for account_id in changes['deleted']:
+                if self.accounts_by_id.pop(account_id, None) is not None:
+                    changed = True
+            revision = max(self.revision, changes['revision'])
+            if self.store is not None and (changed or revision != self.revision):
+                self.store.save(changes['accounts'], changes['deleted'], revision)
+            self.revision = revision
+        return changed
+
+    def accounts(self):
+        with self.lock:
+            return list(self.accounts_by_id.values())
@@ -0,0 +1,88 @@
+import base64
+import time
+
+class AccountColumns:
+    """GET /accounts 列格式的解码结果
+
+    数据按列保存：布尔列保持服务端打包的位图，added_time 保持 epoch 秒，
+    表格模型按 (行号, 列名) 直接取值，只有需要完整账户时（编辑、写入本地缓存）才构造字典。
+    """
+
+    def __init__(self, names, values, bits=(), platforms=(), revision=0):
+        self.names = list(names)
+        self.columns = dict(zip(self.names, values))
+        self.bits = set(bits)
+        self.ids = self.columns['id']
+        # 行号 -> {平台: 状态}，只保存有自定义平台的行
+        self.platforms = {}
+        for row, platform, status in platforms:
+            self.platforms.setdefault(row, {})[platform] = bool(status)
+        self.revision = revision
+
+    @classmethod
+    def decode(cls, payload):
+        """解码 JSON 或 MessagePack 解析后的响应体；JSON 中的位图为 base64 字符串"""
+        bits = [name for name, encoding in payload['encodings'].items() if encoding == 'bits']
+        values = []
+        for name, column in zip(payload['columns'], payload['values']):
+            if name in bits and isinstance(column, str):
+                column = base64.b64decode(column)
+            values.append(column)
+        return cls(payload['columns'], values, bits, payload['platforms'], payload['revision'])
+
+    @classmethod
+    def concat(cls, parts):
+        """按顺序拼接多页结果；版本号取最小值，从这里开始同步增量不会漏掉任何一页之后的修改"""
+        parts = list(parts)
+        first = parts[0]
+        values = []
+        for name in first.names:
+            if name in first.bits:
+                combined, count = 0, 0
+                for part in parts:
+                    combined |= int.from_bytes(part.columns[name], 'little') << count
+                    count += len(part)
+                values.append(combined.to_bytes((count + 7) // 8, 'little'))
+            else:
+                values.append([value for part in parts for value in part.columns[name]])
+        platforms, offset = [], 0
+        for part in parts:
+            platforms.extend((offset + row, platform, status) for row, items in part.platforms.items()
+                             for platform, status in items.items())
+            offset += len(part)
+        return cls(first.names, values, first.bits, platforms, min(part.revision for part in parts))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, row):
+        return _Row(self, row)
+
+    def value(self, row, name):
+        if name in self.bits:
+            return bool(self.columns[name][row >> 3] >> (row & 7) & 1)
+        if name == 'custom_platforms':
+            return dict(self.platforms.get(row, {}))
+        return self.columns[name][row]
+
+    def account(self, row):
+        """构造第 row 行的账户字典，格式与 JSON 列表中的账户相同"""
+        account = {name: self.value(row, name) for name in self.names}
+        account['custom_platforms'] = self.value(row, 'custom_platforms')
+        if account.get('added_time') is not None:
+            account['added_time'] = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(account['added_time']))
+        return account
+
+    def accounts(self):
+        return [self.account(row) for row in range(len(self))]
+
+class _Row:
+    """某一行的只读视图，可以像账户字典一样按列名取值"""
+    __slots__ = ('columns', 'row')
+
+    def __init__(self, columns, row):
+        self.columns = columns
+        self.row = row
+
+    def __getitem__(self, name):
+        return self.columns.value(self.row, name)
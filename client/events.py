@@ -0,0 +1,69 @@
+import json
+import threading
+import api
+
+class EventStream:
+    """订阅服务端 /accounts/events，断线后带 Last-Event-ID 重连；连接不上时 connected 为 False，由调用方退回轮询"""
+
+    def __init__(self, get_revision, on_changes, read_timeout=45, max_backoff=60):
+        self.get_revision = get_revision
+        self.on_changes = on_changes
+        self.read_timeout = read_timeout  # 需大于服务端心跳间隔
+        self.max_backoff = max_backoff
+        self.connected = False
+        self._stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        backoff = 1
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+                backoff = 1  # 服务端正常结束连接，立即重连
+            except Exception as e:
+                print(f"Event stream disconnected: {e}")
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            finally:
+                self.connected = False
+
+    def _listen(self):
+        headers = {'Accept': 'text/event-stream', 'Last-Event-ID': str(self.get_revision())}
+        response = api.get_session().get(f'{api.BASE_URL}/accounts/events', headers=headers, stream=True,
+                                   timeout=(api.CONNECT_TIMEOUT, self.read_timeout))
+        with response:
+            response.raise_for_status()
+            self.connected = True
+            event, data = None, []
+            for line in self._lines(response):
+                if self._stopped.is_set():
+                    return
+                if line == '':
+                    # 空行表示一个事件结束
+                    if event == 'changes' and data:
+                        self.on_changes(json.loads('\n'.join(data)))
+                    event, data = None, []
+                elif line.startswith(':'):
+                    continue  # 心跳
+                else:
+                    field, _, value = line.partition(':')
+                    value = value[1:] if value.startswith(' ') else value
+                    if field == 'event':
+                        event = value
+                    elif field == 'data':
+                        data.append(value)
+
+    @staticmethod
+    def _lines(response):
+        # chunk_size=None 时数据一到就返回，iter_lines 默认要攒够 512 字节才会产出
+        buffer = b''
+        for chunk in response.iter_content(chunk_size=None):
+            buffer += chunk
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                yield line.rstrip(b'\r').decode('utf-8')
@@ -1,8 +1,18 @@
+import os
+import sys
+# 启动分析模块与服务端共用，位于仓库根目录的 shared 中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'shared'))
+import startup
+startup.begin()
 from ui import AccountManagementApp
 from PyQt5 import QtWidgets
+startup.mark('imports')
 
 if __name__ == "__main__":
     app = QtWidgets.QApplication([])
+    startup.mark('QApplication')
     mainWin = AccountManagementApp()
+    startup.mark('window built')
     mainWin.show()
+    startup.mark('window shown')
     app.exec_()
@@ -0,0 +1,188 @@
+from PyQt5 import QtWidgets, QtGui, QtCore
+from columns import AccountColumns
+from datetime import datetime
+import time
+
+COLUMNS = ['Username', 'Password', 'GPT', 'Midjourney', 'Usage Count', 'Added Time', 'Remark', 'Actions', 'Delete']
+
+USERNAME_COLUMN, PASSWORD_COLUMN, GPT_COLUMN, MIDJOURNEY_COLUMN, USAGE_COLUMN, TIME_COLUMN, REMARK_COLUMN, EDIT_COLUMN, DELETE_COLUMN = range(len(COLUMNS))
+
+LED_COLUMNS = {GPT_COLUMN: 'gpt_status', MIDJOURNEY_COLUMN: 'midjourney_status'}
+
+BUTTON_COLUMNS = {REMARK_COLUMN: 'Edit Remark', EDIT_COLUMN: 'Edit', DELETE_COLUMN: 'Delete'}
+
+# 自定义数据角色：LED 列的状态
+StatusRole = QtCore.Qt.UserRole + 1
+
+def calculate_time_diff(added_time):
+    if added_time is None:
+        return ''
+    if isinstance(added_time, int):
+        # 列格式中为 epoch 秒（把本地时间字符串按 UTC 换算），当前时间同样换算后相减，不需要解析字符串
+        now = time.time()
+        days, seconds = divmod(int(now) + time.localtime(now).tm_gmtoff - added_time, 86400)
+        return f"{days} days, {seconds // 3600} hours"
+    added_time_dt = datetime.strptime(added_time, '%Y-%m-%d %H:%M:%S')
+    now = datetime.now()
+    diff = now - added_time_dt
+    return f"{diff.days} days, {diff.seconds // 3600} hours"
+
+class AccountTableModel(QtCore.QAbstractTableModel):
+    """账户表格模型：只为可见单元格提供数据，刷新时按 id 对比增量更新行"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._accounts = []
+        self._rows = {}  # id -> 行号
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._accounts)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return COLUMNS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        account = self._accounts[index.row()]
+        column = index.column()
+        if role == QtCore.Qt.DisplayRole:
+            if column == USERNAME_COLUMN:
+                return account['username']
+            if column == PASSWORD_COLUMN:
+                return account['password']
+            if column == USAGE_COLUMN:
+                return str(account['usage_count'])
+            if column == TIME_COLUMN:
+                return calculate_time_diff(account['added_time'])
+            if column in BUTTON_COLUMNS:
+                return BUTTON_COLUMNS[column]
+        elif role == StatusRole and column in LED_COLUMNS:
+            return bool(account[LED_COLUMNS[column]])
+        elif role == QtCore.Qt.BackgroundRole and column == USAGE_COLUMN:
+            return QtGui.QColor('red') if account['usage_count'] >= 3 else QtGui.QColor('green')
+        return None
+
+    def account(self, row):
+        if isinstance(self._accounts, AccountColumns):
+            return self._accounts.account(row)
+        return self._accounts[row]
+
+    def set_columns(self, columns):
+        """整体替换为列格式的数据（AccountColumns），单元格直接从列中取值，不逐行比较"""
+        self.beginResetModel()
+        self._accounts = columns
+        self._rows = {}
+        self.endResetModel()
+
+    def set_accounts(self, accounts):
+        """用新的有序列表替换当前数据：删除、修改、新增和重排分别发出最小的模型信号"""
+        if isinstance(self._accounts, AccountColumns):
+            # 当前为列格式的数据，无法按行对比，整体重置
+            self.beginResetModel()
+            self._accounts = list(accounts)
+            self._reindex()
+            self.endResetModel()
+            return
+        new_by_id = {account['id']: account for account in accounts}
+
+        # 删除：从下往上按连续区间移除，避免逐行重建
+        removed = sorted((row for i, row in self._rows.items() if i not in new_by_id), reverse=True)
+        i = 0
+        while i < len(removed):
+            last = first = removed[i]
+            i += 1
+            while i < len(removed) and removed[i] == first - 1:
+                first = removed[i]
+                i += 1
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            del self._accounts[first:last + 1]
+            self.endRemoveRows()
+        if removed:
+            self._reindex()
+
+        # 修改：原地替换，只通知内容变化的行
+        for row, account in enumerate(self._accounts):
+            new = new_by_id[account['id']]
+            if new != account:
+                self._accounts[row] = new
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1))
+
+        # 新增：追加到末尾
+        added = [account for account in accounts if account['id'] not in self._rows]
+        if added:
+            start = len(self._accounts)
+            self.beginInsertRows(QtCore.QModelIndex(), start, start + len(added) - 1)
+            self._accounts.extend(added)
+            self.endInsertRows()
+            self._reindex()
+
+        # 重排：顺序不同时调整布局并迁移持久索引（保留选中和当前行）
+        if [a['id'] for a in self._accounts] != [a['id'] for a in accounts]:
+            self.layoutAboutToBeChanged.emit()
+            old_ids = [account['id'] for account in self._accounts]
+            self._accounts = list(accounts)
+            self._reindex()
+            old_indexes = self.persistentIndexList()
+            new_indexes = [self.index(self._rows[old_ids[index.row()]], index.column()) for index in old_indexes]
+            self.changePersistentIndexList(old_indexes, new_indexes)
+            self.layoutChanged.emit()
+
+    def _reindex(self):
+        self._rows = {account['id']: row for row, account in enumerate(self._accounts)}
+
+class LedDelegate(QtWidgets.QStyledItemDelegate):
+    """绘制状态指示灯，颜色与原来的 Led 控件一致"""
+
+    def __init__(self, parent=None, size=20, on_color=QtGui.QColor('red'), off_color=QtGui.QColor('green')):
+        super().__init__(parent)
+        self.size = size
+        self.on_color = on_color
+        self.off_color = off_color
+
+    def paint(self, painter, option, index):
+        state = index.data(StatusRole)
+        painter.save()
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setBrush(QtGui.QBrush(self.on_color if state else self.off_color))
+        painter.setPen(QtCore.Qt.NoPen)
+        rect = option.rect
+        painter.drawEllipse(rect.x(), rect.y() + (rect.height() - self.size) // 2, self.size, self.size)
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        return QtCore.QSize(self.size, self.size)
+
+class ButtonDelegate(QtWidgets.QStyledItemDelegate):
+    """绘制按钮外观并处理点击，代替每行一个 QPushButton"""
+    clicked = QtCore.pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pressed = None
+
+    def paint(self, painter, option, index):
+        button = QtWidgets.QStyleOptionButton()
+        button.rect = option.rect.adjusted(2, 2, -2, -2)
+        button.text = index.data()
+        button.state = QtWidgets.QStyle.State_Enabled
+        if self._pressed == (index.row(), index.column()):
+            button.state |= QtWidgets.QStyle.State_Sunken
+        style = option.widget.style() if option.widget else QtWidgets.QApplication.style()
+        style.drawControl(QtWidgets.QStyle.CE_PushButton, button, painter, option.widget)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QtCore.QEvent.MouseButtonPress and event.button() == QtCore.Qt.LeftButton:
+            self._pressed = (index.row(), index.column())
+            return True
+        if event.type() == QtCore.QEvent.MouseButtonRelease and event.button() == QtCore.Qt.LeftButton:
+            pressed, self._pressed = self._pressed, None
+            if pressed == (index.row(), index.column()) and option.rect.contains(event.pos()):
+                self.clicked.emit(index.row())
+            return True
+        return False
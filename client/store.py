@@ -0,0 +1,88 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 本地缓存文件，可通过环境变量 ACCOUNTS_CLIENT_DB 指定
+STORE_FILE = os.environ.get('ACCOUNTS_CLIENT_DB') or os.path.join(os.path.expanduser('~'), '.account_management', 'client_cache.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    args TEXT NOT NULL,
+    created TEXT NOT NULL
+);
+"""
+
+class LocalStore:
+    """客户端本地 SQLite：保存上次同步的账户和版本号，以及离线时未发送的写操作"""
+
+    def __init__(self, path=STORE_FILE, server=''):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        # 换了服务端地址时缓存的账户和版本号不再有效（未发送的写操作保留）
+        if self._meta('server') != server:
+            self.reset()
+            self._set_meta('server', server)
+
+    def _meta(self, name):
+        row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, str(value)))
+
+    def load(self):
+        """返回 (accounts_by_id, revision)"""
+        with self.lock:
+            accounts = {row[0]: json.loads(row[1]) for row in self.conn.execute("SELECT id, data FROM accounts")}
+            return accounts, int(self._meta('revision') or 0)
+
+    def save(self, accounts, deleted, revision):
+        """在一个事务中写入一批增量"""
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO accounts (id, data) VALUES (?, ?)",
+                                      [(a['id'], json.dumps(a, ensure_ascii=False)) for a in accounts])
+                self.conn.executemany("DELETE FROM accounts WHERE id = ?", [(i,) for i in deleted])
+                self._set_meta('revision', revision)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def reset(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM accounts")
+            self.conn.execute("DELETE FROM meta WHERE name = 'revision'")
+
+    def enqueue(self, name, args):
+        """记录一个待发送的写操作：name 为 api 中的函数名，args 为其参数列表"""
+        with self.lock:
+            self.conn.execute("INSERT INTO outbox (name, args, created) VALUES (?, ?, ?)",
+                              (name, json.dumps(list(args), ensure_ascii=False), time.strftime('%Y-%m-%d %H:%M:%S')))
+
+    def outbox(self):
+        """按提交顺序返回 [(seq, name, args)]"""
+        with self.lock:
+            return [(seq, name, json.loads(args)) for seq, name, args in
+                    self.conn.execute("SELECT seq, name, args FROM outbox ORDER BY seq")]
+
+    def dequeue(self, seq):
+        with self.lock:
+            self.conn.execute("DELETE FROM outbox WHERE seq = ?", (seq,))
+
+    def pending(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
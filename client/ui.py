@@ -1,43 +1,54 @@
-from PyQt5 import QtWidgets, QtGui, QtCore
-from api import get_accounts, create_account, update_account, delete_account, verify_admin
-from datetime import datetime
-import threading
+from PyQt5 import QtWidgets, QtCore
+import api
+from api import create_account, create_accounts, patch_account, delete_account, verify_admin, search_accounts, checkout_account, OfflineError
+from cache import AccountCache
+from store import LocalStore
+from events import EventStream
+from worker import CommandWorker
+import startup
+from models import AccountTableModel, LedDelegate, ButtonDelegate, GPT_COLUMN, MIDJOURNEY_COLUMN, REMARK_COLUMN, EDIT_COLUMN, DELETE_COLUMN
+import csv
+import json
 import re
-import time
-
-class Led(QtWidgets.QWidget):
-    def __init__(self, parent=None, size=20, on_color=QtGui.QColor('red'), off_color=QtGui.QColor('green')):
-        super(Led, self).__init__(parent)
-        self.setFixedSize(size, size)
-        self.on_color = on_color
-        self.off_color = off_color
-        self.state = False
-
-    def set_state(self, state):
-        self.state = state
-        self.update()
-
-    def paintEvent(self, event):
-        painter = QtGui.QPainter(self)
-        color = self.on_color if self.state else self.off_color
-        painter.setBrush(QtGui.QBrush(color))
-        painter.setPen(QtCore.Qt.NoPen)
-        painter.drawEllipse(0, 0, self.width(), self.height())
+
+# 离线时可以保存到本地、恢复连接后按顺序重发的写操作
+OFFLINE_COMMANDS = {
+    'create_account': create_account,
+    'create_accounts': create_accounts,
+    'patch_account': patch_account,
+    'delete_account': delete_account,
+}
 
 class AccountManagementApp(QtWidgets.QWidget):
-    accounts_loaded = QtCore.pyqtSignal(list)
+    # 列表以 object 传递：声明为 list 时跨线程发送会把每个账户字典转换成 QVariantMap，10 万行需要 1 秒以上
+    accounts_loaded = QtCore.pyqtSignal(object)
+    columns_loaded = QtCore.pyqtSignal(object)
+    search_loaded = QtCore.pyqtSignal(str, object)
     status_message = QtCore.pyqtSignal(str)
-    add_lock = threading.Lock()
-    fetch_lock = threading.Lock()
+    # 后台命令通过信号修改控件状态，控件只在界面线程中被访问
+    widget_enabled = QtCore.pyqtSignal(object, bool)
 
     def __init__(self):
         super().__init__()
         print("Initializing UI")
         self.admin_logged_in = False
-        self.init_ui()
+        self.store = LocalStore(server=api.BASE_URL)
+        self.account_cache = AccountCache(self.store)
+        self.loaded_once = False
+        self.search_query = ''
+        # 所有网络请求都在这一个后台线程中执行，刷新请求会被合并
+        self.worker = CommandWorker()
+        self.event_stream = EventStream(lambda: self.account_cache.revision, self.on_changes)
+        # 先连接信号再构建界面：后台线程在构建界面的同时读取本地数据并开始第一次同步，
+        # 结果通过信号排队，事件循环开始后送达界面线程
         self.accounts_loaded.connect(self.on_accounts_loaded)
+        self.columns_loaded.connect(self.on_columns_loaded)
+        self.search_loaded.connect(self.on_search_loaded)
         self.status_message.connect(self.show_message)
+        self.widget_enabled.connect(self.set_widget_enabled)
+        self.worker.submit(self.load_local_accounts)
         self.refresh_account_list()
+        self.init_ui()
         self.start_auto_refresh()
 
     def init_ui(self):
@@ -78,6 +89,14 @@ class AccountManagementApp(QtWidgets.QWidget):
         self.add_button.clicked.connect(self.add_account)
         self.top_frame.addWidget(self.add_button)
 
+        self.import_button = QtWidgets.QPushButton("Batch Import")
+        self.import_button.clicked.connect(self.import_accounts)
+        self.top_frame.addWidget(self.import_button)
+
+        self.checkout_button = QtWidgets.QPushButton("Check Out")
+        self.checkout_button.clicked.connect(self.checkout_account)
+        self.top_frame.addWidget(self.checkout_button)
+
         self.refresh_button = QtWidgets.QPushButton('Refresh')
         self.refresh_button.clicked.connect(self.refresh_account_list)
         self.top_frame.addWidget(self.refresh_button)
@@ -86,12 +105,31 @@ class AccountManagementApp(QtWidgets.QWidget):
         self.login_button.clicked.connect(self.show_login_dialog)
         self.top_frame.addWidget(self.login_button)
 
+        # 搜索框：停止输入 300ms 后才向服务端发送查询
+        self.search_entry = QtWidgets.QLineEdit()
+        self.search_entry.setPlaceholderText("Search username or remark")
+        self.search_entry.setClearButtonEnabled(True)
+        layout.addWidget(self.search_entry)
+        self.search_timer = QtCore.QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(300)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_entry.textChanged.connect(self.search_timer.start)
+
         # 创建账号表格
-        self.account_table = QtWidgets.QTableWidget()
-        self.account_table.setColumnCount(9)
-        self.account_table.setHorizontalHeaderLabels(['Username', 'Password', 'GPT', 'Midjourney', 'Usage Count', 'Added Time', 'Remark', 'Actions', 'Delete'])
+        self.account_model = AccountTableModel(self)
+        self.account_table = QtWidgets.QTableView()
+        self.account_table.setModel(self.account_model)
+        self.account_table.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)  # 固定行高，避免逐行计算高度
         self.account_table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
         self.account_table.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeToContents)  # 设置用户名列的宽度为内容适应
+        self.account_table.horizontalHeader().setResizeContentsPrecision(200)  # 只按前 200 行计算列宽
+        for column in (GPT_COLUMN, MIDJOURNEY_COLUMN):
+            self.account_table.setItemDelegateForColumn(column, LedDelegate(self.account_table, size=20))
+        for column, handler in ((REMARK_COLUMN, self.edit_remark), (EDIT_COLUMN, self.edit_account), (DELETE_COLUMN, self.delete_account)):
+            delegate = ButtonDelegate(self.account_table)
+            delegate.clicked.connect(lambda row, h=handler: h(self.account_model.account(row)))
+            self.account_table.setItemDelegateForColumn(column, delegate)
         layout.addWidget(self.account_table)
 
         self.setLayout(layout)
@@ -103,13 +141,24 @@ class AccountManagementApp(QtWidgets.QWidget):
         self.move((screen.width() - size.width()) // 2, (screen.height() - size.height()) // 2)
 
     def start_auto_refresh(self):
-        """每10分钟自动刷新一次"""
-        def auto_refresh():
-            while True:
-                time.sleep(600)  # 每10分钟刷新一次
-                self.refresh_account_list()
-
-        threading.Thread(target=auto_refresh, daemon=True).start()
+        """实时推送断开时的兜底：每10分钟自动刷新一次"""
+        self.auto_refresh_timer = QtCore.QTimer(self)
+        self.auto_refresh_timer.setInterval(600 * 1000)
+        self.auto_refresh_timer.timeout.connect(self.auto_refresh)
+        self.auto_refresh_timer.start()
+        # 有离线保存的写操作时每30秒尝试一次，同步成功后重发
+        self.outbox_timer = QtCore.QTimer(self)
+        self.outbox_timer.setInterval(30 * 1000)
+        self.outbox_timer.timeout.connect(self.retry_outbox)
+        self.outbox_timer.start()
+
+    def retry_outbox(self):
+        if self.store.pending():
+            self.refresh_account_list()
+
+    def auto_refresh(self):
+        if not self.event_stream.connected:
+            self.refresh_account_list()
 
     def show_login_dialog(self):
         login_dialog = LoginDialog(self)
@@ -117,31 +166,111 @@ class AccountManagementApp(QtWidgets.QWidget):
             self.admin_logged_in = True
             self.login_button.setStyleSheet("background-color: green; color: white;")
 
+    def load_local_accounts(self):
+        # 在后台线程执行：先显示本地保存的数据，再同步增量
+        self.account_cache.load()
+        startup.mark('local cache loaded')
+        if self.account_cache.accounts_by_id:
+            self.emit_cached_accounts()
+
     def refresh_account_list(self):
-        if not self.fetch_lock.acquire(blocking=False):
-            print("Fetch accounts already in progress")
+        """请求一次同步；已有未执行的刷新时合并为一次，可在任意线程调用"""
+        self.worker.coalesce('refresh', self.sync_accounts)
+
+    def sync_accounts(self):
+        # 在后台线程执行；超时与带退避的重试由 api 中的会话负责
+        try:
+            self.account_cache.load()
+            shown = False
+            if not self.loaded_once and self.account_cache.revision == 0 and not self.search_query:
+                shown = self.load_columns()
+            print("Syncing accounts since revision {}".format(self.account_cache.revision))
+            changed = self.account_cache.sync()
+            # 没有增量时不重建表格
+            if changed or not (self.loaded_once or shown):
+                self.show_accounts()
+            if not self.loaded_once:
+                startup.mark('first sync')
+                # 首次同步完成后再订阅推送，避免重复下载全量数据
+                self.loaded_once = True
+                self.event_stream.start()
+        except Exception as e:
+            print(f"Error in fetching accounts: {e}")
             return
+        if self.store.pending():
+            self.replay_outbox()
 
-        def run():
-            retries = 3
-            while retries > 0:
-                try:
-                    print("Fetching accounts")
-                    accounts = get_accounts()
-                    print(f"Fetched accounts: {accounts}")
-                    for account in accounts:
-                        if 'added_time' not in account:
-                            account['added_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    sorted_accounts = self.sort_accounts(accounts)
-                    self.accounts_loaded.emit(sorted_accounts)
-                    break
-                except Exception as e:
-                    print(f"Error in fetching accounts: {e}")
-                    retries -= 1
-                    time.sleep(1)  # Wait for 1 second before retrying
-            self.fetch_lock.release()
+    def load_columns(self):
+        """冷启动（本地没有缓存）时用列格式一次取全量直接交给表格，再用同一份数据填充本地缓存，
+        之后只同步增量；服务端不支持列格式时返回 False，由增量同步取全量"""
+        try:
+            columns = api.get_account_columns(sort='availability')
+        except ValueError as e:
+            print(f"Columnar load unavailable: {e}")
+            return False
+        # 服务端的 availability 排序与 sort_accounts 的规则相同
+        self.columns_loaded.emit(columns)
+        self.account_cache.load_columns(columns)
+        return True
+
+    def queue_offline(self, name, *args):
+        """服务端不可达时保存写操作，恢复连接后由 replay_outbox 重发"""
+        self.store.enqueue(name, args)
+        self.status_message.emit("Server unreachable. The change was saved and will be sent when the connection is back.")
+
+    def replay_outbox(self):
+        # 在后台线程执行；按保存顺序重发，再次断线时保留剩余的操作
+        sent = failed = 0
+        for seq, name, args in self.store.outbox():
+            try:
+                result = OFFLINE_COMMANDS[name](*args)
+            except OfflineError:
+                break
+            except Exception as e:
+                print(f"Error replaying {name}: {e}")
+                failed += 1
+            else:
+                if isinstance(result, dict) and result.get('status') != 'success':
+                    print(f"Replayed {name} was rejected: {result}")
+                    failed += 1
+                else:
+                    sent += 1
+            self.store.dequeue(seq)
+        if sent or failed:
+            self.refresh_account_list()
+            self.status_message.emit(f"Sent {sent} offline changes, {failed} rejected.")
+
+    def on_changes(self, changes):
+        """推送线程收到增量时调用"""
+        if self.account_cache.apply(changes):
+            self.worker.coalesce('show', self.show_accounts)
+
+    def show_accounts(self):
+        if self.search_query:
+            # 搜索中只刷新匹配结果
+            self.search(self.search_query)
+        else:
+            self.emit_cached_accounts()
+
+    def emit_cached_accounts(self):
+        accounts = self.account_cache.accounts()
+        self.accounts_loaded.emit(self.sort_accounts(accounts))
+
+    def run_search(self):
+        # 清空搜索时 show_accounts 从本地缓存恢复完整列表；执行时读取最新的查询词
+        self.search_query = self.search_entry.text().strip()
+        self.worker.coalesce('show', self.show_accounts)
+
+    def search(self, query):
+        try:
+            self.search_loaded.emit(query, search_accounts(query))
+        except Exception as e:
+            print(f"Error in searching accounts: {e}")
 
-        threading.Thread(target=run).start()
+    def on_search_loaded(self, query, accounts):
+        # 丢弃已过期的查询结果
+        if query == self.search_query:
+            self.account_model.set_accounts(accounts)
 
     def sort_accounts(self, accounts):
         """排序账户列表"""
@@ -162,44 +291,24 @@ class AccountManagementApp(QtWidgets.QWidget):
         return sorted_accounts
 
     def on_accounts_loaded(self, accounts):
-        print("Accounts loaded")
+        print("Accounts loaded: {}".format(len(accounts)))
         try:
-            self.account_table.setRowCount(len(accounts))
-            for row, account in enumerate(accounts):
-                print(f"Processing account: {account}")
-                self.account_table.setItem(row, 0, QtWidgets.QTableWidgetItem(account['username']))
-                self.account_table.setItem(row, 1, QtWidgets.QTableWidgetItem(account['password']))
-                
-                gpt_led = Led(self, size=20)
-                gpt_led.set_state(account['gpt_status'])
-                self.account_table.setCellWidget(row, 2, gpt_led)
-                
-                midjourney_led = Led(self, size=20)
-                midjourney_led.set_state(account['midjourney_status'])
-                self.account_table.setCellWidget(row, 3, midjourney_led)
-                
-                usage_count_item = QtWidgets.QTableWidgetItem(str(account['usage_count']))
-                usage_count_item.setBackground(QtGui.QColor('red') if account['usage_count'] >= 3 else QtGui.QColor('green'))
-                self.account_table.setItem(row, 4, usage_count_item)
-
-                added_time = account.get('added_time', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-                time_diff = self.calculate_time_diff(added_time)
-                self.account_table.setItem(row, 5, QtWidgets.QTableWidgetItem(time_diff))
-                
-                remark_button = QtWidgets.QPushButton('Edit Remark')
-                remark_button.clicked.connect(lambda _, a=account: self.edit_remark(a))
-                self.account_table.setCellWidget(row, 6, remark_button)
-
-                edit_button = QtWidgets.QPushButton('Edit')
-                edit_button.clicked.connect(lambda _, a=account: self.edit_account(a))
-                self.account_table.setCellWidget(row, 7, edit_button)
-
-                delete_button = QtWidgets.QPushButton('Delete')
-                delete_button.clicked.connect(lambda _, a=account: self.delete_account(a))
-                self.account_table.setCellWidget(row, 8, delete_button)
+            self.account_model.set_accounts(accounts)
+            self.first_accounts_shown()
         except Exception as e:
             print(f"Error in loading accounts: {e}")
 
+    def on_columns_loaded(self, columns):
+        print("Accounts loaded: {}".format(len(columns)))
+        if not self.search_query:
+            self.account_model.set_columns(columns)
+            self.first_accounts_shown()
+
+    def first_accounts_shown(self):
+        # 启动分析在表格第一次显示账户时结束（之后的调用不做任何事）
+        startup.mark('first accounts shown')
+        startup.report()
+
     def add_account(self):
         print("Adding account")
         username = self.username_entry.text()
@@ -226,10 +335,6 @@ class AccountManagementApp(QtWidgets.QWidget):
             'remark': self.remark_entry.text()
         }
         
-        if not self.add_lock.acquire(blocking=False):
-            print("Add button is already processing")
-            return
-        
         self.add_button.setEnabled(False)  # Disable the button to prevent multiple clicks
         def run():
             try:
@@ -238,14 +343,63 @@ class AccountManagementApp(QtWidgets.QWidget):
                 print("Request sent to create account")
                 self.refresh_account_list()
                 self.status_message.emit("Account added successfully.")
+            except OfflineError:
+                self.queue_offline('create_account', new_account)
             except Exception as e:
                 print(f"Error: {e}")
                 self.status_message.emit("Failed to add account.")
             finally:
-                self.add_button.setEnabled(True)  # Re-enable the button
-                self.add_lock.release()
+                self.widget_enabled.emit(self.add_button, True)  # Re-enable the button
+
+        self.worker.submit(run)
+
+    def import_accounts(self):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Batch Import', '', 'Accounts (*.csv *.ndjson *.jsonl *.json)')
+        if not path:
+            return
+        try:
+            accounts = load_accounts_file(path)
+        except Exception as e:
+            print(f"Error: {e}")
+            QtWidgets.QMessageBox.warning(self, 'Invalid File', f'Failed to read {path}: {e}')
+            return
+        if not accounts:
+            return
+
+        self.import_button.setEnabled(False)
+        def run():
+            try:
+                results = create_accounts(accounts)
+                failed = [r for r in results if r['status'] != 'success']
+                for r in failed:
+                    print(f"Import failed for item {r['index']}: {r.get('message')}")
+                self.refresh_account_list()
+                self.status_message.emit(f"Imported {len(results) - len(failed)} accounts, {len(failed)} failed.")
+            except OfflineError:
+                self.queue_offline('create_accounts', accounts)
+            except Exception as e:
+                print(f"Error: {e}")
+                self.status_message.emit("Failed to import accounts.")
+            finally:
+                self.widget_enabled.emit(self.import_button, True)
+
+        self.worker.submit(run)
+
+    def checkout_account(self):
+        """由服务端原子地取出最优账户并增加使用次数"""
+        def run():
+            try:
+                account = checkout_account()
+                if account is None:
+                    self.status_message.emit("No account available.")
+                    return
+                self.refresh_account_list()
+                self.status_message.emit(f"Checked out {account['username']} / {account['password']} (usage {account['usage_count']}).")
+            except Exception as e:
+                print(f"Error: {e}")
+                self.status_message.emit("Failed to check out account.")
 
-        threading.Thread(target=run).start()
+        self.worker.submit(run)
 
     def edit_account(self, account):
         print(f"Editing account: {account['username']}")
@@ -253,23 +407,34 @@ class AccountManagementApp(QtWidgets.QWidget):
             dialog = EditAccountDialog(account)
             if dialog.exec_():
                 updated_account = dialog.get_account_data()
-                updated_account['username'] = account['username']  # 添加用户名
-                updated_account.setdefault('custom_platforms', {})
-                updated_account.setdefault('remark', '')
-                def run():
-                    try:
-                        update_account(account['id'], updated_account)
-                        sorted_accounts = self.sort_accounts(get_accounts())
-                        self.accounts_loaded.emit(sorted_accounts)
-                        self.status_message.emit("Account updated successfully.")
-                    except Exception as e:
-                        print(f"Error: {e}")
-                        self.status_message.emit("Failed to update account.")
-                threading.Thread(target=run).start()
+                # 只提交修改过的字段
+                changes = {k: v for k, v in updated_account.items() if account.get(k) != v}
+                if not changes:
+                    return
+                self.submit_changes(account, changes, "Account updated successfully.", "Failed to update account.")
         except Exception as e:
             print(f"Error: {e}")
             self.status_message.emit("Failed to update account.")
 
+    def submit_changes(self, account, changes, success_message, failure_message):
+        """以 PATCH 提交修改，带上行版本号；账户已被他人修改时提示并刷新"""
+        def run():
+            try:
+                result = patch_account(account['id'], changes, account.get('revision'))
+                self.refresh_account_list()
+                if result.get('status') == 'conflict':
+                    self.status_message.emit("The account was modified by someone else. Please review and try again.")
+                elif result.get('status') == 'success':
+                    self.status_message.emit(success_message)
+                else:
+                    self.status_message.emit(failure_message)
+            except OfflineError:
+                self.queue_offline('patch_account', account['id'], changes, account.get('revision'))
+            except Exception as e:
+                print(f"Error: {e}")
+                self.status_message.emit(failure_message)
+        self.worker.submit(run)
+
     def delete_account(self, account):
         print(f"Deleting account: {account['username']}")
         if not self.admin_logged_in:
@@ -286,17 +451,13 @@ class AccountManagementApp(QtWidgets.QWidget):
                     delete_account(account['id'])
                     self.refresh_account_list()
                     self.status_message.emit("Account deleted successfully.")
+                except OfflineError:
+                    self.queue_offline('delete_account', account['id'])
                 except Exception as e:
                     print(f"Error: {e}")
                     self.status_message.emit("Failed to delete account.")
 
-            threading.Thread(target=run).start()
-
-    def calculate_time_diff(self, added_time):
-        added_time_dt = datetime.strptime(added_time, '%Y-%m-%d %H:%M:%S')
-        now = datetime.now()
-        diff = now - added_time_dt
-        return f"{diff.days} days, {diff.seconds // 3600} hours"
+            self.worker.submit(run)
 
     def edit_remark(self, account):
         print(f"Editing remark for account: {account['username']}")
@@ -304,16 +465,7 @@ class AccountManagementApp(QtWidgets.QWidget):
             dialog = EditRemarkDialog(account)
             if dialog.exec_():
                 updated_remark = dialog.get_remark()
-                account['remark'] = updated_remark
-                def run():
-                    try:
-                        update_account(account['id'], account)
-                        self.refresh_account_list()
-                        self.status_message.emit("Remark updated successfully.")
-                    except Exception as e:
-                        print(f"Error: {e}")
-                        self.status_message.emit("Failed to update remark.")
-                threading.Thread(target=run).start()
+                self.submit_changes(account, {'remark': updated_remark}, "Remark updated successfully.", "Failed to update remark.")
         except Exception as e:
             print(f"Error: {e}")
             self.status_message.emit("Failed to update remark.")
@@ -322,9 +474,34 @@ class AccountManagementApp(QtWidgets.QWidget):
     def show_message(self, message):
         QtWidgets.QMessageBox.information(self, 'Status', message)
 
+    @QtCore.pyqtSlot(object, bool)
+    def set_widget_enabled(self, widget, enabled):
+        widget.setEnabled(enabled)
+
+def load_accounts_file(path):
+    """读取批量导入文件：CSV（首行为字段名）、NDJSON 或 JSON 数组"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if path.lower().endswith('.csv'):
+            accounts = []
+            for row in csv.DictReader(f):
+                account = {k: v for k, v in row.items() if k and v not in (None, '')}
+                for key in ('gpt_status', 'midjourney_status'):
+                    if key in account:
+                        account[key] = account[key].strip().lower() in ('1', 'true', 'yes')
+                if 'usage_count' in account:
+                    account['usage_count'] = int(account['usage_count'])
+                accounts.append(account)
+            return accounts
+        if path.lower().endswith('.json'):
+            return json.load(f)
+        return [json.loads(line) for line in f if line.strip()]
+
 class LoginDialog(QtWidgets.QDialog):
+    verified = QtCore.pyqtSignal(bool)
+
     def __init__(self, parent=None):
         super(LoginDialog, self).__init__(parent)
+        self.verified.connect(self.on_verified)
         self.init_ui()
 
     def init_ui(self):
@@ -347,15 +524,21 @@ class LoginDialog(QtWidgets.QDialog):
     def check_credentials(self):
         username = self.username_entry.text()
         password = self.password_entry.text()
+        self.login_button.setEnabled(False)
         def run():
             try:
-                if verify_admin(username, password):
-                    self.accept()
-                else:
-                    self.status_message.emit("Invalid username or password.")
+                self.verified.emit(bool(verify_admin(username, password)))
             except Exception as e:
                 print(f"Error: {e}")
-        threading.Thread(target=run).start()
+                self.verified.emit(False)
+        self.parent().worker.submit(run)
+
+    def on_verified(self, ok):
+        self.login_button.setEnabled(True)
+        if ok:
+            self.accept()
+        else:
+            QtWidgets.QMessageBox.warning(self, 'Login Failed', 'Invalid username or password.')
 
 class EditAccountDialog(QtWidgets.QDialog):
     def __init__(self, account):
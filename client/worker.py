@@ -0,0 +1,55 @@
+import threading
+from collections import OrderedDict, deque
+
+class CommandWorker:
+    """单个后台线程按顺序执行网络请求
+
+    submit() 的命令按提交顺序执行；coalesce() 的任务按 key 去重，只在命令队列清空后执行，
+    同一 key 在执行前多次提交只执行一次（使用最后一次提交的函数）。
+    例如连续五次修改各自请求刷新，只会在五次修改完成后刷新一次。
+    """
+
+    def __init__(self):
+        self._commands = deque()
+        self._idle = OrderedDict()  # key -> fn
+        self._cond = threading.Condition()
+        self._stopped = False
+        self.coalesced = 0  # 被合并掉的任务数
+        self._thread = threading.Thread(target=self._run, name='command-worker', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn):
+        with self._cond:
+            self._commands.append(fn)
+            self._cond.notify()
+
+    def coalesce(self, key, fn):
+        with self._cond:
+            if key in self._idle:
+                self.coalesced += 1
+            self._idle[key] = fn
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _next(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._stopped or self._commands or self._idle)
+            if self._stopped:
+                return None
+            if self._commands:
+                return self._commands.popleft()
+            return self._idle.popitem(last=False)[1]
+
+    def _run(self):
+        while True:
+            fn = self._next()
+            if fn is None:
+                return
+            try:
+                fn()
+            except Exception as e:
+                print(f"Error in background command: {e}")
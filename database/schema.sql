@@ -1,3 +1,6 @@
+-- Latest schema, used to create new databases. Existing databases are upgraded
+-- by server/migrations.py; change both together.
+
 CREATE TABLE IF NOT EXISTS accounts (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     username TEXT NOT NULL,
@@ -7,5 +10,63 @@ CREATE TABLE IF NOT EXISTS accounts (
     custom_platforms TEXT,
     usage_count INTEGER NOT NULL,
     added_time TEXT NOT NULL,
-    remark TEXT
+    remark TEXT,
+    revision INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires INTEGER
 );
+
+CREATE INDEX IF NOT EXISTS idx_accounts_availability ON accounts (
+    (gpt_status AND midjourney_status),
+    (gpt_status OR midjourney_status),
+    usage_count,
+    username,
+    id
+);
+CREATE INDEX IF NOT EXISTS idx_accounts_status ON accounts (gpt_status, midjourney_status, usage_count);
+CREATE INDEX IF NOT EXISTS idx_accounts_usage ON accounts (usage_count, id);
+CREATE INDEX IF NOT EXISTS idx_accounts_username ON accounts (username);
+CREATE INDEX IF NOT EXISTS idx_accounts_added_time ON accounts (added_time);
+CREATE INDEX IF NOT EXISTS idx_accounts_revision ON accounts (revision);
+
+-- Tombstones for deleted accounts, served by the delta sync endpoint
+CREATE TABLE IF NOT EXISTS account_tombstones (
+    id INTEGER PRIMARY KEY,
+    revision INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_account_tombstones_revision ON account_tombstones (revision);
+
+-- Table-wide monotonically increasing revision counter
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO sync_state (name, value) VALUES ('revision', 0);
+
+-- Full-text index over username and remark, kept in sync by the triggers below
+CREATE VIRTUAL TABLE IF NOT EXISTS accounts_fts USING fts5(
+    username,
+    remark,
+    content='accounts',
+    content_rowid='id',
+    prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS accounts_fts_insert AFTER INSERT ON accounts BEGIN
+    INSERT INTO accounts_fts (rowid, username, remark) VALUES (new.id, new.username, new.remark);
+END;
+CREATE TRIGGER IF NOT EXISTS accounts_fts_delete AFTER DELETE ON accounts BEGIN
+    INSERT INTO accounts_fts (accounts_fts, rowid, username, remark) VALUES ('delete', old.id, old.username, old.remark);
+END;
+CREATE TRIGGER IF NOT EXISTS accounts_fts_update AFTER UPDATE OF username, remark ON accounts BEGIN
+    INSERT INTO accounts_fts (accounts_fts, rowid, username, remark) VALUES ('delete', old.id, old.username, old.remark);
+    INSERT INTO accounts_fts (rowid, username, remark) VALUES (new.id, new.username, new.remark);
+END;
+
+-- Per-platform availability, replacing the JSON custom_platforms column
+CREATE TABLE IF NOT EXISTS account_platforms (
+    account_id INTEGER NOT NULL REFERENCES accounts (id) ON DELETE CASCADE,
+    platform TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    PRIMARY KEY (account_id, platform)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_account_platforms_platform ON account_platforms (platform, status, account_id);
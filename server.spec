@@ -5,10 +5,10 @@ block_cipher = None
 
 a = Analysis(
     ['server/main.py'],  # 确保路径正确
-    pathex=['./server'],  # 确保路径正确
+    pathex=['./server', './shared'],  # 确保路径正确；shared 中为客户端和服务端共用的模块
     binaries=[],
     datas=[('database/schema.sql', 'database/schema.sql')],  # 包含schema.sql文件
-    hiddenimports=['flask', 'sqlite3', 'requests'],
+    hiddenimports=['flask', 'sqlite3', 'waitress'],  # 服务端不使用 requests
     hookspath=[],
     runtime_hooks=[],
     excludes=[],
@@ -28,7 +28,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,  # UPX 压缩的 DLL 每次启动都要解压，明显拖慢冷启动
     upx_exclude=[],
     runtime_tmpdir=None,
     console=True,  # 设置为 True 以显示控制台输出
@@ -39,7 +39,7 @@ coll = COLLECT(
     a.zipfiles,
     a.datas,
     strip=False,
-    upx=True,
+    upx=False,
     upx_exclude=[],
     name='server',
 )
@@ -0,0 +1,509 @@
+# -*- coding: utf-8 -*-
+"""ASGI 入口：提供与 main.py 相同的 /accounts 和 /verify_admin 接口
+
+慢速客户端、SSE 长连接和导出流不占用线程：SQLite 读操作在有界线程池中执行，
+写操作交给组提交写线程（writer.py），请求解析、校验和编码与 main.py 共用 service.py。
+
+运行: python asgi.py [--port 12345]（需要 uvicorn）
+或: uvicorn asgi:app --port 12345
+"""
+import os
+import sys
+# 启动分析模块与客户端共用，位于仓库根目录的 shared 中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'shared'))
+import startup
+startup.begin()
+import argparse
+import asyncio
+import functools
+import io
+import json
+import re
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from db import ensure_db, add_account, update_account, delete_account, get_changes, get_revision, query_accounts
+from db import search_accounts, checkout_account, release_account, patch_account, increment_usage
+from service import COMPRESS_MIN_SIZE, EXPORT_MIMETYPES, encode_json, error, fail, compress, parse_search_args, parse_since
+from service import LIST_MIMETYPES, list_format, load_account_list, list_etag, parse_etags, first_etag, parse_checkout_args, parse_release_args, parse_patch
+from service import parse_account, parse_account_update, patch_response, parse_increment, parse_bulk_items, run_bulk, sse_event, verify_admin
+from transfer import FORMATS, export_lines, import_lines
+from events import notifier
+from writer import writer
+from maintenance import start_maintenance
+from metrics import registry, http_requests, http_latency, http_response_size, log_payload, set_log_payloads
+
+# 执行 SQLite 查询的线程数，同时也是同时进行的数据库读操作上限
+DB_THREADS = int(os.environ.get('ACCOUNTS_ASGI_DB_THREADS', 8))
+# SSE 连接只占一个协程，上限可以远高于 main.py
+MAX_EVENT_SUBSCRIBERS = int(os.environ.get('ACCOUNTS_ASGI_MAX_SUBSCRIBERS', 1000))
+EVENT_HEARTBEAT_SECONDS = 15
+EVENT_STREAM_SECONDS = 300
+# 请求体上限（导入接口需要读入整个上传内容）
+MAX_BODY_SIZE = int(os.environ.get('ACCOUNTS_ASGI_MAX_BODY_MB', 256)) * 1024 * 1024
+EXPORT_BATCH_SIZE = 500
+# 超过该大小的响应体在线程池中压缩，避免阻塞事件循环
+OFFLOAD_COMPRESS_SIZE = 256 * 1024
+
+executor = ThreadPoolExecutor(DB_THREADS, thread_name_prefix='asgi-db')
+event_subscribers = 0
+
+startup.mark('imports')
+
+
+async def run_db(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(fn, *args))
+
+async def run_write(fn, *args):
+    """写操作交给组提交写线程，等待结果时不占用线程池"""
+    if not writer.enabled:
+        return await run_db(fn, *args)
+    return await asyncio.wrap_future(writer.submit(fn, *args))
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class Request:
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query_string = scope.get('query_string', b'')
+        # 与 Flask 的 request.args.get 一致：同名参数取第一个
+        self.args = {}
+        for name, value in parse_qsl(self.query_string.decode('latin-1'), keep_blank_values=True):
+            self.args.setdefault(name, value)
+        self.headers = {}
+        for name, value in scope.get('headers', []):
+            self.headers[name.decode('latin-1')] = value.decode('latin-1')
+        self._body = None
+
+    @property
+    def mimetype(self):
+        return self.headers.get('content-type', '').split(';')[0].strip().lower()
+
+    async def read(self):
+        if self._body is None:
+            chunks = []
+            size = 0
+            while True:
+                message = await self.receive()
+                if message['type'] == 'http.disconnect':
+                    raise ConnectionResetError("client disconnected")
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if size > MAX_BODY_SIZE:
+                    raise BodyTooLarge("request body too large")
+                chunks.append(chunk)
+                if not message.get('more_body', False):
+                    break
+            self._body = b''.join(chunks)
+        return self._body
+
+    async def json(self):
+        """解析 JSON 请求体，无法解析时返回 None（同 Flask 的 get_json(silent=True)）"""
+        try:
+            return json.loads(await self.read())
+        except ValueError:
+            return None
+
+
+class Response:
+    def __init__(self, body=b'', status=200, content_type='application/json', headers=None, stream=None):
+        self.body = body
+        self.status = status
+        if content_type and content_type.startswith('text/') and 'charset' not in content_type:
+            # 与 Flask 相同，文本类型带上字符集
+            content_type += '; charset=utf-8'
+        self.headers = [('Content-Type', content_type)] if content_type else []
+        self.headers.extend(headers or [])
+        # 异步迭代器，逐块生成 bytes
+        self.stream = stream
+        self.close_callbacks = []
+
+    def call_on_close(self, fn):
+        """响应发送结束或发送失败后调用（同 Flask 的 call_on_close）"""
+        self.close_callbacks.append(fn)
+
+    def header(self, name):
+        for key, value in self.headers:
+            if key.lower() == name.lower():
+                return value
+        return None
+
+    async def send(self, send, receive):
+        try:
+            await self._send(send, receive)
+        finally:
+            for fn in self.close_callbacks:
+                fn()
+
+    async def _send(self, send, receive):
+        await send({
+            'type': 'http.response.start',
+            'status': self.status,
+            'headers': [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in self.headers],
+        })
+        if self.stream is None:
+            await send({'type': 'http.response.body', 'body': self.body})
+            return
+        # 流式响应：同时等待下一块数据和客户端断开，断开后立即停止生成
+        disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+        chunks = self.stream.__aiter__()
+        try:
+            while True:
+                next_chunk = asyncio.ensure_future(chunks.__anext__())
+                await asyncio.wait({next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not next_chunk.done():
+                    # 等取消真正完成后生成器才能关闭
+                    next_chunk.cancel()
+                    await asyncio.wait({next_chunk})
+                    return
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            await chunks.aclose()
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def json_response(value, status=200, headers=None):
+    return Response(encode_json(value), status, headers=headers)
+
+
+ROUTES = []
+_PARAM = re.compile(r'<int:(\w+)>')
+
+def route(rule, methods):
+    """注册路由，rule 使用与 Flask 相同的写法，指标中的 route 标签也与 main.py 相同"""
+    pattern = re.compile('^' + _PARAM.sub(r'(?P<\1>\\d+)', re.escape(rule)) + '$')
+
+    def decorator(fn):
+        for method in methods:
+            ROUTES.append((method, pattern, rule, fn))
+        return fn
+    return decorator
+
+async def not_found(request):
+    return json_response(error('not found'), 404)
+
+async def method_not_allowed(request):
+    return json_response(error('method not allowed'), 405)
+
+def match_route(method, path):
+    """返回 (handler, rule, params)"""
+    allowed = False
+    for route_method, pattern, rule, fn in ROUTES:
+        m = pattern.match(path)
+        if m is None:
+            continue
+        if route_method == method:
+            return fn, rule, {name: int(value) for name, value in m.groupdict().items()}
+        allowed = True
+    return (method_not_allowed if allowed else not_found), 'unmatched', {}
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    # 服务器不发送 lifespan 事件、也没有经过 serve() 时，由第一个请求完成迁移
+    ensure_db()
+    start = time.perf_counter()
+    request = Request(scope, receive)
+    handler, rule, params = match_route(request.method, request.path)
+    try:
+        response = await handler(request, **params)
+    except BodyTooLarge as e:
+        response = json_response(error(str(e)), 413)
+    except ConnectionError:
+        return
+    except Exception:
+        traceback.print_exc(file=sys.stderr)
+        response = json_response(error('internal server error'), 500)
+    if (response.stream is None and response.status == 200 and response.header('Content-Encoding') is None
+            and len(response.body) >= COMPRESS_MIN_SIZE):
+        accept_encoding = request.headers.get('accept-encoding')
+        if len(response.body) >= OFFLOAD_COMPRESS_SIZE:
+            body, encoding = await run_db(compress, response.body, accept_encoding)
+        else:
+            body, encoding = compress(response.body, accept_encoding)
+        if encoding is not None:
+            response.body = body
+            response.headers.extend([('Content-Encoding', encoding), ('Vary', 'Accept-Encoding')])
+    http_latency.observe(time.perf_counter() - start, request.method, rule)
+    http_requests.inc(request.method, rule, str(response.status))
+    if response.stream is None:
+        http_response_size.observe(len(response.body), rule)
+    try:
+        await response.send(send, receive)
+    except ConnectionError:
+        pass
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await run_db(ensure_db)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+@route('/metrics', ['GET'])
+async def metrics_route(request):
+    return Response(registry.render().encode(), content_type='text/plain; version=0.0.4')
+
+@route('/accounts', ['GET'])
+async def list_accounts(request):
+    # 先读版本号再查询：查询期间若有写入，下次请求版本号不同会重新获取
+    revision = await run_db(get_revision)
+    fmt = list_format(request.headers.get('accept'))
+    etag = list_etag(revision, request.query_string, fmt)
+    tags = parse_etags(request.headers.get('if-none-match'))
+    if etag in tags or '*' in tags:
+        return Response(status=304, content_type=None, headers=[('ETag', 'W/"{}"'.format(etag)), ('Vary', 'Accept')])
+    gzip_ok = 'gzip' in request.headers.get('accept-encoding', '').lower()
+    try:
+        entry, etag, cache_status = await run_db(load_account_list, revision, request.query_string, request.args, gzip_ok, fmt)
+    except ValueError as e:
+        return json_response(error(str(e)), 400)
+    headers = [('X-Next-Cursor', entry['cursor']), ('X-Cache', cache_status), ('ETag', 'W/"{}"'.format(etag))]
+    if entry['gzip'] is not None and gzip_ok:
+        headers.extend([('Content-Encoding', 'gzip'), ('Vary', 'Accept, Accept-Encoding')])
+        return Response(entry['gzip'], content_type=LIST_MIMETYPES[fmt], headers=headers)
+    headers.append(('Vary', 'Accept'))
+    return Response(entry['body'], content_type=LIST_MIMETYPES[fmt], headers=headers)
+
+@route('/accounts/search', ['GET'])
+async def search_accounts_route(request):
+    try:
+        q, limit = parse_search_args(request.args)
+    except ValueError as e:
+        return json_response(error(str(e)), 400)
+    return json_response(await run_db(search_accounts, q, limit))
+
+@route('/accounts/checkout', ['POST'])
+async def checkout_account_route(request):
+    try:
+        filters, lease_seconds, owner = parse_checkout_args(await request.json() or {})
+    except ValueError as e:
+        return json_response(error(str(e)), 400)
+    account = await run_write(checkout_account, filters, lease_seconds, owner)
+    if account is None:
+        return json_response(fail('no account available'), 404)
+    return json_response({'status': 'success', 'account': account})
+
+@route('/accounts/<int:account_id>/release', ['POST'])
+async def release_account_route(request, account_id):
+    try:
+        owner = parse_release_args(await request.json())
+    except ValueError as e:
+        return json_response(error(str(e)), 400)
+    if await run_write(release_account, account_id, owner):
+        return json_response({'status': 'success'})
+    return json_response(fail('account is not leased'), 409)
+
+@route('/accounts/changes', ['GET'])
+async def list_account_changes(request):
+    try:
+        since = parse_since(request.args)
+    except ValueError as e:
+        return json_response(error(str(e)), 400)
+    return json_response(await run_db(get_changes, since))
+
+@route('/accounts/bulk', ['POST', 'PATCH', 'DELETE'])
+async def bulk_response(request):
+    try:
+        items = parse_bulk_items(request.mimetype, await request.read())
+    except ValueError as e:
+        return json_response(error(str(e)), 400)
+    return json_response(await run_db(run_bulk, request.method, items))
+
+def _export_batch(fmt, cursor, header):
+    accounts, next_cursor = query_accounts(None, 'id', EXPORT_BATCH_SIZE, cursor)
+    return ''.join(export_lines(fmt, accounts, header)).encode('utf-8'), next_cursor
+
+async def export_stream(fmt):
+    # 按 id 分页逐批查询，每批在线程池中执行，批与批之间不占用线程和连接
+    cursor = None
+    header = True
+    while True:
+        chunk, cursor = await run_db(_export_batch, fmt, cursor, header)
+        header = False
+        if chunk:
+            yield chunk
+        if not cursor:
+            return
+
+@route('/accounts/export', ['GET'])
+async def export_accounts(request):
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return json_response(error('unknown format: {}'.format(fmt)), 400)
+    return Response(content_type=EXPORT_MIMETYPES[fmt], stream=export_stream(fmt),
+                    headers=[('Content-Disposition', 'attachment; filename=accounts.{}'.format(fmt))])
+
+@route('/accounts/import', ['POST'])
+async def import_accounts(request):
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return json_response(error('unknown format: {}'.format(fmt)), 400)
+    body = await request.read()
+    try:
+        lines = io.StringIO(body.decode('utf-8-sig'), newline='')
+    except UnicodeDecodeError:
+        return json_response(error('request body must be UTF-8'), 400)
+    summary = await run_db(import_lines, fmt, lines)
+    return json_response(dict(summary, status='success'))
+
+def release_event_slot():
+    global event_subscribers
+    event_subscribers -= 1
+
+async def event_stream(since):
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def wake(revision):
+        loop.call_soon_threadsafe(changed.set)
+
+    notifier.subscribe(wake)
+    try:
+        yield b'retry: 3000\n\n'
+        deadline = loop.time() + EVENT_STREAM_SECONDS
+        while loop.time() < deadline:
+            if notifier.revision <= since:
+                try:
+                    await asyncio.wait_for(changed.wait(), EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            changed.clear()
+            revision = notifier.revision
+            if revision <= since:
+                # 本进程没有新提交，再确认一次数据库（可能由命令行工具写入）
+                revision = await run_db(get_revision)
+            if revision > since:
+                changes = await run_db(get_changes, since)
+                since = changes['revision']
+                yield sse_event(changes).encode()
+            else:
+                yield b': keep-alive\n\n'
+    finally:
+        notifier.unsubscribe(wake)
+
+@route('/accounts/events', ['GET'])
+async def account_events(request):
+    """Server-Sent Events，格式同 main.py；每个订阅者只占一个协程"""
+    last_event_id = request.headers.get('last-event-id') or request.args.get('since')
+    try:
+        since = int(last_event_id) if last_event_id else await run_db(get_revision)
+    except ValueError:
+        return json_response(error('invalid Last-Event-ID'), 400)
+    global event_subscribers
+    if event_subscribers >= MAX_EVENT_SUBSCRIBERS:
+        return json_response(fail('too many subscribers'), 503)
+    # 检查通过时立即占用名额，响应发送结束（包括从未开始发送）时释放
+    event_subscribers += 1
+    response = Response(content_type='text/event-stream', stream=event_stream(since),
+                        headers=[('Cache-Control', 'no-cache')])
+    response.call_on_close(release_event_slot)
+    return response
+
+@route('/accounts', ['POST'])
+async def create_account(request):
+    data = await request.json()
+    log_payload("Received request to create account: {}", data)
+    try:
+        account = parse_account(data)
+    except ValueError as e:
+        return json_response(error(str(e)), 400)
+    await run_write(add_account, account)
+    return json_response({'status': 'success'})
+
+@route('/accounts/<int:account_id>', ['PUT'])
+async def edit_account(request, account_id):
+    data = await request.json()
+    log_payload("Received request to update account {}: {}", account_id, data)
+    try:
+        account = parse_account_update(data)
+    except ValueError as e:
+        return json_response(error(str(e)), 400)
+    await run_write(update_account, account_id, account)
+    return json_response({'status': 'success'})
+
+@route('/accounts/<int:account_id>', ['PATCH'])
+async def patch_account_route(request, account_id):
+    """部分更新：请求体只包含要修改的字段，可通过 If-Match 头或 revision 字段做乐观并发控制"""
+    try:
+        changes, expected = parse_patch(await request.json(), first_etag(request.headers.get('if-match')))
+    except ValueError as e:
+        return json_response(error(str(e)), 400)
+    result, account = await run_write(patch_account, account_id, changes, expected)
+    payload, status = patch_response(result, account)
+    headers = [('ETag', '"{}"'.format(account['revision']))] if status == 200 else None
+    return json_response(payload, status, headers)
+
+@route('/accounts/<int:account_id>/usage:increment', ['POST'])
+async def increment_usage_route(request, account_id):
+    try:
+        amount = parse_increment(await request.json())
+    except ValueError as e:
+        return json_response(error(str(e)), 400)
+    usage_count = await run_write(increment_usage, account_id, amount)
+    if usage_count is None:
+        return json_response(fail('account not found'), 404)
+    return json_response({'status': 'success', 'usage_count': usage_count})
+
+@route('/accounts/<int:account_id>', ['DELETE'])
+async def delete_account_route(request, account_id):
+    log_payload("Received request to delete account {}", account_id)
+    await run_write(delete_account, account_id)
+    return json_response({'status': 'success'})
+
+@route('/verify_admin', ['POST'])
+async def verify_admin_route(request):
+    data = await request.json()
+    if not isinstance(data, dict):
+        return json_response(error('request body must be an object'), 400)
+    return json_response(verify_admin(data))
+
+
+def serve(host='0.0.0.0', port=12345):
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("uvicorn not installed: pip install uvicorn")
+    ensure_db()
+    startup.mark('database ready')
+    start_maintenance(busy=lambda: writer.depth() > 0)
+    print("Serving on {}:{} with uvicorn".format(host, port))
+    startup.mark('serving')
+    startup.report()
+    uvicorn.run(app, host=host, port=port, log_level='warning')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--no-payload-log', action='store_true', help='do not print request payloads (they include passwords)')
+    args = parser.parse_args()
+    if args.no_payload_log:
+        set_log_payloads(False)
+    serve(args.host, args.port)
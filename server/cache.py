@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+from collections import OrderedDict
+
+# 缓存总大小上限（按缓存的字节数计算），可通过环境变量 ACCOUNTS_CACHE_MB 调整，0 表示关闭
+CACHE_MAX_BYTES = int(os.environ.get('ACCOUNTS_CACHE_MB', 64)) * 1024 * 1024
+CACHE_MAX_ENTRIES = 1024
+
+
+class ListCache:
+    """按表版本号缓存已编码的列表响应
+
+    键为 (版本号, 查询参数)，写入提交后版本号变化，旧条目不会再被命中；
+    invalidate() 在提交后立即清空，释放内存。超出大小或条目上限时按 LRU 淘汰。
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, max_entries=CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (size, value)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, revision, key):
+        with self._lock:
+            entry = self._entries.get((revision, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((revision, key))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, revision, key, value, size):
+        """value 为任意对象，size 为其占用的字节数；单个条目超过上限时不缓存"""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop((revision, key), None)
+            if old is not None:
+                self.bytes -= old[0]
+            self._entries[(revision, key)] = (size, value)
+            self.bytes += size
+            while self.bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            if self._entries:
+                self._entries.clear()
+                self.bytes = 0
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+list_cache = ListCache()
@@ -1,77 +1,421 @@
-# -*- coding: utf-8 -*-
-import sqlite3
-import json
-import os
-
-def init_db():
-    db_file = os.path.join(os.path.dirname(__file__), 'accounts.db')
-    schema_file = os.path.join(os.path.dirname(__file__), '../database/schema.sql')
-    
-    conn = sqlite3.connect(db_file)
-    c = conn.cursor()
-    
-    # 尝试添加缺失的列（如果不存在）
-    try:
-        c.execute("ALTER TABLE accounts ADD COLUMN added_time TEXT")
-    except sqlite3.OperationalError:
-        pass  # 列已经存在
-
-    try:
-        c.execute("ALTER TABLE accounts ADD COLUMN remark TEXT")
-    except sqlite3.OperationalError:
-        pass  # 列已经存在
-
-    with open(schema_file) as f:
-        conn.executescript(f.read())
-    conn.close()
-
-def add_account(data):
-    db_file = os.path.join(os.path.dirname(__file__), 'accounts.db')
-    conn = sqlite3.connect(db_file)
-    c = conn.cursor()
-    print("Adding account to database: {}".format(data))
-    c.execute("INSERT INTO accounts (username, password, gpt_status, midjourney_status, custom_platforms, usage_count, added_time, remark) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-              (data['username'], data['password'], data['gpt_status'], data['midjourney_status'], json.dumps(data['custom_platforms']), data['usage_count'], data['added_time'], data['remark']))
-    conn.commit()
-    conn.close()
-
-def get_accounts():
-    db_file = os.path.join(os.path.dirname(__file__), 'accounts.db')
-    conn = sqlite3.connect(db_file)
-    c = conn.cursor()
-    c.execute("SELECT * FROM accounts")
-    rows = c.fetchall()
-    accounts = []
-    for row in rows:
-        accounts.append({
-            'id': row[0],
-            'username': row[1],
-            'password': row[2],
-            'gpt_status': bool(row[3]),
-            'midjourney_status': bool(row[4]),
-            'custom_platforms': json.loads(row[5]),
-            'usage_count': row[6],
-            'added_time': row[7],
-            'remark': row[8]
-        })
-    conn.close()
-    return accounts
-
-def update_account(account_id, data):
-    db_file = os.path.join(os.path.dirname(__file__), 'accounts.db')
-    conn = sqlite3.connect(db_file)
-    c = conn.cursor()
-    print("Updating account {} in database: {}".format(account_id, data))
-    c.execute("UPDATE accounts SET password = ?, gpt_status = ?, midjourney_status = ?, custom_platforms = ?, usage_count = ?, added_time = ?, remark = ? WHERE id = ?",
-              (data['password'], data['gpt_status'], data['midjourney_status'], json.dumps(data['custom_platforms']), data['usage_count'], data['added_time'], data['remark'], account_id))
-    conn.commit()
-    conn.close()
-
-def delete_account(account_id):
-    db_file = os.path.join(os.path.dirname(__file__), 'accounts.db')
-    conn = sqlite3.connect(db_file)
-    c = conn.cursor()
-    print("Deleting account {} from database".format(account_id))
-    c.execute("DELETE FROM accounts WHERE id = ?", (account_id,))
-    conn.commit()
-    conn.close()
+# -*- coding: utf-8 -*-
+import base64
+import json
+import threading
+import time
+
+from pool import get_connection, transaction, snapshot, after_commit
+from events import notifier
+from cache import list_cache
+from metrics import log_payload
+from migrations import migrate
+
+def init_db():
+    """执行未完成的数据库迁移（已是最新时几乎没有开销）"""
+    migrate()
+    notifier.notify(get_revision())
+
+_init_lock = threading.Lock()
+_initialized = False
+
+def ensure_db():
+    """只在第一次调用时执行 init_db；入口模块不在导入时访问数据库，而是在开始监听前
+    （作为应用嵌入其他服务器时在处理第一个请求时）调用"""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if not _initialized:
+            init_db()
+            _initialized = True
+
+def _next_revision(conn):
+    # 必须在写事务内调用，同一事务中的所有改动共用一个版本号
+    conn.execute("UPDATE sync_state SET value = value + 1 WHERE name = 'revision'")
+    revision = conn.execute("SELECT value FROM sync_state WHERE name = 'revision'").fetchone()[0]
+    # 提交后丢弃旧版本的列表缓存，并通知等待变更的 SSE 连接
+    after_commit(list_cache.invalidate)
+    after_commit(lambda: notifier.notify(revision))
+    return revision
+
+def _pending_revision(conn):
+    # 写事务内下一次 _next_revision 将分配的版本号（不修改 sync_state）：先用它执行带条件的 UPDATE，
+    # 确实改到了行再调用 _next_revision，被拒绝或没有匹配的写入不改变版本号
+    return conn.execute("SELECT value + 1 FROM sync_state WHERE name = 'revision'").fetchone()[0]
+
+def get_revision():
+    return get_connection().execute("SELECT value FROM sync_state WHERE name = 'revision'").fetchone()[0]
+
+def add_account(data):
+    log_payload("Adding account to database: {}", data)
+    with transaction() as conn:
+        c = conn.execute("INSERT INTO accounts (username, password, gpt_status, midjourney_status, usage_count, added_time, remark, revision) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (data['username'], data['password'], data['gpt_status'], data['midjourney_status'], data['usage_count'], data['added_time'], data['remark'], _next_revision(conn)))
+        _save_platforms(conn, [(c.lastrowid, data.get('custom_platforms') or {})])
+
+# custom_platforms 不在 accounts 表中，由 _attach_platforms 从 account_platforms 表补全
+ACCOUNT_COLUMNS = "id, username, password, gpt_status, midjourney_status, usage_count, added_time, remark, revision"
+
+MAX_PAGE_SIZE = 1000
+
+# 排序方式 -> 排序表达式（与 idx_accounts_availability 索引中的表达式保持一致）
+SORT_KEYS = {
+    'id': ('id',),
+    'availability': ('(gpt_status AND midjourney_status)', '(gpt_status OR midjourney_status)', 'usage_count', 'username', 'id'),
+    'usage': ('usage_count', 'id'),
+    'username': ('username', 'id'),
+}
+
+def _row_to_account(row):
+    return {
+        'id': row[0],
+        'username': row[1],
+        'password': row[2],
+        'gpt_status': bool(row[3]),
+        'midjourney_status': bool(row[4]),
+        'custom_platforms': {},
+        'usage_count': row[5],
+        'added_time': row[6],
+        'remark': row[7],
+        'revision': row[8]
+    }
+
+# 超过该数量时直接扫描整个 account_platforms 表，而不是按 id 分批查询
+PLATFORM_SCAN_THRESHOLD = 2000
+
+def _platform_rows(conn, ids):
+    """返回这些账户的 (account_id, platform, status)；账户较多时扫描整表，可能包含其他账户的行"""
+    if not ids:
+        return []
+    if len(ids) > PLATFORM_SCAN_THRESHOLD:
+        return conn.execute("SELECT account_id, platform, status FROM account_platforms")
+    rows = []
+    for i in range(0, len(ids), BULK_CHUNK):
+        chunk = ids[i:i + BULK_CHUNK]
+        rows.extend(conn.execute("SELECT account_id, platform, status FROM account_platforms WHERE account_id IN ({})".format(
+            ', '.join('?' * len(chunk))), chunk))
+    return rows
+
+def _attach_platforms(conn, accounts):
+    """为账户列表填充 custom_platforms"""
+    by_id = {account['id']: account for account in accounts}
+    for account_id, platform, status in _platform_rows(conn, list(by_id)):
+        account = by_id.get(account_id)
+        if account is not None:
+            account['custom_platforms'][platform] = bool(status)
+    return accounts
+
+def _load_accounts(conn, rows):
+    return _attach_platforms(conn, [_row_to_account(row) for row in rows])
+
+def _save_platforms(conn, items):
+    """用 items = [(account_id, {platform: status})] 整体替换这些账户的平台状态"""
+    conn.executemany("DELETE FROM account_platforms WHERE account_id = ?", [(account_id,) for account_id, _ in items])
+    conn.executemany("INSERT INTO account_platforms (account_id, platform, status) VALUES (?, ?, ?)",
+                     [(account_id, platform, int(bool(status))) for account_id, platforms in items for platform, status in platforms.items()])
+
+def get_accounts():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT {} FROM accounts".format(ACCOUNT_COLUMNS))
+    return _load_accounts(conn, c.fetchall())
+
+def iter_accounts(batch_size=500):
+    """逐批从游标读取全部账户，内存占用与表大小无关"""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT {} FROM accounts ORDER BY id".format(ACCOUNT_COLUMNS))
+    while True:
+        rows = c.fetchmany(batch_size)
+        if not rows:
+            break
+        for account in _load_accounts(conn, rows):
+            yield account
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError("invalid cursor")
+
+def _prefix_upper_bound(prefix):
+    # 'abc' -> 'abd'，用于 username >= ? AND username < ? 的范围查询以命中索引；
+    # 末尾的 U+10FFFF 无法加一，去掉后进位到前一个字符，全部去掉时没有上界（返回 None）
+    prefix = prefix.rstrip('\U0010ffff')
+    if not prefix:
+        return None
+    code = ord(prefix[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+        # 代理码位不能编码为 UTF-8，跳到代理区之后
+        code = 0xE000
+    return prefix[:-1] + chr(code)
+
+def _filter_clauses(filters):
+    """把过滤条件转换为 WHERE 子句列表和参数"""
+    where = []
+    params = []
+    for column in ('gpt_status', 'midjourney_status'):
+        if filters.get(column) is not None:
+            where.append("{} = ?".format(column))
+            params.append(int(filters[column]))
+    if filters.get('min_usage') is not None:
+        where.append("usage_count >= ?")
+        params.append(filters['min_usage'])
+    if filters.get('max_usage') is not None:
+        where.append("usage_count <= ?")
+        params.append(filters['max_usage'])
+    if filters.get('added_after'):
+        where.append("added_time >= ?")
+        params.append(filters['added_after'])
+    if filters.get('added_before'):
+        where.append("added_time < ?")
+        params.append(filters['added_before'])
+    if filters.get('username_prefix'):
+        upper = _prefix_upper_bound(filters['username_prefix'])
+        where.append("username >= ?" if upper is None else "username >= ? AND username < ?")
+        params.append(filters['username_prefix'])
+        if upper is not None:
+            params.append(upper)
+    if filters.get('platform'):
+        # 命中 idx_account_platforms_platform，不需要解码任何 JSON
+        where.append("id IN (SELECT account_id FROM account_platforms WHERE platform = ? AND status = ?)")
+        params.extend([filters['platform'], int(filters.get('platform_status', True))])
+    return where, params
+
+def _query_rows(conn, select, filters, sort, limit, cursor):
+    """执行列表查询，返回 (rows, next_cursor)；每行末尾附带排序键"""
+    filters = filters or {}
+    if sort not in SORT_KEYS:
+        raise ValueError("unknown sort: {}".format(sort))
+    keys = SORT_KEYS[sort]
+
+    where, params = _filter_clauses(filters)
+    if cursor:
+        values = decode_cursor(cursor)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("invalid cursor")
+        # 嵌套的列表或对象无法绑定为 SQL 参数
+        if not all(value is None or isinstance(value, (int, float, str)) for value in values):
+            raise ValueError("invalid cursor")
+        where.append("({}) > ({})".format(', '.join(keys), ', '.join('?' * len(keys))))
+        params.extend(values)
+
+    sql = "SELECT {}, {} FROM accounts".format(select, ', '.join(keys))
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY " + ", ".join(keys)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        # 多取一行用于判断是否还有下一页
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(list(rows[-1][-len(keys):]))
+    return rows, next_cursor
+
+def query_accounts(filters=None, sort='id', limit=None, cursor=None):
+    """按条件查询账户，返回 (accounts, next_cursor)；limit 为空时返回全部"""
+    conn = get_connection()
+    rows, next_cursor = _query_rows(conn, ACCOUNT_COLUMNS, filters, sort, limit, cursor)
+    return _load_accounts(conn, rows), next_cursor
+
+# 按列查询时的列名和对应的表达式：added_time 由 SQLite 转为 epoch 秒（按 UTC 解释，无法解析时为 NULL）
+COLUMN_NAMES = ('id', 'username', 'password', 'gpt_status', 'midjourney_status', 'usage_count', 'added_time', 'remark', 'revision')
+COLUMN_SELECT = "id, username, password, gpt_status, midjourney_status, usage_count, CAST(strftime('%s', added_time) AS INTEGER), remark, revision"
+
+def query_account_columns(filters=None, sort='id', limit=None, cursor=None):
+    """与 query_accounts 相同的查询，但按列返回 ({列名: 值元组}, platforms, next_cursor)，不为每行构造字典；
+    platforms 为按行号排序的 [(行号, 平台, 状态)]"""
+    conn = get_connection()
+    rows, next_cursor = _query_rows(conn, COLUMN_SELECT, filters, sort, limit, cursor)
+    columns = dict(zip(COLUMN_NAMES, zip(*rows))) if rows else {name: () for name in COLUMN_NAMES}
+    positions = {account_id: row for row, account_id in enumerate(columns['id'])}
+    platforms = sorted((positions[account_id], platform, int(bool(status)))
+                       for account_id, platform, status in _platform_rows(conn, columns['id']) if account_id in positions)
+    return columns, platforms, next_cursor
+
+def update_account(account_id, data):
+    log_payload("Updating account {} in database: {}", account_id, data)
+    with transaction() as conn:
+        if conn.execute("UPDATE accounts SET password = ?, gpt_status = ?, midjourney_status = ?, usage_count = ?, added_time = ?, remark = ?, revision = ? WHERE id = ?",
+                        (data['password'], data['gpt_status'], data['midjourney_status'], data['usage_count'], data['added_time'], data['remark'], _pending_revision(conn), account_id)).rowcount:
+            _next_revision(conn)
+            _save_platforms(conn, [(account_id, data.get('custom_platforms') or {})])
+
+def patch_account(account_id, changes, expected_revision=None):
+    """只更新 changes 中的字段；给出 expected_revision 时仅在行版本一致时更新（乐观并发）。
+    返回 (结果, 账户)，结果为 'updated'、'not_found' 或 'conflict'，冲突时返回当前账户"""
+    fields = [name for name in sorted(changes) if name != 'custom_platforms']
+    sql = "UPDATE accounts SET {}revision = ? WHERE id = ?".format(''.join('{} = ?, '.format(name) for name in fields))
+    with transaction() as conn:
+        params = [changes[name] for name in fields] + [_pending_revision(conn), account_id]
+        if expected_revision is not None:
+            sql += " AND revision = ?"
+            params.append(expected_revision)
+        updated = conn.execute(sql, params).rowcount
+        if updated:
+            _next_revision(conn)
+            if 'custom_platforms' in changes:
+                _save_platforms(conn, [(account_id, changes['custom_platforms'])])
+        rows = conn.execute("SELECT {} FROM accounts WHERE id = ?".format(ACCOUNT_COLUMNS), (account_id,)).fetchall()
+        accounts = _load_accounts(conn, rows)
+    if not accounts:
+        return 'not_found', None
+    return ('updated' if updated else 'conflict'), accounts[0]
+
+def increment_usage(account_id, amount=1):
+    """原子地增加使用次数，返回新的 usage_count；账户不存在时返回 None"""
+    with transaction() as conn:
+        if not conn.execute("UPDATE accounts SET usage_count = usage_count + ?, revision = ? WHERE id = ?",
+                            (amount, _pending_revision(conn), account_id)).rowcount:
+            return None
+        _next_revision(conn)
+        return conn.execute("SELECT usage_count FROM accounts WHERE id = ?", (account_id,)).fetchone()[0]
+
+def delete_account(account_id):
+    log_payload("Deleting account {} from database", account_id)
+    with transaction() as conn:
+        if conn.execute("DELETE FROM accounts WHERE id = ?", (account_id,)).rowcount:
+            conn.execute("INSERT OR REPLACE INTO account_tombstones (id, revision) VALUES (?, ?)", (account_id, _next_revision(conn)))
+
+# IN (...) 每次最多绑定的参数个数，低于旧版 SQLite 的 999 上限
+BULK_CHUNK = 500
+
+def _existing_ids(conn, ids):
+    found = set()
+    ids = list(ids)
+    for i in range(0, len(ids), BULK_CHUNK):
+        chunk = ids[i:i + BULK_CHUNK]
+        sql = "SELECT id FROM accounts WHERE id IN ({})".format(', '.join('?' * len(chunk)))
+        found.update(row[0] for row in conn.execute(sql, chunk))
+    return found
+
+def add_accounts(accounts):
+    """在一个事务中批量插入已校验的账户，返回新账户 id 列表"""
+    if not accounts:
+        return []
+    with transaction() as conn:
+        revision = _next_revision(conn)
+        conn.executemany("INSERT INTO accounts (username, password, gpt_status, midjourney_status, usage_count, added_time, remark, revision) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [(a['username'], a['password'], a['gpt_status'], a['midjourney_status'], a['usage_count'], a['added_time'], a['remark'], revision)
+                          for a in accounts])
+        # 写事务持有写锁，AUTOINCREMENT 分配的 id 是连续的
+        last_id = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'accounts'").fetchone()[0]
+        ids = list(range(last_id - len(accounts) + 1, last_id + 1))
+        _save_platforms(conn, [(account_id, a['custom_platforms']) for account_id, a in zip(ids, accounts) if a['custom_platforms']])
+    return ids
+
+def update_accounts(items):
+    """批量部分更新，items 为 [(account_id, changes)]，返回实际存在并被更新的 id 集合"""
+    if not items:
+        return set()
+    with transaction() as conn:
+        existing = _existing_ids(conn, {account_id for account_id, _ in items})
+        if not existing:
+            return existing
+        revision = _next_revision(conn)
+        # 按修改的字段分组，每组一条 UPDATE 语句用 executemany 执行
+        groups = {}
+        platforms = []
+        for account_id, changes in items:
+            if account_id in existing:
+                fields = tuple(name for name in sorted(changes) if name != 'custom_platforms')
+                params = [changes[name] for name in fields] + [revision, account_id]
+                groups.setdefault(fields, []).append(params)
+                if 'custom_platforms' in changes:
+                    platforms.append((account_id, changes['custom_platforms']))
+        for fields, rows in groups.items():
+            sql = "UPDATE accounts SET {}revision = ? WHERE id = ?".format(''.join('{} = ?, '.format(name) for name in fields))
+            conn.executemany(sql, rows)
+        _save_platforms(conn, platforms)
+    return existing
+
+def delete_accounts(account_ids):
+    """批量删除，返回实际存在并被删除的 id 集合"""
+    if not account_ids:
+        return set()
+    with transaction() as conn:
+        existing = _existing_ids(conn, set(account_ids))
+        if not existing:
+            return existing
+        revision = _next_revision(conn)
+        conn.executemany("DELETE FROM accounts WHERE id = ?", [(account_id,) for account_id in existing])
+        conn.executemany("INSERT OR REPLACE INTO account_tombstones (id, revision) VALUES (?, ?)",
+                         [(account_id, revision) for account_id in existing])
+    return existing
+
+MAX_SEARCH_RESULTS = 1000
+
+def _fts_query(text):
+    # 每个词按前缀匹配，并用双引号转义 FTS5 语法字符
+    terms = ['"{}"*'.format(term.replace('"', '""')) for term in text.split()]
+    return ' '.join(terms)
+
+def search_accounts(text, limit=100):
+    """在 username 和 remark 上做全文前缀搜索；不按相关度排序，常见词也能在 LIMIT 处提前结束"""
+    query = _fts_query(text)
+    if not query:
+        return []
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    columns = ', '.join('a.' + name.strip() for name in ACCOUNT_COLUMNS.split(','))
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT {} FROM accounts_fts JOIN accounts a ON a.id = accounts_fts.rowid "
+        "WHERE accounts_fts MATCH ? LIMIT ?".format(columns), (query, limit)).fetchall()
+    return _load_accounts(conn, rows)
+
+def checkout_account(filters=None, lease_seconds=0, owner=None, now=None):
+    """按 availability 排序取出最优且未被租用的账户，usage_count 加一；
+    lease_seconds > 0 时同时租用该账户，到期前不会被再次取出。没有可用账户时返回 None"""
+    now = int(time.time() if now is None else now)
+    where, params = _filter_clauses(filters or {})
+    where.append("(lease_expires IS NULL OR lease_expires <= ?)")
+    params.append(now)
+    keys = SORT_KEYS['availability']
+    sql = "SELECT id FROM accounts WHERE {} ORDER BY {} LIMIT 1".format(" AND ".join(where), ", ".join(keys))
+    lease_expires = now + lease_seconds if lease_seconds > 0 else None
+    lease_owner = owner if lease_seconds > 0 else None
+    # BEGIN IMMEDIATE 持有写锁，挑选与更新之间不会有其他写入者插入
+    with transaction() as conn:
+        row = conn.execute(sql, params).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE accounts SET usage_count = usage_count + 1, lease_owner = ?, lease_expires = ?, revision = ? WHERE id = ?",
+                     (lease_owner, lease_expires, _next_revision(conn), row[0]))
+        account = _load_accounts(conn, conn.execute("SELECT {} FROM accounts WHERE id = ?".format(ACCOUNT_COLUMNS), (row[0],)).fetchall())[0]
+    account['lease_owner'] = lease_owner
+    account['lease_expires'] = lease_expires
+    return account
+
+def release_account(account_id, owner=None):
+    """提前归还租用的账户；指定 owner 时只有租用者本人可以归还。返回是否归还成功"""
+    sql = "UPDATE accounts SET lease_owner = NULL, lease_expires = NULL, revision = ? WHERE id = ? AND lease_expires IS NOT NULL"
+    with transaction() as conn:
+        params = [_pending_revision(conn), account_id]
+        if owner is not None:
+            sql += " AND lease_owner = ?"
+            params.append(owner)
+        if not conn.execute(sql, params).rowcount:
+            return False
+        _next_revision(conn)
+        return True
+
+def get_changes(since):
+    """返回版本号大于 since 的新增/修改账户和已删除账户 id，以及当前版本号"""
+    with snapshot() as conn:
+        revision = conn.execute("SELECT value FROM sync_state WHERE name = 'revision'").fetchone()[0]
+        rows = conn.execute("SELECT {} FROM accounts WHERE revision > ?".format(ACCOUNT_COLUMNS), (since,)).fetchall()
+        accounts = _load_accounts(conn, rows)
+        deleted = [row[0] for row in conn.execute("SELECT id FROM account_tombstones WHERE revision > ?", (since,))]
+    return {
+        'revision': revision,
+        'accounts': accounts,
+        'deleted': deleted,
+    }
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import threading
+
+
+class ChangeNotifier:
+    """记录本进程内最新提交的表版本号，并唤醒等待新版本的 SSE 连接
+
+    线程中用 wait() 阻塞等待；事件循环中用 subscribe() 注册回调（回调在提交的线程中调用，不能阻塞）。
+    """
+
+    def __init__(self):
+        self.revision = 0
+        self._cond = threading.Condition()
+        self._listeners = set()
+
+    def notify(self, revision):
+        with self._cond:
+            if revision <= self.revision:
+                return
+            self.revision = revision
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(revision)
+
+    def subscribe(self, listener):
+        with self._cond:
+            self._listeners.add(listener)
+
+    def unsubscribe(self, listener):
+        with self._cond:
+            self._listeners.discard(listener)
+
+    def wait(self, since, timeout):
+        """等待版本号超过 since，超时返回当前已知的版本号"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.revision > since, timeout)
+            return self.revision
+
+
+notifier = ChangeNotifier()
@@ -1,100 +1,305 @@
-# -*- coding: utf-8 -*-
-from flask import Flask, request, jsonify
-import sqlite3
-from db import init_db, add_account, get_accounts, update_account, delete_account
-from threading import Thread
-from flask import copy_current_request_context
-from datetime import datetime
-import json
-
-app = Flask(__name__)
-init_db()
-
-@app.route('/accounts', methods=['GET'])
-def list_accounts():
-    @copy_current_request_context
-    def run():
-        accounts = get_accounts()
-        for account in accounts:
-            if 'added_time' not in account:
-                account['added_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        return jsonify(accounts)
-
-    def thread_func():
-        result = run()
-        return result
-
-    thread = Thread(target=thread_func)
-    thread.start()
-    thread.join()
-    return thread_func()
-
-@app.route('/accounts', methods=['POST'])
-def create_account():
-    data = request.json
-    print("Received request to create account: {}".format(data))
-    @copy_current_request_context
-    def run():
-        add_account(data)
-        return jsonify({'status': 'success'})
-
-    def thread_func():
-        result = run()
-        return result
-
-    print("Starting thread to add account")
-    thread = Thread(target=thread_func)
-    thread.start()
-    thread.join()  # Wait for the thread to finish
-    print("Thread to add account finished")
-    return jsonify({'status': 'success'})  # Do not call thread_func() again
-
-@app.route('/accounts/<int:account_id>', methods=['PUT'])
-def edit_account(account_id):
-    data = request.json
-    data.setdefault('custom_platforms', {})
-    data.setdefault('remark', '')
-    print("Received request to update account {}: {}".format(account_id, data))
-    @copy_current_request_context
-    def run():
-        update_account(account_id, data)
-        return jsonify({'status': 'success'})
-
-    def thread_func():
-        result = run()
-        return result
-
-    thread = Thread(target=thread_func)
-    thread.start()
-    thread.join()
-    return thread_func()
-
-@app.route('/accounts/<int:account_id>', methods=['DELETE'])
-def delete_account_route(account_id):
-    print("Received request to delete account {}".format(account_id))
-    @copy_current_request_context
-    def run():
-        delete_account(account_id)
-        return jsonify({'status': 'success'})
-
-    def thread_func():
-        result = run()
-        return result
-
-    thread = Thread(target=thread_func)
-    thread.start()
-    thread.join()
-    return thread_func()
-
-@app.route('/verify_admin', methods=['POST'])
-def verify_admin_route():
-    data = request.json
-    username = data.get('username')
-    password = data.get('password')
-    if username == 'endless-shengyangw' and password == 'F42a9d88':
-        return jsonify({'status': 'success'})
-    else:
-        return jsonify({'status': 'fail'})
-
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=12345)
+# -*- coding: utf-8 -*-
+import os
+import sys
+# 启动分析模块与客户端共用，位于仓库根目录的 shared 中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'shared'))
+import startup
+startup.begin()
+from flask import Flask, request, jsonify, Response, g
+from db import ensure_db, add_account, update_account, delete_account, get_changes, get_revision
+from db import search_accounts, checkout_account, release_account, patch_account, increment_usage
+from service import COMPRESS_MIN_SIZE, EXPORT_MIMETYPES, LIST_MIMETYPES, error, fail, compress, load_account_list, list_etag
+from service import list_format, parse_account, parse_account_update, parse_search_args, parse_since
+from service import parse_checkout_args, parse_release_args, parse_patch, first_etag, patch_response, parse_increment, parse_bulk_items
+from service import run_bulk, sse_event, verify_admin
+from transfer import FORMATS, export_lines, import_lines
+from events import notifier
+from cache import list_cache
+from writer import writer
+from maintenance import start_maintenance
+from metrics import registry, http_requests, http_latency, http_response_size, log_payload, set_log_payloads
+import argparse
+import io
+import threading
+import time
+
+startup.mark('imports')
+
+app = Flask(__name__)
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    # 作为 WSGI 应用由其他服务器加载时没有经过 serve()
+    ensure_db()
+
+# 最先注册的 after_request 最后执行，此时响应已经压缩，记录的是实际发送的大小
+@app.after_request
+def record_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    start = g.get('request_start')
+    if start is not None:
+        http_latency.observe(time.perf_counter() - start, request.method, route)
+    http_requests.inc(request.method, route, str(response.status_code))
+    if response.content_length is not None:
+        http_response_size.observe(response.content_length, route)
+    return response
+
+registry.gauge('list_cache_bytes', 'Bytes held by the account list cache', lambda: list_cache.stats()['bytes'])
+registry.gauge('list_cache_entries', 'Entries in the account list cache', lambda: list_cache.stats()['entries'])
+registry.gauge('list_cache_events', 'Account list cache hits, misses, evictions and invalidations since start',
+               lambda: {(name,): value for name, value in list_cache.stats().items()
+                        if name in ('hits', 'misses', 'evictions', 'invalidations')}, labels=('event',))
+registry.gauge('accounts_revision', 'Latest table revision committed by this process', lambda: notifier.revision)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.after_request
+def compress_response(response):
+    """按 Accept-Encoding 对较大的响应做 gzip/deflate 压缩"""
+    if (response.direct_passthrough or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.content_length is None or response.content_length < COMPRESS_MIN_SIZE):
+        return response
+    data, encoding = compress(response.get_data(), request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def accepts_gzip():
+    return 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+@app.route('/accounts', methods=['GET'])
+def list_accounts():
+    # 先读版本号再查询：查询期间若有写入，下次请求版本号不同会重新获取
+    revision = get_revision()
+    # Accept 中要求列格式时返回紧凑的列编码
+    fmt = list_format(request.headers.get('Accept'))
+    etag = list_etag(revision, request.query_string, fmt)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        response.vary.add('Accept')
+        return response
+    try:
+        entry, etag, cache_status = load_account_list(revision, request.query_string, request.args, accepts_gzip(), fmt)
+    except ValueError as e:
+        return jsonify(error(str(e))), 400
+    response = app.response_class(entry['body'], mimetype=LIST_MIMETYPES[fmt])
+    response.vary.add('Accept')
+    if entry['gzip'] is not None and accepts_gzip():
+        response.set_data(entry['gzip'])
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+    # 下一页游标放在响应头中，保持响应体仍为账户列表
+    response.headers['X-Next-Cursor'] = entry['cursor']
+    response.headers['X-Cache'] = cache_status
+    response.set_etag(etag, weak=True)
+    return response
+
+@app.route('/accounts/search', methods=['GET'])
+def search_accounts_route():
+    try:
+        q, limit = parse_search_args(request.args)
+    except ValueError as e:
+        return jsonify(error(str(e))), 400
+    return jsonify(search_accounts(q, limit))
+
+@app.route('/accounts/checkout', methods=['POST'])
+def checkout_account_route():
+    try:
+        filters, lease_seconds, owner = parse_checkout_args(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify(error(str(e))), 400
+    account = writer.call(checkout_account, filters, lease_seconds, owner)
+    if account is None:
+        return jsonify(fail('no account available')), 404
+    return jsonify({'status': 'success', 'account': account})
+
+@app.route('/accounts/<int:account_id>/release', methods=['POST'])
+def release_account_route(account_id):
+    try:
+        owner = parse_release_args(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify(error(str(e))), 400
+    if writer.call(release_account, account_id, owner):
+        return jsonify({'status': 'success'})
+    return jsonify(fail('account is not leased')), 409
+
+@app.route('/accounts/changes', methods=['GET'])
+def list_account_changes():
+    try:
+        since = parse_since(request.args)
+    except ValueError as e:
+        return jsonify(error(str(e))), 400
+    return jsonify(get_changes(since))
+
+def bulk_response():
+    try:
+        items = parse_bulk_items(request.mimetype, request.get_data())
+    except ValueError as e:
+        return jsonify(error(str(e))), 400
+    return jsonify(run_bulk(request.method, items))
+
+@app.route('/accounts/bulk', methods=['POST'])
+def bulk_create_accounts():
+    return bulk_response()
+
+@app.route('/accounts/bulk', methods=['PATCH'])
+def bulk_update_accounts():
+    return bulk_response()
+
+@app.route('/accounts/bulk', methods=['DELETE'])
+def bulk_delete_accounts():
+    return bulk_response()
+
+@app.route('/accounts/export', methods=['GET'])
+def export_accounts():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify(error('unknown format: {}'.format(fmt))), 400
+    response = Response(export_lines(fmt), mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = 'attachment; filename=accounts.{}'.format(fmt)
+    return response
+
+@app.route('/accounts/import', methods=['POST'])
+def import_accounts():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify(error('unknown format: {}'.format(fmt))), 400
+    # 按行读取请求体，不把整个上传内容读入内存
+    lines = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+    summary = import_lines(fmt, lines)
+    return jsonify(dict(summary, status='success'))
+
+# SSE 连接会一直占用一个工作线程，限制同时订阅的客户端数，超出时客户端退回轮询
+MAX_EVENT_SUBSCRIBERS = int(os.environ.get('ACCOUNTS_MAX_SUBSCRIBERS', 4))
+# 没有变更时发送心跳的间隔，同时也是检查其他进程写入的间隔
+EVENT_HEARTBEAT_SECONDS = 15
+# 单个连接的最长时间，到期后客户端带 Last-Event-ID 重连
+EVENT_STREAM_SECONDS = 300
+event_slots = threading.BoundedSemaphore(MAX_EVENT_SUBSCRIBERS)
+
+def event_stream(since):
+    yield 'retry: 3000\n\n'
+    deadline = time.monotonic() + EVENT_STREAM_SECONDS
+    while time.monotonic() < deadline:
+        revision = notifier.wait(since, EVENT_HEARTBEAT_SECONDS)
+        if revision <= since:
+            # 本进程没有新提交，再确认一次数据库（可能由命令行工具写入）
+            revision = get_revision()
+        if revision > since:
+            changes = get_changes(since)
+            since = changes['revision']
+            yield sse_event(changes)
+        else:
+            yield ': keep-alive\n\n'
+
+@app.route('/accounts/events', methods=['GET'])
+def account_events():
+    """Server-Sent Events：每个事件携带自上个事件以来的增量（格式同 /accounts/changes），id 为表版本号"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        since = int(last_event_id) if last_event_id else get_revision()
+    except ValueError:
+        return jsonify(error('invalid Last-Event-ID')), 400
+    if not event_slots.acquire(blocking=False):
+        return jsonify(fail('too many subscribers')), 503
+    response = Response(event_stream(since), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.call_on_close(event_slots.release)
+    return response
+
+@app.route('/accounts', methods=['POST'])
+def create_account():
+    data = request.get_json(silent=True)
+    log_payload("Received request to create account: {}", data)
+    try:
+        account = parse_account(data)
+    except ValueError as e:
+        return jsonify(error(str(e))), 400
+    writer.call(add_account, account)
+    return jsonify({'status': 'success'})
+
+@app.route('/accounts/<int:account_id>', methods=['PUT'])
+def edit_account(account_id):
+    data = request.get_json(silent=True)
+    log_payload("Received request to update account {}: {}", account_id, data)
+    try:
+        account = parse_account_update(data)
+    except ValueError as e:
+        return jsonify(error(str(e))), 400
+    writer.call(update_account, account_id, account)
+    return jsonify({'status': 'success'})
+
+@app.route('/accounts/<int:account_id>', methods=['PATCH'])
+def patch_account_route(account_id):
+    """部分更新：请求体只包含要修改的字段，可通过 If-Match 头或 revision 字段做乐观并发控制"""
+    try:
+        changes, expected = parse_patch(request.get_json(silent=True), first_etag(request.headers.get('If-Match')))
+    except ValueError as e:
+        return jsonify(error(str(e))), 400
+    result, account = writer.call(patch_account, account_id, changes, expected)
+    payload, status = patch_response(result, account)
+    response = jsonify(payload)
+    response.status_code = status
+    if status == 200:
+        response.set_etag(str(account['revision']))
+    return response
+
+@app.route('/accounts/<int:account_id>/usage:increment', methods=['POST'])
+def increment_usage_route(account_id):
+    try:
+        amount = parse_increment(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify(error(str(e))), 400
+    usage_count = writer.call(increment_usage, account_id, amount)
+    if usage_count is None:
+        return jsonify(fail('account not found')), 404
+    return jsonify({'status': 'success', 'usage_count': usage_count})
+
+@app.route('/accounts/<int:account_id>', methods=['DELETE'])
+def delete_account_route(account_id):
+    log_payload("Received request to delete account {}", account_id)
+    writer.call(delete_account, account_id)
+    return jsonify({'status': 'success'})
+
+@app.route('/verify_admin', methods=['POST'])
+def verify_admin_route():
+    return jsonify(verify_admin(request.json))
+
+def serve(host='0.0.0.0', port=12345, threads=8):
+    """使用多线程 WSGI 服务器运行应用，threads 为工作线程数"""
+    ensure_db()
+    startup.mark('database ready')
+    # 后台维护线程：写队列有积压时推迟
+    start_maintenance(busy=lambda: writer.depth() > 0)
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        # 未安装 waitress 时退回 werkzeug 的多线程服务器（每个请求一个线程）
+        print("waitress not installed, falling back to threaded development server")
+        startup.mark('serving')
+        startup.report()
+        app.run(host=host, port=port, threaded=True)
+        return
+    print("Serving on {}:{} with {} worker threads".format(host, port, threads))
+    startup.mark('serving')
+    startup.report()
+    waitress_serve(app, host=host, port=port, threads=threads)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('ACCOUNTS_SERVER_THREADS', 8)))
+    parser.add_argument('--no-payload-log', action='store_true', help='do not print request payloads (they include passwords)')
+    args = parser.parse_args()
+    if args.no_payload_log:
+        set_log_payloads(False)
+    serve(args.host, args.port, args.threads)
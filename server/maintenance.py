@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""后台数据库维护：统计信息（PRAGMA optimize）、增量 VACUUM、WAL checkpoint 和在线备份
+
+任务在单独的维护线程中按间隔执行，每个任务分成小步，步与步之间释放写锁并短暂休眠；
+写队列中有等待的写操作时推迟执行。每次执行生成一份报告（耗时、回收的空间等），
+输出到 stderr，并计入 /metrics 的 maintenance_* 指标。手动执行: python manage.py maintenance
+"""
+import glob
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+from pool import DB_FILE, get_connection, snapshot
+from metrics import registry, SQL_BUCKETS
+
+# ACCOUNTS_MAINTENANCE=0 时不启动维护线程
+ENABLED = os.environ.get('ACCOUNTS_MAINTENANCE', '1').lower() not in ('0', 'false', 'no')
+# 各任务的执行间隔（秒），设为 0 关闭该任务
+CHECKPOINT_SECONDS = float(os.environ.get('ACCOUNTS_CHECKPOINT_SECONDS', 60))
+OPTIMIZE_SECONDS = float(os.environ.get('ACCOUNTS_OPTIMIZE_SECONDS', 3600))
+VACUUM_SECONDS = float(os.environ.get('ACCOUNTS_VACUUM_SECONDS', 6 * 3600))
+BACKUP_SECONDS = float(os.environ.get('ACCOUNTS_BACKUP_SECONDS', 24 * 3600))
+BACKUP_DIR = os.environ.get('ACCOUNTS_BACKUP_DIR') or os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), 'backups')
+BACKUP_KEEP = int(os.environ.get('ACCOUNTS_BACKUP_KEEP', 7))
+
+# 每步处理的页数和步间休眠（秒）：每步只持有很短时间的锁
+VACUUM_STEP_PAGES = 256
+BACKUP_STEP_PAGES = 256
+STEP_PAUSE = 0.01
+# ANALYZE 每个索引最多扫描的行数，大表上也只需几毫秒
+ANALYSIS_LIMIT = 1000
+# WAL 文件超过该大小时用 TRUNCATE 模式 checkpoint（会等待读写结束），否则用不阻塞的 PASSIVE
+WAL_TRUNCATE_BYTES = 64 * 1024 * 1024
+# 繁忙时推迟的间隔和最长推迟时间（秒）
+DEFER_SECONDS = 5
+MAX_DEFER_SECONDS = 300
+HISTORY_SIZE = 50
+# 频繁执行的任务只在回收了空间或出错时输出报告
+QUIET_TASKS = ('checkpoint',)
+
+task_seconds = registry.histogram('maintenance_task_duration_seconds', 'Time spent per maintenance task run', ('task',), SQL_BUCKETS)
+task_runs = registry.counter('maintenance_runs_total', 'Maintenance task runs by outcome', ('task', 'outcome'))
+reclaimed_bytes = registry.counter('maintenance_reclaimed_bytes_total', 'Bytes reclaimed by maintenance tasks', ('task',))
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _pragma(conn, name):
+    return conn.execute("PRAGMA {}".format(name)).fetchone()[0]
+
+registry.gauge('db_file_bytes', 'Size of the SQLite database file', lambda: _file_size(DB_FILE))
+registry.gauge('db_wal_bytes', 'Size of the SQLite WAL file', lambda: _file_size(DB_FILE + '-wal'))
+
+
+def optimize():
+    """更新查询规划器的统计信息：还没有统计时做一次有限的 ANALYZE，之后由 PRAGMA optimize 按需更新"""
+    conn = get_connection()
+    conn.execute("PRAGMA analysis_limit = {}".format(ANALYSIS_LIMIT))
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        conn.execute("PRAGMA optimize").fetchall()
+        return {'mode': 'optimize'}
+    conn.execute("ANALYZE")
+    return {'mode': 'analyze'}
+
+def incremental_vacuum(step_pages=VACUUM_STEP_PAGES, pause=STEP_PAUSE):
+    """把空闲页分批归还给文件系统，每批一个短事务"""
+    conn = get_connection()
+    page_size = _pragma(conn, 'page_size')
+    free_before = _pragma(conn, 'freelist_count')
+    report = {'free_pages_before': free_before, 'file_bytes_before': _file_size(DB_FILE)}
+    if _pragma(conn, 'auto_vacuum') != 2:
+        # 旧库未开启增量模式，需要手动执行一次完整 VACUUM（会阻塞写入）
+        return dict(report, skipped='auto_vacuum is not INCREMENTAL, run: manage.py maintenance vacuum --full',
+                    reclaimed_bytes=0)
+    steps = 0
+    # 上限防止持续有页被释放时一直执行下去
+    for _ in range(free_before // step_pages + 2):
+        if _pragma(conn, 'freelist_count') == 0:
+            break
+        # execute() 只执行一步，只释放一页；executescript 会执行到底，自成一个短事务
+        conn.executescript("PRAGMA incremental_vacuum({});".format(step_pages))
+        steps += 1
+        time.sleep(pause)
+    free_after = _pragma(conn, 'freelist_count')
+    return dict(report, free_pages_after=free_after, steps=steps, file_bytes_after=_file_size(DB_FILE),
+                reclaimed_bytes=max(0, free_before - free_after) * page_size)
+
+def full_vacuum():
+    """完整 VACUUM 并把 auto_vacuum 切换为 INCREMENTAL；整个过程阻塞写入，只由 manage.py 手动执行"""
+    conn = get_connection()
+    before = _pragma(conn, 'page_count') * _pragma(conn, 'page_size')
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    after = _pragma(conn, 'page_count') * _pragma(conn, 'page_size')
+    return {'bytes_before': before, 'bytes_after': after, 'auto_vacuum': _pragma(conn, 'auto_vacuum'),
+            'reclaimed_bytes': max(0, before - after)}
+
+def checkpoint(truncate_bytes=WAL_TRUNCATE_BYTES):
+    """把 WAL 中的页写回数据库文件；WAL 过大时截断文件"""
+    wal_file = DB_FILE + '-wal'
+    before = _file_size(wal_file)
+    mode = 'TRUNCATE' if before >= truncate_bytes else 'PASSIVE'
+    busy, wal_pages, checkpointed = get_connection().execute("PRAGMA wal_checkpoint({})".format(mode)).fetchone()
+    after = _file_size(wal_file)
+    return {'mode': mode, 'busy': bool(busy), 'wal_pages': wal_pages, 'checkpointed_pages': checkpointed,
+            'wal_bytes_before': before, 'wal_bytes_after': after, 'reclaimed_bytes': max(0, before - after)}
+
+
+def backup(directory=BACKUP_DIR, keep=BACKUP_KEEP, step_pages=BACKUP_STEP_PAGES, pause=STEP_PAUSE):
+    """用 SQLite 在线备份 API 分步复制到 directory，校验后改名为正式文件，只保留最近 keep 份"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'accounts-{}.db'.format(time.strftime('%Y%m%d-%H%M%S')))
+    temp_path = path + '.tmp'
+    progress_state = {'steps': 0, 'pages': 0}
+
+    def progress(status, remaining, total):
+        progress_state['steps'] += 1
+        progress_state['pages'] = total
+        # backup() 的 sleep 参数只在遇到 BUSY 时生效，步间休眠在这里做
+        time.sleep(pause)
+
+    target = sqlite3.connect(temp_path)
+    try:
+        # 整个备份在同一个读快照中进行：得到一致的时间点副本，其他连接的写入也不会让备份从头开始；
+        # WAL 模式下读快照不阻塞写入
+        with snapshot() as source:
+            source.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+            source.backup(target, pages=step_pages, progress=progress)
+        check = target.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        target.close()
+    if check != 'ok':
+        os.remove(temp_path)
+        raise RuntimeError("backup failed quick_check: {}".format(check))
+    os.replace(temp_path, path)
+
+    removed = []
+    removed_bytes = 0
+    for old in sorted(glob.glob(os.path.join(directory, 'accounts-*.db')))[:-max(1, keep)]:
+        removed_bytes += _file_size(old)
+        os.remove(old)
+        removed.append(os.path.basename(old))
+    return {'path': path, 'bytes': _file_size(path), 'pages': progress_state['pages'],
+            'steps': progress_state['steps'], 'removed': removed, 'reclaimed_bytes': removed_bytes}
+
+def latest_backup_time(directory=BACKUP_DIR):
+    """最近一份备份的修改时间（time.time() 时间），没有时返回 None"""
+    backups = glob.glob(os.path.join(directory, 'accounts-*.db'))
+    return max(os.path.getmtime(path) for path in backups) if backups else None
+
+
+def run_task(name, fn, history=None):
+    """执行一个维护任务并记录耗时和结果，返回报告"""
+    started = time.strftime('%Y-%m-%d %H:%M:%S')
+    start = time.perf_counter()
+    try:
+        report = fn()
+        outcome = 'ok'
+    except Exception as e:
+        report = {'error': str(e)}
+        outcome = 'error'
+    seconds = time.perf_counter() - start
+    report = dict(report, task=name, started=started, seconds=round(seconds, 4))
+    task_seconds.observe(seconds, name)
+    task_runs.inc(name, outcome)
+    if report.get('reclaimed_bytes'):
+        reclaimed_bytes.inc(name, amount=report['reclaimed_bytes'])
+    if history is not None:
+        history.append(report)
+    if name not in QUIET_TASKS or outcome != 'ok' or report.get('reclaimed_bytes'):
+        print("Maintenance {}".format(json.dumps(report, ensure_ascii=False)), file=sys.stderr)
+    return report
+
+
+class MaintenanceScheduler:
+    """按间隔在后台线程中执行维护任务；busy() 返回 True 时推迟，最多推迟 MAX_DEFER_SECONDS"""
+
+    def __init__(self, tasks, busy=None):
+        self.tasks = tasks  # [(name, interval, fn, first_delay)]
+        self.busy = busy or (lambda: False)
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        now = time.monotonic()
+        due = {name: now + first_delay for name, _, _, first_delay in self.tasks}
+        deferred = {}
+        while not self._stop.wait(max(0.5, min(due.values()) - time.monotonic())):
+            for name, interval, fn, _ in self.tasks:
+                now = time.monotonic()
+                if due[name] > now:
+                    continue
+                if self.busy() and deferred.get(name, 0) < MAX_DEFER_SECONDS:
+                    deferred[name] = deferred.get(name, 0) + DEFER_SECONDS
+                    due[name] = now + DEFER_SECONDS
+                    continue
+                deferred.pop(name, None)
+                run_task(name, fn, self.history)
+                due[name] = time.monotonic() + interval
+
+
+def default_tasks():
+    """按环境变量配置的任务列表，启动后不久先做一次统计信息更新"""
+    tasks = []
+    if CHECKPOINT_SECONDS > 0:
+        tasks.append(('checkpoint', CHECKPOINT_SECONDS, checkpoint, CHECKPOINT_SECONDS))
+    if OPTIMIZE_SECONDS > 0:
+        tasks.append(('optimize', OPTIMIZE_SECONDS, optimize, min(60, OPTIMIZE_SECONDS)))
+    if VACUUM_SECONDS > 0:
+        tasks.append(('vacuum', VACUUM_SECONDS, incremental_vacuum, min(300, VACUUM_SECONDS)))
+    if BACKUP_SECONDS > 0:
+        # 按最近一份备份的时间计算，服务频繁重启时也能按时备份
+        last = latest_backup_time()
+        first_delay = 60 if last is None else max(60, last + BACKUP_SECONDS - time.time())
+        tasks.append(('backup', BACKUP_SECONDS, backup, first_delay))
+    return tasks
+
+def start_maintenance(busy=None):
+    """启动维护线程，关闭时返回 None"""
+    if not ENABLED:
+        return None
+    tasks = default_tasks()
+    if not tasks:
+        return None
+    return MaintenanceScheduler(tasks, busy).start()
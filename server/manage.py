@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""命令行导入/导出账户
+
+python server/manage.py export --format csv -o accounts.csv
+python server/manage.py import --format ndjson accounts.ndjson
+python server/manage.py migrate
+python server/manage.py maintenance all
+python server/manage.py maintenance vacuum --full
+"""
+import argparse
+import io
+import json
+import sys
+
+from db import init_db, get_connection
+from maintenance import BACKUP_DIR, backup, checkpoint, full_vacuum, incremental_vacuum, optimize, run_task
+from migrations import LATEST_VERSION, current_version
+from transfer import FORMATS, IMPORT_CHUNK_SIZE, export_lines, import_lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import or export accounts and maintain the database')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = sub.add_parser('export')
+    export_parser.add_argument('--format', choices=FORMATS, default='ndjson')
+    export_parser.add_argument('-o', '--output', help='output file, stdout by default')
+
+    import_parser = sub.add_parser('import')
+    import_parser.add_argument('--format', choices=FORMATS, default='ndjson')
+    import_parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    import_parser.add_argument('input', help='input file, - for stdin')
+
+    sub.add_parser('migrate', help='apply pending schema migrations')
+
+    maintenance_parser = sub.add_parser('maintenance', help='run database maintenance tasks now')
+    maintenance_parser.add_argument('task', choices=('optimize', 'vacuum', 'checkpoint', 'backup', 'all'))
+    maintenance_parser.add_argument('--full', action='store_true',
+                                    help='vacuum: rebuild the whole file and enable incremental auto_vacuum (blocks writers)')
+    maintenance_parser.add_argument('--backup-dir', default=BACKUP_DIR)
+
+    args = parser.parse_args(argv)
+    init_db()
+
+    if args.command == 'migrate':
+        print("Schema version {} (latest {})".format(current_version(get_connection()), LATEST_VERSION))
+    elif args.command == 'maintenance':
+        tasks = {
+            'optimize': optimize,
+            'vacuum': full_vacuum if args.full else incremental_vacuum,
+            'checkpoint': checkpoint,
+            'backup': lambda: backup(args.backup_dir),
+        }
+        names = ['optimize', 'vacuum', 'checkpoint', 'backup'] if args.task == 'all' else [args.task]
+        reports = [run_task(name, tasks[name]) for name in names]
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+    elif args.command == 'export':
+        out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+        try:
+            for line in export_lines(args.format):
+                out.write(line)
+        finally:
+            if args.output:
+                out.close()
+    else:
+        if args.input == '-':
+            src = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        else:
+            src = open(args.input, encoding='utf-8-sig', newline='')
+        with src:
+            summary = import_lines(args.format, src, args.chunk_size)
+        print(json.dumps(summary, ensure_ascii=False, indent=2), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
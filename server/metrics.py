@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""进程内指标：直方图、计数器和回调式的即时值，以 Prometheus 文本格式输出（GET /metrics）"""
+import os
+import re
+import threading
+
+# 请求体日志（包含密码等完整数据），可通过环境变量 ACCOUNTS_LOG_PAYLOADS=0 或 --no-payload-log 关闭
+LOG_PAYLOADS = os.environ.get('ACCOUNTS_LOG_PAYLOADS', '1').lower() not in ('0', 'false', 'no')
+
+def log_payload(message, *args):
+    """只在开启时才格式化并输出，关闭后热路径上没有字符串格式化和 stdout 写入"""
+    if LOG_PAYLOADS:
+        print(message.format(*args))
+
+def set_log_payloads(enabled):
+    global LOG_PAYLOADS
+    LOG_PAYLOADS = enabled
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1, 5)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in pairs) + '}'
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} counter'.format(self.name)]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append('{}{} {}'.format(self.name, _labels(self.labels, label_values), _number(value)))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}  # label_values -> [每个桶的计数..., 总和, 总数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-2] + [series[-1] - sum(series[:-2])]):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(self.name, _labels(self.labels, label_values, [('le', _number(bound))]), cumulative))
+            lines.append('{}_sum{} {}'.format(self.name, _labels(self.labels, label_values), _number(series[-2])))
+            lines.append('{}_count{} {}'.format(self.name, _labels(self.labels, label_values), series[-1]))
+        return lines
+
+
+class Gauge:
+    """即时值，在输出时调用 fn 获取；fn 返回数字或 {标签值元组: 数字}"""
+
+    def __init__(self, name, help, fn, labels=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labels = labels
+
+    def collect(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} gauge'.format(self.name)]
+        value = self.fn()
+        values = value if isinstance(value, dict) else {(): value}
+        for label_values, v in sorted(values.items()):
+            lines.append('{}{} {}'.format(self.name, _labels(self.labels, label_values), _number(v)))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.counter('http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'status'))
+http_latency = registry.histogram('http_request_duration_seconds', 'Time spent handling a request (until the response is returned)', ('method', 'route'))
+http_response_size = registry.histogram('http_response_size_bytes', 'Response body size after compression', ('route',), SIZE_BUCKETS)
+sql_latency = registry.histogram('db_statement_duration_seconds', 'SQLite statement execution time by statement type and table', ('statement',), SQL_BUCKETS)
+lock_wait = registry.histogram('db_lock_wait_seconds', 'Time waiting for the SQLite write lock (BEGIN IMMEDIATE)', (), SQL_BUCKETS)
+transaction_time = registry.histogram('db_transaction_duration_seconds', 'Time the write lock is held per transaction', (), SQL_BUCKETS)
+connections_opened = registry.counter('db_connections_opened_total', 'SQLite connections opened by the pool')
+
+# SQL 文本 -> 标签，如 "SELECT accounts"；SQL 都是代码中的固定模板，数量有限
+_STATEMENT = re.compile(r'^\s*(\w+)(?:.*?\b(?:FROM|INTO|TABLE|INDEX)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+))?', re.IGNORECASE | re.DOTALL)
+_statement_labels = {}
+
+def statement_label(sql):
+    label = _statement_labels.get(sql)
+    if label is None:
+        match = _STATEMENT.match(sql)
+        if match is None:
+            label = 'OTHER'
+        elif match.group(1).upper() == 'UPDATE':
+            label = 'UPDATE ' + (sql.split()[1] if len(sql.split()) > 1 else '')
+        else:
+            label = ' '.join(part for part in (match.group(1).upper(), match.group(2)) if part)
+        if len(_statement_labels) < 10000:
+            _statement_labels[sql] = label
+    return label
+
+def observe_sql(sql, seconds):
+    sql_latency.observe(seconds, statement_label(sql))
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""编号的数据库迁移，每个迁移只执行一次，执行记录保存在 schema_version 表中
+
+新库直接执行 database/schema.sql（始终是最新结构）并记为全部已执行；
+旧库按编号依次执行未完成的迁移。新增表、列或索引时，同时修改 schema.sql
+并在 MIGRATIONS 末尾追加一个迁移。迁移需兼容引入本机制之前、由旧版
+init_db 建出的任意状态的库，所以建表建索引都使用 IF NOT EXISTS。
+"""
+import json
+import os
+import sys
+import time
+
+from pool import get_connection, transaction
+
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), '../database/schema.sql')
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute("PRAGMA table_info({})".format(table))}
+
+def _add_column(conn, table, name, definition):
+    if name not in _columns(conn, table):
+        conn.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, name, definition))
+
+def _execute_all(conn, statements):
+    for statement in statements:
+        conn.execute(statement)
+
+def _accounts_table(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS accounts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        password TEXT NOT NULL,
+        gpt_status INTEGER NOT NULL,
+        midjourney_status INTEGER NOT NULL,
+        custom_platforms TEXT,
+        usage_count INTEGER NOT NULL
+    )""")
+
+def _added_time_and_remark(conn):
+    _add_column(conn, 'accounts', 'added_time', 'TEXT')
+    _add_column(conn, 'accounts', 'remark', 'TEXT')
+
+def _query_indexes(conn):
+    _execute_all(conn, [
+        """CREATE INDEX IF NOT EXISTS idx_accounts_availability ON accounts (
+            (gpt_status AND midjourney_status),
+            (gpt_status OR midjourney_status),
+            usage_count,
+            username,
+            id
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_accounts_status ON accounts (gpt_status, midjourney_status, usage_count)",
+        "CREATE INDEX IF NOT EXISTS idx_accounts_username ON accounts (username)",
+        "CREATE INDEX IF NOT EXISTS idx_accounts_added_time ON accounts (added_time)",
+    ])
+
+def _revisions(conn):
+    _add_column(conn, 'accounts', 'revision', 'INTEGER NOT NULL DEFAULT 0')
+    _execute_all(conn, [
+        "CREATE INDEX IF NOT EXISTS idx_accounts_revision ON accounts (revision)",
+        "CREATE TABLE IF NOT EXISTS account_tombstones (id INTEGER PRIMARY KEY, revision INTEGER NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_account_tombstones_revision ON account_tombstones (revision)",
+        "CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO sync_state (name, value) VALUES ('revision', 0)",
+    ])
+    # 旧数据没有版本号，统一分配一个，保证 since=0 的首次同步能拿到全部账户
+    if conn.execute("SELECT 1 FROM accounts WHERE revision = 0 LIMIT 1").fetchone():
+        conn.execute("UPDATE sync_state SET value = value + 1 WHERE name = 'revision'")
+        conn.execute("UPDATE accounts SET revision = (SELECT value FROM sync_state WHERE name = 'revision') WHERE revision = 0")
+
+def _full_text_search(conn):
+    has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'accounts_fts'").fetchone()
+    _execute_all(conn, [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS accounts_fts USING fts5(
+            username,
+            remark,
+            content='accounts',
+            content_rowid='id',
+            prefix='2 3'
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS accounts_fts_insert AFTER INSERT ON accounts BEGIN
+            INSERT INTO accounts_fts (rowid, username, remark) VALUES (new.id, new.username, new.remark);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS accounts_fts_delete AFTER DELETE ON accounts BEGIN
+            INSERT INTO accounts_fts (accounts_fts, rowid, username, remark) VALUES ('delete', old.id, old.username, old.remark);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS accounts_fts_update AFTER UPDATE OF username, remark ON accounts BEGIN
+            INSERT INTO accounts_fts (accounts_fts, rowid, username, remark) VALUES ('delete', old.id, old.username, old.remark);
+            INSERT INTO accounts_fts (rowid, username, remark) VALUES (new.id, new.username, new.remark);
+        END""",
+    ])
+    if not has_fts:
+        # 新建的全文索引需要从已有账户重建一次
+        conn.execute("INSERT INTO accounts_fts (accounts_fts) VALUES ('rebuild')")
+
+def _leases(conn):
+    _add_column(conn, 'accounts', 'lease_owner', 'TEXT')
+    _add_column(conn, 'accounts', 'lease_expires', 'INTEGER')
+
+def _account_platforms(conn):
+    _execute_all(conn, [
+        """CREATE TABLE IF NOT EXISTS account_platforms (
+            account_id INTEGER NOT NULL REFERENCES accounts (id) ON DELETE CASCADE,
+            platform TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            PRIMARY KEY (account_id, platform)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_account_platforms_platform ON account_platforms (platform, status, account_id)",
+    ])
+    # 把旧的 custom_platforms JSON 列迁移到 account_platforms 表，迁移后该列置为 NULL
+    platforms = []
+    for account_id, value in conn.execute("SELECT id, custom_platforms FROM accounts WHERE custom_platforms IS NOT NULL").fetchall():
+        try:
+            decoded = json.loads(value) if value else {}
+        except ValueError:
+            decoded = {}
+        if isinstance(decoded, dict):
+            platforms.extend((account_id, platform, int(bool(status))) for platform, status in decoded.items())
+    conn.executemany("INSERT OR REPLACE INTO account_platforms (account_id, platform, status) VALUES (?, ?, ?)", platforms)
+    conn.execute("UPDATE accounts SET custom_platforms = NULL WHERE custom_platforms IS NOT NULL")
+
+def _usage_index(conn):
+    # sort=usage 按 (usage_count, id) 分页，没有这个索引时每页都要全表扫描并临时排序
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_accounts_usage ON accounts (usage_count, id)")
+
+# (版本号, 说明, 迁移函数)，只能在末尾追加，已发布的迁移不要修改
+MIGRATIONS = [
+    (1, 'accounts table', _accounts_table),
+    (2, 'added_time and remark columns', _added_time_and_remark),
+    (3, 'list query indexes', _query_indexes),
+    (4, 'revisions, tombstones and sync_state', _revisions),
+    (5, 'full-text search', _full_text_search),
+    (6, 'checkout leases', _leases),
+    (7, 'account_platforms table', _account_platforms),
+    (8, 'usage sort index', _usage_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def _ensure_version_table(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TEXT NOT NULL)")
+
+def current_version(conn=None):
+    conn = conn or get_connection()
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'schema_version'").fetchone():
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def _record(conn, migrations):
+    applied_at = time.strftime('%Y-%m-%d %H:%M:%S')
+    conn.executemany("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                     [(version, description, applied_at) for version, description, _ in migrations])
+
+def _create_fresh(conn):
+    """空库：执行 schema.sql 建立最新结构，并把所有迁移记为已执行"""
+    with open(SCHEMA_FILE) as f:
+        script = f.read()
+    # 增量 auto_vacuum 只能在建表前设置；连接已切换到 WAL（写入了文件头），需要 VACUUM 才生效，空库上很快
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    # executescript 会先提交当前事务，所以把整个脚本放进它自己的 BEGIN/COMMIT
+    try:
+        conn.executescript("BEGIN IMMEDIATE;\n" + script + "\nCOMMIT;")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    with transaction() as conn:
+        _ensure_version_table(conn)
+        if current_version(conn) == 0:
+            _record(conn, MIGRATIONS)
+
+def migrate():
+    """执行所有未完成的迁移，返回执行的迁移版本号列表；已是最新时只做一次查询"""
+    conn = get_connection()
+    if current_version(conn) >= LATEST_VERSION:
+        return []
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'accounts'").fetchone():
+        _create_fresh(conn)
+        # 输出到 stderr，避免混入 manage.py export 写到 stdout 的数据
+        print("Created database schema version {}".format(LATEST_VERSION), file=sys.stderr)
+        return [version for version, _, _ in MIGRATIONS]
+    applied = []
+    for migration in MIGRATIONS:
+        version, description, apply = migration
+        # 每个迁移一个写事务；写锁内重新检查版本，多个进程同时启动时只有一个会执行
+        with transaction() as conn:
+            _ensure_version_table(conn)
+            if current_version(conn) >= version:
+                continue
+            started = time.perf_counter()
+            apply(conn)
+            _record(conn, [migration])
+        print("Applied migration {} ({}) in {:.3f}s".format(version, description, time.perf_counter() - started), file=sys.stderr)
+        applied.append(version)
+    return applied
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import connections_opened, lock_wait, observe_sql, transaction_time, registry
+
+# 可通过环境变量 ACCOUNTS_DB 指定数据库文件（基准测试、临时库等）
+DB_FILE = os.environ.get('ACCOUNTS_DB') or os.path.join(os.path.dirname(__file__), 'accounts.db')
+
+# WAL 模式下 synchronous=NORMAL 只在 checkpoint 时 fsync，写入不再每次刷盘
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),      # 约 16MB 页缓存
+    ('mmap_size', 268435456),    # 256MB 内存映射读
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),
+    ('foreign_keys', 'ON'),
+)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """记录每条语句的执行时间（不含之后 fetch 的时间）"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            observe_sql(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            observe_sql(sql, time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ConnectionPool:
+    """按线程复用的长连接，每个线程第一次访问时建立连接并设置 PRAGMA"""
+
+    def __init__(self, db_file, pragmas=PRAGMAS):
+        self.db_file = db_file
+        self.pragmas = pragmas
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}
+
+    def _connect(self):
+        # isolation_level=None：由 transaction() 显式控制事务
+        conn = sqlite3.connect(self.db_file, timeout=5, isolation_level=None, check_same_thread=False,
+                               factory=TimedConnection)
+        for name, value in self.pragmas:
+            conn.execute("PRAGMA {} = {}".format(name, value))
+        connections_opened.inc()
+        return conn
+
+    def get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            thread = threading.current_thread()
+            with self._lock:
+                self._prune()
+                self._connections[thread.ident] = (thread, conn)
+        return conn
+
+    def _prune(self):
+        # 关闭已退出线程遗留的连接
+        for ident, (thread, conn) in list(self._connections.items()):
+            if not thread.is_alive():
+                del self._connections[ident]
+                conn.close()
+
+    @contextmanager
+    def transaction(self):
+        conn = self.get()
+        if conn.in_transaction:
+            # 已在事务中（嵌套调用），并入外层事务
+            yield conn
+            return
+        self._local.after_commit = []
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        locked = time.perf_counter()
+        lock_wait.observe(locked - start)
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            transaction_time.observe(time.perf_counter() - locked)
+            self._local.after_commit = []
+            raise
+        else:
+            conn.execute("COMMIT")
+            transaction_time.observe(time.perf_counter() - locked)
+            callbacks, self._local.after_commit = self._local.after_commit, []
+            for callback in callbacks:
+                callback()
+
+    def after_commit(self, callback):
+        """在当前事务提交成功后调用 callback（回滚则丢弃）"""
+        self._local.after_commit.append(callback)
+
+    @contextmanager
+    def savepoint(self, name='sp'):
+        """在当前写事务中建立 SAVEPOINT；出错时只回滚到这里，其间注册的 after_commit 回调一并丢弃"""
+        conn = self.get()
+        callbacks = self._local.after_commit
+        mark = len(callbacks)
+        conn.execute("SAVEPOINT {}".format(name))
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK TO {}".format(name))
+            conn.execute("RELEASE {}".format(name))
+            del callbacks[mark:]
+            raise
+        conn.execute("RELEASE {}".format(name))
+
+    @contextmanager
+    def snapshot(self):
+        """只读事务：WAL 模式下多条查询看到同一个一致的快照"""
+        conn = self.get()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def close_all(self):
+        with self._lock:
+            for thread, conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+pool = ConnectionPool(DB_FILE)
+registry.gauge('db_pool_connections', 'Open SQLite connections in the pool', lambda: len(pool._connections))
+
+
+def get_connection():
+    return pool.get()
+
+
+def transaction():
+    return pool.transaction()
+
+
+def snapshot():
+    return pool.snapshot()
+
+
+def after_commit(callback):
+    pool.after_commit(callback)
+
+
+def savepoint(name='sp'):
+    return pool.savepoint(name)
+
+
+def close_all():
+    pool.close_all()
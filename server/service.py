@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""与 Web 框架无关的请求解析、校验和响应编码，main.py（Flask）和 asgi.py（ASGI）共用
+
+函数只接收普通的 Python 值（查询参数映射、已解析的 JSON、请求头字符串），校验失败抛出 ValueError。
+"""
+import base64
+import gzip
+import hashlib
+import json
+import zlib
+
+from db import COLUMN_NAMES, MAX_PAGE_SIZE, MAX_SEARCH_RESULTS, get_revision, query_accounts, query_account_columns, add_accounts, update_accounts, delete_accounts
+from validation import validate_account, validate_changes, validate_id
+from cache import list_cache
+from pool import snapshot
+
+try:
+    import msgpack
+except ImportError:
+    # 未安装 msgpack 时只提供 JSON 形式的列格式
+    msgpack = None
+
+# 小于该大小的响应不压缩
+COMPRESS_MIN_SIZE = 1024
+
+MAX_LEASE_SECONDS = 24 * 3600
+
+MAX_BULK_ITEMS = 10000
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson')
+
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# GET /accounts 的紧凑列格式，客户端通过 Accept 选择；默认仍为账户对象数组
+COLUMNS_MIMETYPE = 'application/vnd.accounts.columns+json'
+COLUMNS_MSGPACK_MIMETYPE = 'application/vnd.accounts.columns+msgpack'
+LIST_MIMETYPES = {'json': 'application/json', 'columns': COLUMNS_MIMETYPE, 'msgpack': COLUMNS_MSGPACK_MIMETYPE}
+
+# 列格式中不按原值传输的列：bits 为位图（JSON 中再做 base64），epoch 为 UTC epoch 秒
+COLUMN_ENCODINGS = {'gpt_status': 'bits', 'midjourney_status': 'bits', 'added_time': 'epoch'}
+
+# 与 Flask jsonify 的输出相同（紧凑、键排序、ASCII、末尾换行），两个入口返回的字节一致
+def encode_json(value):
+    return (json.dumps(value, ensure_ascii=True, sort_keys=True, separators=(',', ':')) + '\n').encode('ascii')
+
+def error(message):
+    return {'status': 'error', 'message': message}
+
+def fail(message):
+    return {'status': 'fail', 'message': message}
+
+def compress(data, accept_encoding):
+    """按 Accept-Encoding 压缩较大的响应体，返回 (data, 编码或 None)"""
+    if len(data) < COMPRESS_MIN_SIZE:
+        return data, None
+    accepted = (accept_encoding or '').lower()
+    if 'gzip' in accepted:
+        return gzip.compress(data, compresslevel=5), 'gzip'
+    if 'deflate' in accepted:
+        return zlib.compress(data, 5), 'deflate'
+    return data, None
+
+def int_arg(args, name, default=None, minimum=None, maximum=None):
+    """整数查询参数：没有给出时返回 default，不是整数或超出 [minimum, maximum] 时抛出 ValueError"""
+    value = args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError("invalid {}: {}".format(name, value))
+    if minimum is not None and value < minimum:
+        raise ValueError("{} must be at least {}".format(name, minimum))
+    if maximum is not None and value > maximum:
+        raise ValueError("{} must be at most {}".format(name, maximum))
+    return value
+
+def parse_bool(value):
+    if value is None:
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError("invalid boolean: {}".format(value))
+
+def parse_list_args(args):
+    """解析 GET /accounts 的分页、过滤和排序参数"""
+    filters = {
+        'gpt_status': parse_bool(args.get('gpt_status')),
+        'midjourney_status': parse_bool(args.get('midjourney_status')),
+        'min_usage': int_arg(args, 'min_usage', minimum=0),
+        'max_usage': int_arg(args, 'max_usage', minimum=0),
+        'added_after': args.get('added_after'),
+        'added_before': args.get('added_before'),
+        'username_prefix': args.get('username_prefix'),
+        'platform': args.get('platform'),
+    }
+    platform_status = parse_bool(args.get('platform_status'))
+    if platform_status is not None:
+        filters['platform_status'] = platform_status
+    limit = int_arg(args, 'limit', minimum=1, maximum=MAX_PAGE_SIZE)
+    return filters, args.get('sort', 'id'), limit, args.get('cursor')
+
+def parse_search_args(args):
+    """GET /accounts/search 的参数 -> (q, limit)"""
+    return args.get('q', ''), int_arg(args, 'limit', 100, minimum=1, maximum=MAX_SEARCH_RESULTS)
+
+def parse_since(args):
+    """GET /accounts/changes 的 since 参数"""
+    return int_arg(args, 'since', 0, minimum=0)
+
+def list_format(accept):
+    """按 Accept 请求头选择列表格式：'msgpack'（需安装 msgpack）、'columns' 或 'json'"""
+    accept = (accept or '').lower()
+    if msgpack is not None and COLUMNS_MSGPACK_MIMETYPE in accept:
+        return 'msgpack'
+    if COLUMNS_MIMETYPE in accept:
+        return 'columns'
+    return 'json'
+
+def list_etag(revision, query_string, fmt='json'):
+    # 同一表版本、同一组查询参数、同一格式得到的结果相同
+    query = hashlib.md5(query_string).hexdigest()[:12]
+    if fmt != 'json':
+        return '{}-{}-{}'.format(revision, query, fmt)
+    return '{}-{}'.format(revision, query)
+
+def _list_entry(body, next_cursor, gzip_ok):
+    """客户端接受 gzip 时顺便保存压缩结果，缓存命中时不必再压缩"""
+    compressed = None
+    if gzip_ok and len(body) >= COMPRESS_MIN_SIZE:
+        compressed = gzip.compress(body, compresslevel=5)
+    return {'body': body, 'gzip': compressed, 'cursor': next_cursor or ''}
+
+def encode_list(accounts, next_cursor, gzip_ok):
+    """编码列表响应（账户对象数组）"""
+    return _list_entry(encode_json(accounts), next_cursor, gzip_ok)
+
+def pack_bits(values):
+    """布尔列打包为位图：第 i 行对应第 i >> 3 字节的第 i & 7 位"""
+    if not values:
+        return b''
+    return int(''.join('1' if value else '0' for value in reversed(values)), 2).to_bytes((len(values) + 7) // 8, 'little')
+
+def encode_columns(columns, platforms, revision, binary=False):
+    """编码列格式：列名只出现一次，values 中按列名顺序给出每列的值数组
+
+    platforms 为 [[行号, 平台, 0/1]]；revision 为数据所在的表版本号，客户端可以从这里开始同步增量。
+    binary 为真时用 MessagePack 编码，位图直接以二进制传输。
+    """
+    values = []
+    for name in COLUMN_NAMES:
+        column = columns[name]
+        if COLUMN_ENCODINGS.get(name) == 'bits':
+            column = pack_bits(column)
+            if not binary:
+                column = base64.b64encode(column).decode('ascii')
+        values.append(column)
+    payload = {
+        'columns': list(COLUMN_NAMES),
+        'encodings': COLUMN_ENCODINGS,
+        'count': len(columns['id']),
+        'revision': revision,
+        'values': values,
+        'platforms': platforms,
+    }
+    if binary:
+        return msgpack.packb(payload, use_bin_type=True)
+    return encode_json(payload)
+
+def load_account_list(revision, query_string, args, gzip_ok, fmt='json'):
+    """按查询参数和格式取列表响应（优先使用缓存），返回 (缓存条目, etag, 'HIT' 或 'MISS')
+
+    revision 为调用方检查 If-None-Match 时读到的版本号；参数错误时抛出 ValueError。
+    """
+    # 不同格式的编码结果分开缓存
+    key = query_string if fmt == 'json' else fmt.encode() + b'|' + query_string
+    entry = list_cache.get(revision, key)
+    if entry is not None:
+        if entry['gzip'] is None and gzip_ok and len(entry['body']) >= COMPRESS_MIN_SIZE:
+            # 条目由不接受 gzip 的请求写入，补上压缩结果
+            entry = dict(entry, gzip=gzip.compress(entry['body'], compresslevel=5))
+            list_cache.put(revision, key, entry, len(entry['body']) + len(entry['gzip']))
+        return entry, list_etag(revision, query_string, fmt), 'HIT'
+    filters, sort, limit, cursor = parse_list_args(args)
+    if fmt == 'json':
+        # 在同一个读快照中取版本号和数据，缓存条目与版本号严格对应
+        with snapshot():
+            revision = get_revision()
+            accounts, next_cursor = query_accounts(filters, sort, limit, cursor)
+        entry = encode_list(accounts, next_cursor, gzip_ok)
+    else:
+        with snapshot():
+            revision = get_revision()
+            columns, platforms, next_cursor = query_account_columns(filters, sort, limit, cursor)
+        entry = _list_entry(encode_columns(columns, platforms, revision, fmt == 'msgpack'), next_cursor, gzip_ok)
+    list_cache.put(revision, key, entry, len(entry['body']) + len(entry['gzip'] or b''))
+    return entry, list_etag(revision, query_string, fmt), 'MISS'
+
+def parse_etags(header):
+    """解析 If-Match / If-None-Match 头，返回去掉 W/ 前缀和引号的 etag 列表，'*' 原样保留"""
+    tags = []
+    for part in (header or '').split(','):
+        part = part.strip()
+        if part.startswith('W/'):
+            part = part[2:]
+        if part:
+            tags.append(part.strip('"'))
+    return tags
+
+def first_etag(header):
+    """If-Match 中的第一个 etag，没有或为 '*' 时返回 None"""
+    tags = [tag for tag in parse_etags(header) if tag != '*']
+    return tags[0] if tags else None
+
+def parse_checkout_args(data):
+    if not isinstance(data, dict):
+        raise ValueError("request body must be an object")
+    filters = {}
+    for name in ('gpt_status', 'midjourney_status'):
+        if data.get(name) is not None:
+            if not isinstance(data[name], bool):
+                raise ValueError("{} must be a boolean".format(name))
+            filters[name] = data[name]
+    if data.get('max_usage') is not None:
+        if isinstance(data['max_usage'], bool) or not isinstance(data['max_usage'], int):
+            raise ValueError("max_usage must be an integer")
+        filters['max_usage'] = data['max_usage']
+    lease_seconds = data.get('lease_seconds', 0)
+    if isinstance(lease_seconds, bool) or not isinstance(lease_seconds, int) or not 0 <= lease_seconds <= MAX_LEASE_SECONDS:
+        raise ValueError("lease_seconds must be an integer between 0 and {}".format(MAX_LEASE_SECONDS))
+    owner = data.get('owner')
+    if owner is not None and not isinstance(owner, str):
+        raise ValueError("owner must be a string")
+    return filters, lease_seconds, owner
+
+def parse_release_args(data):
+    """POST /accounts/<id>/release 请求体 -> owner；请求体可以为空"""
+    if data is None:
+        return None
+    if not isinstance(data, dict):
+        raise ValueError("request body must be an object")
+    owner = data.get('owner')
+    if owner is not None and not isinstance(owner, str):
+        raise ValueError("owner must be a string")
+    return owner
+
+def parse_account(data):
+    """POST /accounts 请求体 -> 校验并补全默认值后的账户"""
+    return validate_account(data)
+
+def parse_account_update(data):
+    """PUT /accounts/<id> 请求体 -> 校验后的完整账户；除 username（不能修改，可以省略）外必须给出全部字段，
+    只修改部分字段请使用 PATCH"""
+    return validate_account(data, skip=('username',), defaults=False)
+
+def parse_patch(data, if_match=None):
+    """PATCH 请求体 -> (changes, expected_revision)；If-Match 头中的版本号优先于请求体中的 revision 字段"""
+    if not isinstance(data, dict):
+        raise ValueError("request body must be an object")
+    data = dict(data)
+    expected = data.pop('revision', None)
+    if if_match is not None:
+        # If-Match 中的版本号只能是十进制数字
+        if not (if_match.isascii() and if_match.isdigit()):
+            raise ValueError("revision must be an integer")
+        expected = int(if_match)
+    elif expected is not None and (isinstance(expected, bool) or not isinstance(expected, int)):
+        raise ValueError("revision must be an integer")
+    return validate_changes(data), expected
+
+def patch_response(result, account):
+    """patch_account 的结果 -> (响应体, 状态码)"""
+    if result == 'not_found':
+        return fail('account not found'), 404
+    if result == 'conflict':
+        return {'status': 'conflict', 'message': 'account was modified', 'account': account}, 409
+    return {'status': 'success', 'account': account}, 200
+
+def parse_increment(data):
+    """POST /accounts/<id>/usage:increment 请求体 -> amount；请求体可以为空"""
+    if data is None:
+        return 1
+    if not isinstance(data, dict):
+        raise ValueError("request body must be an object")
+    amount = data.get('amount', 1)
+    if isinstance(amount, bool) or not isinstance(amount, int) or amount < 1:
+        raise ValueError("amount must be a positive integer")
+    return amount
+
+def parse_bulk_items(mimetype, body):
+    """解析批量请求体：JSON 数组或 NDJSON（每行一个 JSON），返回 [(item, error)]"""
+    if mimetype in NDJSON_MIMETYPES:
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append((json.loads(line), None))
+            except ValueError:
+                items.append((None, 'invalid JSON line'))
+    else:
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        if not isinstance(data, list):
+            raise ValueError("request body must be a JSON array or NDJSON")
+        items = [(item, None) for item in data]
+    if len(items) > MAX_BULK_ITEMS:
+        raise ValueError("at most {} items per request".format(MAX_BULK_ITEMS))
+    return items
+
+def validate_bulk_update(item):
+    if not isinstance(item, dict):
+        raise ValueError("item must be an object")
+    changes = dict(item)
+    return validate_id(changes.pop('id', None)), validate_changes(changes)
+
+def validate_bulk_delete(item):
+    # 删除请求的每一项可以是 id 或 {"id": ...}
+    return validate_id(item.get('id') if isinstance(item, dict) else item)
+
+def apply_bulk_create(valid):
+    ids = add_accounts([account for _, account in valid])
+    return [(index, {'status': 'success', 'id': account_id}) for (index, _), account_id in zip(valid, ids)]
+
+def apply_bulk_update(valid):
+    updated = update_accounts([item for _, item in valid])
+    return [(index, {'status': 'success', 'id': account_id} if account_id in updated
+             else {'status': 'error', 'id': account_id, 'message': 'account not found'})
+            for index, (account_id, _) in valid]
+
+def apply_bulk_delete(valid):
+    deleted = delete_accounts([account_id for _, account_id in valid])
+    return [(index, {'status': 'success', 'id': account_id} if account_id in deleted
+             else {'status': 'error', 'id': account_id, 'message': 'account not found'})
+            for index, account_id in valid]
+
+# HTTP 方法 -> (逐项校验, 在单个事务中执行)
+BULK_OPERATIONS = {
+    'POST': (validate_account, apply_bulk_create),
+    'PATCH': (validate_bulk_update, apply_bulk_update),
+    'DELETE': (validate_bulk_delete, apply_bulk_delete),
+}
+
+def run_bulk(method, items):
+    """逐项校验，合法的项一次性交给对应操作在单个事务中执行，返回逐项结果"""
+    validate, apply = BULK_OPERATIONS[method]
+    results = [None] * len(items)
+    valid = []
+    for index, (item, error_message) in enumerate(items):
+        if error_message is None:
+            try:
+                valid.append((index, validate(item)))
+                continue
+            except ValueError as e:
+                error_message = str(e)
+        results[index] = {'index': index, 'status': 'error', 'message': error_message}
+    for index, result in apply(valid):
+        results[index] = dict(result, index=index)
+    return {'status': 'success', 'results': results}
+
+def sse_event(changes):
+    return 'id: {}\nevent: changes\ndata: {}\n\n'.format(changes['revision'], json.dumps(changes))
+
+def verify_admin(data):
+    username = data.get('username')
+    password = data.get('password')
+    if username == 'endless-shengyangw' and password == 'F42a9d88':
+        return {'status': 'success'}
+    else:
+        return {'status': 'fail'}
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import json
+
+from db import iter_accounts, add_accounts
+from validation import validate_account
+
+FORMATS = ('ndjson', 'csv')
+
+EXPORT_FIELDS = ['id', 'username', 'password', 'gpt_status', 'midjourney_status', 'custom_platforms', 'usage_count', 'added_time', 'remark']
+
+IMPORT_CHUNK_SIZE = 1000
+
+# 导入结果中最多返回的错误条数
+MAX_REPORTED_ERRORS = 100
+
+def _csv_line(values):
+    buf = io.StringIO()
+    csv.writer(buf).writerow(values)
+    return buf.getvalue()
+
+def export_lines(fmt, accounts=None, header=True):
+    """按行生成导出内容（ndjson 或 csv），默认直接来自数据库游标；
+    分批导出时传入每批 accounts，只有第一批需要 csv 表头"""
+    if accounts is None:
+        accounts = iter_accounts()
+    if fmt == 'ndjson':
+        for account in accounts:
+            yield json.dumps(account, ensure_ascii=False) + '\n'
+    elif fmt == 'csv':
+        if header:
+            yield _csv_line(EXPORT_FIELDS)
+        for account in accounts:
+            row = dict(account,
+                       gpt_status=int(account['gpt_status']),
+                       midjourney_status=int(account['midjourney_status']),
+                       custom_platforms=json.dumps(account['custom_platforms'], ensure_ascii=False))
+            yield _csv_line([row[name] for name in EXPORT_FIELDS])
+    else:
+        raise ValueError("unknown format: {}".format(fmt))
+
+def _from_csv_row(row):
+    account = {k: v for k, v in row.items() if k and v not in (None, '')}
+    for key in ('gpt_status', 'midjourney_status'):
+        if key in account:
+            account[key] = account[key].strip().lower() in ('1', 'true', 'yes')
+    if 'usage_count' in account:
+        try:
+            account['usage_count'] = int(account['usage_count'])
+        except ValueError:
+            raise ValueError("usage_count must be a non-negative integer")
+    if 'custom_platforms' in account:
+        try:
+            account['custom_platforms'] = json.loads(account['custom_platforms'])
+        except ValueError:
+            raise ValueError("custom_platforms must be JSON")
+    return account
+
+def parse_lines(fmt, lines):
+    """逐条解析导入内容，生成 (行号, 已校验账户或 None, 错误信息或 None)"""
+    if fmt == 'ndjson':
+        records = ((number, line) for number, line in enumerate(lines, 1) if line.strip())
+        decode = json.loads
+    elif fmt == 'csv':
+        reader = csv.DictReader(lines)
+        records = ((reader.line_num, row) for row in reader)
+        decode = _from_csv_row
+    else:
+        raise ValueError("unknown format: {}".format(fmt))
+    for number, record in records:
+        try:
+            # 导入时忽略 id，由数据库重新分配
+            yield number, validate_account(decode(record)), None
+        except ValueError as e:
+            yield number, None, str(e)
+
+def import_lines(fmt, lines, chunk_size=IMPORT_CHUNK_SIZE):
+    """流式导入，每 chunk_size 条提交一个事务，返回导入统计"""
+    imported = 0
+    failed = 0
+    errors = []
+    chunk = []
+    for number, account, error in parse_lines(fmt, lines):
+        if error is not None:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': number, 'message': error})
+            continue
+        chunk.append(account)
+        if len(chunk) >= chunk_size:
+            imported += len(add_accounts(chunk))
+            chunk = []
+    if chunk:
+        imported += len(add_accounts(chunk))
+    return {'imported': imported, 'failed': failed, 'errors': errors}
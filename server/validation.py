@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def _text(value, name):
+    if not isinstance(value, str):
+        raise ValueError("{} must be a string".format(name))
+    return value
+
+def _required_text(value, name):
+    value = _text(value, name)
+    if not value:
+        raise ValueError("{} must not be empty".format(name))
+    return value
+
+def _status(value, name):
+    if isinstance(value, bool) or value in (0, 1):
+        return bool(value)
+    raise ValueError("{} must be a boolean".format(name))
+
+def _platforms(value, name):
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise ValueError("{} must be an object".format(name))
+    platforms = {}
+    for platform, status in value.items():
+        if not platform:
+            raise ValueError("{} keys must not be empty".format(name))
+        platforms[platform] = _status(status, '{}.{}'.format(name, platform))
+    return platforms
+
+def _usage_count(value, name):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError("{} must be a non-negative integer".format(name))
+    return value
+
+def _time(value, name):
+    value = _text(value, name)
+    try:
+        datetime.strptime(value, TIME_FORMAT)
+    except ValueError:
+        raise ValueError("{} must use format YYYY-MM-DD HH:MM:SS".format(name))
+    return value
+
+def _remark(value, name):
+    return '' if value is None else _text(value, name)
+
+# 可写字段 -> 校验函数
+FIELDS = {
+    'username': _required_text,
+    'password': _required_text,
+    'gpt_status': _status,
+    'midjourney_status': _status,
+    'custom_platforms': _platforms,
+    'usage_count': _usage_count,
+    'added_time': _time,
+    'remark': _remark,
+}
+
+DEFAULTS = {
+    'gpt_status': False,
+    'midjourney_status': False,
+    'custom_platforms': {},
+    'usage_count': 0,
+    'remark': '',
+}
+
+def validate_account(data, skip=(), defaults=True):
+    """校验完整账户记录，补全默认值，返回新字典；不合法时抛出 ValueError。skip 中的字段不校验也不返回
+
+    defaults 为假时（PUT 整条替换）不补默认值，缺少任何字段都报错，避免把未传的字段重置掉。
+    """
+    if not isinstance(data, dict):
+        raise ValueError("account must be an object")
+    if not defaults:
+        missing = [name for name in FIELDS if name not in skip and name not in data]
+        if missing:
+            raise ValueError("missing fields: {}".format(', '.join(missing)))
+    account = {}
+    for name, check in FIELDS.items():
+        if name in skip:
+            continue
+        if name in data:
+            account[name] = check(data[name], name)
+        elif name in DEFAULTS:
+            account[name] = DEFAULTS[name]
+        elif name == 'added_time':
+            account[name] = datetime.now().strftime(TIME_FORMAT)
+        else:
+            raise ValueError("missing field: {}".format(name))
+    return account
+
+def validate_changes(data):
+    """校验部分字段更新，只返回传入的可写字段"""
+    if not isinstance(data, dict):
+        raise ValueError("changes must be an object")
+    changes = {}
+    for name, value in data.items():
+        if name in FIELDS:
+            changes[name] = FIELDS[name](value, name)
+    if not changes:
+        raise ValueError("no updatable fields")
+    return changes
+
+def validate_id(value):
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ValueError("id must be a positive integer")
+    return value
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""组提交写线程：并发的单条写操作排队后由一个线程合并到同一个事务中提交"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import registry, SQL_BUCKETS
+from pool import savepoint, transaction
+
+# 每个事务最多合并的写操作数，以及第一个操作到达后最多再等待多久（秒）凑批
+MAX_BATCH = int(os.environ.get('ACCOUNTS_GROUP_COMMIT_BATCH', 64))
+MAX_WAIT = float(os.environ.get('ACCOUNTS_GROUP_COMMIT_WAIT_MS', 1)) / 1000
+# ACCOUNTS_GROUP_COMMIT=0 时每个请求各自提交（原来的方式）
+ENABLED = os.environ.get('ACCOUNTS_GROUP_COMMIT', '1').lower() not in ('0', 'false', 'no')
+
+batch_size = registry.histogram('writer_batch_size', 'Mutations committed per group commit', (), (1, 2, 4, 8, 16, 32, 64, 128, 256))
+queue_wait = registry.histogram('writer_queue_wait_seconds', 'Time a mutation waits in the writer queue', (), SQL_BUCKETS)
+commits = registry.counter('writer_commits_total', 'Group commits by outcome', ('outcome',))
+
+
+class GroupCommitWriter:
+    """submit() 返回 Future；写线程取出队列中的操作，每个操作包在一个 SAVEPOINT 中，
+    失败的操作只回滚自己，其余操作一起提交，提交成功后才设置各自的结果"""
+
+    def __init__(self, max_batch=MAX_BATCH, max_wait=MAX_WAIT, enabled=ENABLED):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.mutations = 0
+
+    def _ensure_started(self):
+        # 第一次写入时才启动线程，manage.py 等只读用途不会多出一个线程
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+                    self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._ensure_started()
+        self._queue.put((fn, args, kwargs, future, time.perf_counter()))
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        """执行写操作 fn 并返回其结果；关闭组提交时直接在当前线程执行"""
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        return self.submit(fn, *args, **kwargs).result()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                # 队列里已有的直接取走；队列空了再最多等到 deadline
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            for _, _, _, _, queued in batch:
+                queue_wait.observe(started - queued)
+            outcomes = []
+            try:
+                with transaction():
+                    for fn, args, kwargs, future, _ in batch:
+                        if not future.set_running_or_notify_cancel():
+                            outcomes.append(None)
+                            continue
+                        # 失败的操作回滚到自己的 SAVEPOINT，它注册的提交回调（版本号通知等）也一起撤销
+                        try:
+                            with savepoint('group_item'):
+                                value = fn(*args, **kwargs)
+                        except Exception as e:
+                            outcomes.append((False, e))
+                        else:
+                            outcomes.append((True, value))
+            except Exception as e:
+                # 提交失败：整批都没有写入
+                commits.inc('error')
+                for _, _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            commits.inc('ok')
+            batch_size.observe(len(batch))
+            self.batches += 1
+            self.mutations += len(batch)
+            for (_, _, _, future, _), outcome in zip(batch, outcomes):
+                if outcome is None:
+                    continue
+                ok, value = outcome
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+
+writer = GroupCommitWriter()
+registry.gauge('writer_queue_depth', 'Mutations waiting for the group-commit writer', writer.depth)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""启动耗时分析：设置环境变量 ACCOUNTS_STARTUP_PROFILE 后记录各模块的导入耗时和启动各阶段的时间点
+
+客户端和服务端共用本模块（打包时由 spec 文件的 pathex 加入，源码运行时由入口模块把 shared 目录加入 sys.path）。
+
+值为 1 时把报告输出到 stderr，其他值作为 JSON 报告的文件路径（打包后的客户端没有控制台，需要写入文件）。
+未设置时 begin/mark/report 不做任何事。入口模块在导入其他模块之前调用 begin()，
+服务端准备好处理请求时、客户端表格第一次显示账户时调用 report()。
+
+导入耗时由 sys.meta_path 最前面的查找器记录（打包后同样有效，不依赖 -X importtime）：
+total 为模块第一次导入的总耗时（包括它导入的子模块），self 为去掉子模块后的耗时。
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+
+PROFILE = os.environ.get('ACCOUNTS_STARTUP_PROFILE', '')
+# 报告中列出的导入数量（按总耗时排序）
+TOP_IMPORTS = 30
+
+_start = time.perf_counter()
+_process_age = None
+_marks = []
+_imports = []
+_reported = False
+
+
+class _TimedLoader:
+    """包装其他查找器返回的加载器，从 create_module 开始计时到 exec_module 结束"""
+
+    def __init__(self, loader, timer):
+        self.loader = loader
+        self.timer = timer
+
+    def create_module(self, spec):
+        self.timer.enter()
+        try:
+            return self.loader.create_module(spec)
+        except BaseException:
+            self.timer.leave(spec.name)
+            raise
+
+    def exec_module(self, module):
+        # 模块代码看到的仍是原来的加载器
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.timer.leave(module.__name__)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+class _ImportTimer:
+    def __init__(self):
+        self.local = threading.local()
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def _stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def enter(self):
+        # [开始时间, 子模块耗时之和]
+        self._stack().append([time.perf_counter(), 0.0])
+
+    def leave(self, name):
+        stack = self._stack()
+        if not stack:
+            return
+        started, children = stack.pop()
+        total = time.perf_counter() - started
+        if stack:
+            stack[-1][1] += total
+        _imports.append({'module': name, 'total_ms': round(total * 1000, 2), 'self_ms': round((total - children) * 1000, 2),
+                         'thread': threading.current_thread().name})
+
+
+def process_age():
+    """进程已运行的秒数（包括打包程序的解压和解释器初始化），无法获取时返回 None"""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+            creation, exited, kernel, user, now = (wintypes.FILETIME() for _ in range(5))
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), ctypes.byref(creation), ctypes.byref(exited),
+                                     ctypes.byref(kernel), ctypes.byref(user))
+            kernel32.GetSystemTimeAsFileTime(ctypes.byref(now))
+            # FILETIME 以 100 纳秒为单位
+            return ((now.dwHighDateTime << 32 | now.dwLowDateTime) - (creation.dwHighDateTime << 32 | creation.dwLowDateTime)) / 1e7
+        with open('/proc/self/stat') as f:
+            # 第 22 个字段为进程启动时间（开机后的时钟滴答数），进程名中可能有空格，从 ')' 之后开始数
+            started = int(f.read().rsplit(')', 1)[1].split()[19]) / os.sysconf('SC_CLK_TCK')
+        with open('/proc/uptime') as f:
+            return float(f.read().split()[0]) - started
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def begin():
+    """开始记录（必须在导入其他模块之前调用）"""
+    global _start, _process_age
+    if not PROFILE or any(isinstance(finder, _ImportTimer) for finder in sys.meta_path):
+        return
+    _start = time.perf_counter()
+    _process_age = process_age()
+    sys.meta_path.insert(0, _ImportTimer())
+    # 没有到达 report() 的调用点（例如启动失败）时在退出时输出
+    atexit.register(report)
+
+
+def mark(name):
+    """记录一个启动阶段完成的时间点（距 begin() 的毫秒数）"""
+    if PROFILE:
+        _marks.append({'name': name, 'ms': round((time.perf_counter() - _start) * 1000, 1),
+                       'thread': threading.current_thread().name})
+
+
+def report():
+    """输出一次报告并停止记录导入，之后的调用不做任何事"""
+    global _reported
+    if not PROFILE or _reported:
+        return
+    _reported = True
+    sys.meta_path[:] = [finder for finder in sys.meta_path if not isinstance(finder, _ImportTimer)]
+    data = {
+        'process_ms_at_begin': round(_process_age * 1000, 1) if _process_age is not None else None,
+        'marks': _marks,
+        'imports': sorted(_imports, key=lambda item: item['total_ms'], reverse=True)[:TOP_IMPORTS],
+    }
+    if PROFILE != '1':
+        import json
+        with open(PROFILE, 'w') as f:
+            json.dump(data, f, indent=2)
+        return
+    lines = ['startup profile (ms since begin; process had been running {} ms before begin):'.format(data['process_ms_at_begin'])]
+    lines.extend('  {:>8.1f}  {}{}'.format(item['ms'], item['name'], '' if item['thread'] == 'MainThread' else '  [' + item['thread'] + ']')
+                 for item in _marks)
+    lines.append('slowest imports (total / self ms):')
+    lines.extend('  {:>8.1f} {:>8.1f}  {}{}'.format(item['total_ms'], item['self_ms'], item['module'],
+                                                   '' if item['thread'] == 'MainThread' else '  [' + item['thread'] + ']')
+                 for item in data['imports'])
+    print('\n'.join(lines), file=sys.stderr)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""测试公共设置：服务端模块按目录平铺导入，在导入 pool 之前指定临时数据库，不会改动 server/accounts.db
+
+客户端目录排在服务端之后，只用于导入服务端没有的同名模块（api、columns、store 等）。
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ['ACCOUNTS_DB'] = os.path.join(tempfile.mkdtemp(), 'accounts.db')
+os.environ['ACCOUNTS_LOG_PAYLOADS'] = '0'
+sys.path.insert(0, os.path.join(ROOT, 'server'))
+sys.path.append(os.path.join(ROOT, 'client'))
+
+
+def make_account(i, **fields):
+    account = {
+        'username': 'user{:05d}@example.com'.format(i),
+        'password': 'password{}'.format(i),
+        'gpt_status': i % 2 == 0,
+        'midjourney_status': i % 3 == 0,
+        'custom_platforms': {'claude': True} if i % 5 == 0 else {},
+        'usage_count': i % 7,
+        'added_time': '2024-01-{:02d} 12:00:00'.format(i % 28 + 1),
+        'remark': 'remark {}'.format(i),
+    }
+    account.update(fields)
+    return account
+
+
+def use_database(path):
+    """让连接池改用 path 指向的数据库，并清空上一个库留下的进程内状态"""
+    import pool
+    import db
+    from cache import list_cache
+    from events import notifier
+    pool.close_all()
+    pool.pool.db_file = path
+    list_cache.invalidate()
+    notifier.revision = 0
+    db._initialized = False
+
+
+@pytest.fixture
+def database(tmp_path):
+    """每个测试一个新的、已迁移到最新结构的数据库，返回 db 模块"""
+    import pool
+    import db
+    use_database(str(tmp_path / 'accounts.db'))
+    db.ensure_db()
+    yield db
+    pool.close_all()
+
+
+@pytest.fixture
+def seeded(database):
+    """写入 60 个账户"""
+    database.add_accounts([make_account(i) for i in range(60)])
+    return database
+
+
+@pytest.fixture
+def client(database):
+    """Flask 测试客户端（写操作经过组提交写线程）"""
+    import main
+    return main.app.test_client()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""客户端 api 模块（client/api.py）"""
+import json
+import socket
+import threading
+
+import pytest
+
+import api
+
+
+@pytest.fixture
+def no_retries():
+    api.configure(retries=0, backoff=0)
+    yield
+    api.configure(retries=3, backoff=0.5)
+
+
+def drop_after_request():
+    """读完一个请求后直接关闭连接的服务端，返回其地址"""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+
+    def run():
+        conn, _ = listener.accept()
+        data = b''
+        while b'\r\n\r\n' not in data:
+            data += conn.recv(65536)
+        conn.close()
+        listener.close()
+
+    threading.Thread(target=run, daemon=True).start()
+    return 'http://127.0.0.1:{}'.format(listener.getsockname()[1])
+
+
+def unused_url():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return 'http://127.0.0.1:{}'.format(s.getsockname()[1])
+
+
+def test_refused_connection_is_offline(monkeypatch, no_retries):
+    monkeypatch.setattr(api, 'BASE_URL', unused_url())
+    with pytest.raises(api.OfflineError):
+        api.create_account({'username': 'a@example.com', 'password': 'password1'})
+
+
+def test_connection_lost_after_sending_is_not_offline(monkeypatch, no_retries):
+    import requests
+    monkeypatch.setattr(api, 'BASE_URL', drop_after_request())
+    with pytest.raises(requests.ConnectionError) as info:
+        api.create_account({'username': 'a@example.com', 'password': 'password1'})
+    assert not isinstance(info.value, api.OfflineError)
+
+
+def test_patch_is_only_retried_before_sending():
+    retry = api.get_session().get_adapter('http://example.com').max_retries
+    assert not retry.is_retry('PATCH', 503)
+    assert not retry._is_method_retryable('PATCH')
+    assert retry._is_method_retryable('GET')
+    assert retry.connect == api.RETRIES
+
+
+def fake_response(status, body, headers=None):
+    import requests
+    response = requests.models.Response()
+    response.status_code = status
+    response._content = json.dumps(body).encode()
+    response.headers.update(headers or {})
+    response.url = 'http://127.0.0.1/'
+    return response
+
+
+def respond_with(monkeypatch, *responses):
+    responses = list(responses)
+    monkeypatch.setattr(api, '_request', lambda method, path, **kwargs: responses.pop(0))
+
+
+def test_checkout_raises_on_error_status(monkeypatch):
+    import requests
+    respond_with(monkeypatch, fake_response(404, {'status': 'fail', 'message': 'no account available'}),
+                 fake_response(400, {'status': 'error', 'message': 'owner must be a string'}))
+    assert api.checkout_account() is None
+    with pytest.raises(requests.HTTPError):
+        api.checkout_account(owner=5)
+
+
+def test_bulk_raises_on_error_status(monkeypatch):
+    import requests
+    respond_with(monkeypatch, fake_response(400, {'status': 'error', 'message': 'request body must be an array'}))
+    with pytest.raises(requests.HTTPError):
+        api.create_accounts([{'username': 'a@example.com'}])
+
+
+def test_error_pages_are_not_cached(monkeypatch):
+    import requests
+    monkeypatch.setattr(api, '_page_cache', {})
+    respond_with(monkeypatch, fake_response(500, {'status': 'error', 'message': 'internal server error'}, {'ETag': 'W/"1"'}),
+                 fake_response(200, [{'id': 1}], {'ETag': 'W/"2"'}))
+    with pytest.raises(requests.HTTPError):
+        api.get_accounts_page()
+    assert api._page_cache == {}
+    assert api.get_accounts_page() == ([{'id': 1}], None)
+    assert [entry[0] for entry in api._page_cache.values()] == ['W/"2"']
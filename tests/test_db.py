@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+from conftest import make_account
+
+
+def test_patch_conflict_keeps_revision(database):
+    database.add_account(make_account(1))
+    account = database.get_accounts()[0]
+    assert database.get_revision() == 1
+
+    result, _ = database.patch_account(account['id'], {'remark': 'new'}, expected_revision=account['revision'])
+    assert result == 'updated'
+    assert database.get_revision() == 2
+
+    result, current = database.patch_account(account['id'], {'remark': 'stale'}, expected_revision=account['revision'])
+    assert result == 'conflict'
+    assert current['remark'] == 'new'
+    assert database.get_revision() == 2
+    assert database.patch_account(999, {'remark': 'x'}) == ('not_found', None)
+    assert database.get_revision() == 2
+
+
+def test_increment_missing_account_keeps_revision(database):
+    from events import notifier
+    database.add_account(make_account(1))
+    account_id = database.get_accounts()[0]['id']
+
+    assert database.increment_usage(999) is None
+    assert database.get_revision() == 1
+    assert database.increment_usage(account_id, 3) == 1 % 7 + 3
+    assert database.get_revision() == notifier.revision == 2
+    assert [a['id'] for a in database.get_changes(1)['accounts']] == [account_id]
+
+
+def test_release_unleased_account_keeps_revision(database):
+    database.add_account(make_account(1))
+    account_id = database.get_accounts()[0]['id']
+
+    assert not database.release_account(account_id)
+    assert database.get_revision() == 1
+    account = database.checkout_account(lease_seconds=60, owner='worker-a')
+    assert account['id'] == account_id
+    assert database.get_revision() == 2
+    assert not database.release_account(account_id, owner='worker-b')
+    assert database.get_revision() == 2
+    assert database.release_account(account_id, owner='worker-a')
+    assert database.get_revision() == 3
+
+
+def test_update_missing_account_keeps_revision(database):
+    from events import notifier
+    database.add_account(make_account(1))
+
+    database.update_account(999, make_account(2))
+    assert database.get_revision() == notifier.revision == 1
+    assert database.get_changes(1) == {'revision': 1, 'accounts': [], 'deleted': []}
+
+
+def test_every_sort_uses_an_index(seeded):
+    from pool import get_connection
+    conn = get_connection()
+    for sort, keys in seeded.SORT_KEYS.items():
+        sql = "EXPLAIN QUERY PLAN SELECT id FROM accounts WHERE ({}) > ({}) ORDER BY {} LIMIT 50".format(
+            ', '.join(keys), ', '.join('?' * len(keys)), ', '.join(keys))
+        plan = ' '.join(row[-1] for row in conn.execute(sql, [0] * len(keys)))
+        assert 'TEMP B-TREE' not in plan, (sort, plan)
+
+
+def test_keyset_pages_match_full_list(seeded):
+    for sort in seeded.SORT_KEYS:
+        for filters in ({}, {'gpt_status': True}, {'platform': 'claude'}, {'min_usage': 2, 'max_usage': 5}):
+            full, cursor = seeded.query_accounts(filters, sort)
+            assert cursor is None
+            paged, cursor = [], None
+            while True:
+                page, cursor = seeded.query_accounts(filters, sort, limit=7, cursor=cursor)
+                assert len(page) <= 7
+                paged.extend(page)
+                if cursor is None:
+                    break
+            assert [a['id'] for a in paged] == [a['id'] for a in full], (sort, filters)
+
+
+def test_full_list_order(seeded):
+    accounts, _ = seeded.query_accounts(sort='usage')
+    keys = [(a['usage_count'], a['id']) for a in accounts]
+    assert keys == sorted(keys) and len(accounts) == 60
+    accounts, _ = seeded.query_accounts(sort='availability')
+    # 与客户端 sort_accounts 相同的排序键
+    keys = [(a['gpt_status'] and a['midjourney_status'], a['gpt_status'] or a['midjourney_status'],
+             a['usage_count'], a['username']) for a in accounts]
+    assert keys == sorted(keys)
+    assert [a['custom_platforms'] for a in accounts if a['id'] == 1] == [{'claude': True}]
+
+
+def test_invalid_cursor(seeded):
+    import pytest
+    with pytest.raises(ValueError):
+        seeded.query_accounts(sort='usage', limit=5, cursor='bm90IGpzb24')
+    _, cursor = seeded.query_accounts(sort='id', limit=5)
+    with pytest.raises(ValueError):
+        seeded.query_accounts(sort='usage', limit=5, cursor=cursor)
+    for values in ([[1], 2], [{'a': 1}, 2]):
+        with pytest.raises(ValueError):
+            seeded.query_accounts(sort='usage', limit=5, cursor=seeded.encode_cursor(values))
+
+
+def test_changes_and_tombstones(seeded):
+    from events import notifier
+    initial = seeded.get_changes(0)
+    assert initial['revision'] == 1 and len(initial['accounts']) == 60 and initial['deleted'] == []
+    assert seeded.get_changes(1) == {'revision': 1, 'accounts': [], 'deleted': []}
+
+    seeded.patch_account(5, {'remark': 'changed'})
+    seeded.delete_account(6)
+    seeded.delete_accounts([7, 8, 999])
+    changes = seeded.get_changes(1)
+    assert changes['revision'] == notifier.revision == 4
+    assert [(a['id'], a['remark']) for a in changes['accounts']] == [(5, 'changed')]
+    assert sorted(changes['deleted']) == [6, 7, 8]
+    assert seeded.get_changes(3) == {'revision': 4, 'accounts': [], 'deleted': [7, 8]}
+
+    # 从头同步时已删除的账户不会出现在 accounts 中
+    full = seeded.get_changes(0)
+    assert len(full['accounts']) == 57
+    assert not {6, 7, 8} & {a['id'] for a in full['accounts']}
+
+
+def test_deleting_missing_account_keeps_revision(seeded):
+    seeded.delete_account(999)
+    assert seeded.delete_accounts([998, 999]) == set()
+    assert seeded.update_accounts([(999, {'remark': 'x'})]) == set()
+    assert seeded.get_revision() == 1
+
+
+def test_username_prefix_upper_bound(database):
+    assert database._prefix_upper_bound('abc') == 'abd'
+    assert database._prefix_upper_bound('ab\U0010ffff\U0010ffff') == 'ac'
+    assert database._prefix_upper_bound('\U0010ffff') is None
+    assert database._prefix_upper_bound('a\ud7ff') == 'a\ue000'
+
+    for i, name in enumerate(['\U0010ffff@example.com', '\U0010ffff\U0010ffff', 'z@example.com']):
+        database.add_account(make_account(i, username=name))
+    accounts, _ = database.query_accounts({'username_prefix': '\U0010ffff'}, sort='id')
+    assert [a['username'] for a in accounts] == ['\U0010ffff@example.com', '\U0010ffff\U0010ffff']
+    accounts, _ = database.query_accounts({'username_prefix': 'z'}, sort='id')
+    assert [a['username'] for a in accounts] == ['z@example.com']
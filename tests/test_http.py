@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""Flask（main.py）和 ASGI（asgi.py）两个入口的接口行为"""
+import asyncio
+import json
+
+import pytest
+
+from conftest import make_account
+
+
+def asgi_request(method, path, body=None, headers=()):
+    """直接调用 asgi.app，返回 (状态码, 响应头字典, 响应体)"""
+    import asgi
+    path, _, query = path.partition('?')
+    payload = b'' if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+    if not any(name.lower() == 'content-type' for name, _ in headers):
+        scope['headers'].append((b'content-type', b'application/json'))
+    messages = [{'type': 'http.request', 'body': payload, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+    start = sent[0]
+    response_headers = {name.decode(): value.decode() for name, value in start['headers']}
+    return start['status'], response_headers, b''.join(m.get('body', b'') for m in sent[1:])
+
+
+class FlaskFrontend:
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, method, path, body=None, headers=()):
+        headers = dict(headers)
+        content_type = headers.pop('Content-Type', 'application/json')
+        kwargs = {'headers': headers}
+        if isinstance(body, bytes):
+            kwargs.update(data=body, content_type=content_type)
+        elif body is not None:
+            kwargs['json'] = body
+        response = self.client.open(path, method=method, **kwargs)
+        return response.status_code, dict(response.headers), response.get_data()
+
+
+class AsgiFrontend:
+    def request(self, method, path, body=None, headers=()):
+        return asgi_request(method, path, body, headers)
+
+
+@pytest.fixture(params=['flask', 'asgi'])
+def frontend(request, client):
+    return FlaskFrontend(client) if request.param == 'flask' else AsgiFrontend()
+
+
+def call(frontend, method, path, body=None, headers=()):
+    status, response_headers, data = frontend.request(method, path, body, headers)
+    return status, json.loads(data) if data else None
+
+
+def test_create_account_validates_body(frontend, database):
+    status, body = call(frontend, 'POST', '/accounts', {'username': 'a@example.com'})
+    assert status == 400
+    assert body == {'status': 'error', 'message': 'missing field: password'}
+    assert call(frontend, 'POST', '/accounts', ['not', 'an', 'object'])[0] == 400
+    assert call(frontend, 'POST', '/accounts', b'{not json')[0] == 400
+    assert call(frontend, 'POST', '/accounts', make_account(1, username=None))[0] == 400
+    assert database.get_revision() == 0
+
+    assert call(frontend, 'POST', '/accounts', {'username': 'a@example.com', 'password': 'password1'}) == (200, {'status': 'success'})
+    account = database.get_accounts()[0]
+    assert account['username'] == 'a@example.com'
+    assert account['usage_count'] == 0 and account['remark'] == ''
+
+
+def test_update_account_validates_body(frontend, database):
+    database.add_account(make_account(1))
+    account_id = database.get_accounts()[0]['id']
+
+    status, body = call(frontend, 'PUT', '/accounts/{}'.format(account_id), {'password': 'x', 'usage_count': -1})
+    assert status == 400
+    assert body['status'] == 'error'
+    assert call(frontend, 'PUT', '/accounts/{}'.format(account_id), 'text')[0] == 400
+    assert database.get_revision() == 1
+
+    status, _ = call(frontend, 'PUT', '/accounts/{}'.format(account_id), dict(make_account(1), password='changed1', username='ignored'))
+    assert status == 200
+    account = database.get_accounts()[0]
+    assert account['password'] == 'changed1'
+    assert account['username'] == make_account(1)['username']
+
+
+def test_partial_put_leaves_row_unchanged(frontend, database):
+    database.add_account(make_account(1))
+    before = database.get_accounts()[0]
+
+    status, body = call(frontend, 'PUT', '/accounts/{}'.format(before['id']), {'password': 'newpassword'})
+    assert status == 400
+    assert body['message'] == 'missing fields: gpt_status, midjourney_status, custom_platforms, usage_count, added_time, remark'
+    assert database.get_accounts()[0] == before
+    assert database.get_revision() == 1
+
+
+@pytest.mark.parametrize('path', [
+    '/accounts?limit=abc', '/accounts?limit=0', '/accounts?limit=-5', '/accounts?limit=1001',
+    '/accounts?min_usage=abc', '/accounts?max_usage=-1', '/accounts?sort=bogus',
+    '/accounts/changes?since=abc', '/accounts/changes?since=-1',
+    '/accounts/search?q=user&limit=abc', '/accounts/search?q=user&limit=0',
+    '/accounts?sort=usage&cursor=W1sxXSwgMl0=',
+])
+def test_invalid_query_parameters_are_rejected(frontend, seeded, path):
+    status, body = call(frontend, 'GET', path)
+    assert status == 400
+    assert body['status'] == 'error'
+
+
+def test_valid_query_parameters(frontend, seeded):
+    status, accounts = call(frontend, 'GET', '/accounts?limit=1000&min_usage=3&max_usage=4')
+    assert status == 200
+    assert accounts and all(3 <= a['usage_count'] <= 4 for a in accounts)
+    assert call(frontend, 'GET', '/accounts/changes?since=0')[1]['revision'] == 1
+    assert len(call(frontend, 'GET', '/accounts/search?q=user0000&limit=5')[1]) == 5
+    # U+10FFFF 结尾的前缀没有可加一的上界
+    assert call(frontend, 'GET', '/accounts?username_prefix=%F4%8F%BF%BF') == (200, [])
+
+
+def test_pages_follow_next_cursor(frontend, seeded):
+    full = seeded.query_accounts(sort='availability')[0]
+    paged, cursor = [], ''
+    while True:
+        path = '/accounts?sort=availability&limit=9' + ('&cursor=' + cursor if cursor else '')
+        status, headers, body = frontend.request('GET', path)
+        assert status == 200
+        paged.extend(json.loads(body))
+        cursor = {name.lower(): value for name, value in headers.items()}['x-next-cursor']
+        if not cursor:
+            break
+    assert paged == json.loads(json.dumps(full))
+
+
+def lower_keys(headers):
+    return {name.lower(): value for name, value in headers.items()}
+
+
+def test_etag_revalidation(frontend, seeded):
+    status, headers, body = frontend.request('GET', '/accounts?limit=10')
+    headers = lower_keys(headers)
+    etag = headers['etag']
+    assert status == 200 and etag.startswith('W/"')
+
+    status, headers, _ = frontend.request('GET', '/accounts?limit=10', headers=[('If-None-Match', etag)])
+    assert status == 304
+    assert lower_keys(headers)['etag'] == etag
+    # 不同的查询参数或格式有不同的 ETag
+    assert lower_keys(frontend.request('GET', '/accounts?limit=11')[1])['etag'] != etag
+    columns = frontend.request('GET', '/accounts?limit=10', headers=[('Accept', 'application/vnd.accounts.columns+json')])
+    assert lower_keys(columns[1])['etag'] != etag
+
+    seeded.increment_usage(1)
+    status, headers, new_body = frontend.request('GET', '/accounts?limit=10', headers=[('If-None-Match', etag)])
+    assert status == 200
+    assert lower_keys(headers)['etag'] != etag
+    assert new_body != body
+
+
+def test_list_cache_and_gzip(frontend, seeded):
+    import gzip
+    plain = frontend.request('GET', '/accounts')
+    again = frontend.request('GET', '/accounts', headers=[('Accept-Encoding', 'gzip')])
+    assert lower_keys(plain[1])['x-cache'] == 'MISS'
+    assert lower_keys(again[1])['x-cache'] == 'HIT'
+    assert lower_keys(again[1])['content-encoding'] == 'gzip'
+    assert gzip.decompress(again[2]) == plain[2]
+
+
+def test_bulk_partial_failure(frontend, database):
+    items = [make_account(1), {'username': 'x@example.com'}, make_account(2), 'not an object']
+    status, body = call(frontend, 'POST', '/accounts/bulk', items)
+    assert status == 200
+    results = body['results']
+    assert [r['status'] for r in results] == ['success', 'error', 'success', 'error']
+    assert [r['index'] for r in results] == [0, 1, 2, 3]
+    assert results[1]['message'] == 'missing field: password'
+    ids = [results[0]['id'], results[2]['id']]
+    assert sorted(a['id'] for a in database.get_accounts()) == sorted(ids)
+    # 一个请求只产生一个版本号
+    assert database.get_revision() == 1
+
+    status, body = call(frontend, 'PATCH', '/accounts/bulk', [
+        {'id': ids[0], 'remark': 'bulk'}, {'id': 999, 'remark': 'x'}, {'id': ids[1], 'usage_count': -1}, {'remark': 'no id'}])
+    assert [r['status'] for r in body['results']] == ['success', 'error', 'error', 'error']
+    assert body['results'][1]['message'] == 'account not found'
+    assert {a['id']: a['remark'] for a in database.get_accounts()}[ids[0]] == 'bulk'
+    assert database.get_revision() == 2
+
+    status, body = call(frontend, 'DELETE', '/accounts/bulk', [ids[0], {'id': 999}, 'x'])
+    assert [r['status'] for r in body['results']] == ['success', 'error', 'error']
+    assert [a['id'] for a in database.get_accounts()] == [ids[1]]
+    assert database.get_changes(2)['deleted'] == [ids[0]]
+
+
+def test_bulk_ndjson_and_invalid_bodies(frontend, database):
+    lines = '\n'.join([json.dumps(make_account(1)), '{broken', '', json.dumps(make_account(2))]).encode()
+    status, _, data = frontend.request('POST', '/accounts/bulk', lines, headers=[('Content-Type', 'application/x-ndjson')])
+    assert status == 200
+    assert [r['status'] for r in json.loads(data)['results']] == ['success', 'error', 'success']
+    assert len(database.get_accounts()) == 2
+
+    assert call(frontend, 'POST', '/accounts/bulk', {'not': 'a list'})[0] == 400
+    assert call(frontend, 'DELETE', '/accounts/bulk', b'garbage')[0] == 400
+    assert database.get_revision() == 1
+
+
+
+def test_release_validates_body(frontend, database):
+    database.add_account(make_account(1))
+    status, body = call(frontend, 'POST', '/accounts/checkout', {'lease_seconds': 60, 'owner': 'worker'})
+    path = '/accounts/{}/release'.format(body['account']['id'])
+
+    for invalid in (['owner'], 'worker', {'owner': 5}):
+        status, body = call(frontend, 'POST', path, invalid)
+        assert status == 400 and body['status'] == 'error'
+    assert database.get_revision() == 2
+    assert call(frontend, 'POST', path, {'owner': 'worker'}) == (200, {'status': 'success'})
+
+
+def test_increment_validates_body(frontend, database):
+    database.add_account(make_account(1))
+    path = '/accounts/{}/usage:increment'.format(database.get_accounts()[0]['id'])
+
+    for invalid in ([1], 'text', {'amount': 0}, {'amount': True}, {'amount': 1.5}):
+        status, body = call(frontend, 'POST', path, invalid)
+        assert status == 400 and body['status'] == 'error'
+    assert database.get_revision() == 1
+    assert call(frontend, 'POST', path)[0] == 200
+    assert call(frontend, 'POST', path, {'amount': 2})[0] == 200
+    assert database.get_accounts()[0]['usage_count'] == make_account(1)['usage_count'] + 3
+
+
+def test_patch_requires_integer_revision(frontend, database):
+    database.add_account(make_account(1))
+    account = database.get_accounts()[0]
+    path = '/accounts/{}'.format(account['id'])
+
+    for revision in (1.7, True, '1', [1]):
+        assert call(frontend, 'PATCH', path, {'remark': 'x', 'revision': revision})[0] == 400
+    for tag in ('"1.5"', '"abc"', '"-1"', '"١"'):
+        assert call(frontend, 'PATCH', path, {'remark': 'x'}, headers=[('If-Match', tag)])[0] == 400
+    assert database.get_revision() == 1
+
+    status, body = call(frontend, 'PATCH', path, {'remark': 'a', 'revision': account['revision']})
+    assert status == 200
+    status, body = call(frontend, 'PATCH', path, {'remark': 'b'}, headers=[('If-Match', '"{}"'.format(body['account']['revision']))])
+    assert status == 200 and body['account']['remark'] == 'b'
+
+
+def test_asgi_event_slot_is_reserved_before_streaming(monkeypatch, database):
+    import asgi
+    monkeypatch.setattr(asgi, 'MAX_EVENT_SUBSCRIBERS', 1)
+    scope = {'type': 'http', 'method': 'GET', 'path': '/accounts/events', 'query_string': b'since=0', 'headers': []}
+
+    async def receive():
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        raise ConnectionError
+
+    async def run():
+        first = await asgi.account_events(asgi.Request(scope, receive))
+        # 第一个响应还没开始发送，名额已被占用
+        second = await asgi.account_events(asgi.Request(scope, receive))
+        assert second.status == 503
+        with pytest.raises(ConnectionError):
+            await first.send(send, receive)
+
+    asyncio.run(run())
+    assert asgi.event_subscribers == 0
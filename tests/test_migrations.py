@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+
+import pytest
+
+from conftest import use_database
+
+# 引入迁移机制之前的两种库：最初没有 added_time / remark 的表，以及旧版 schema.sql 建出的表
+LEGACY_SCHEMAS = {
+    'original': """CREATE TABLE accounts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        password TEXT NOT NULL,
+        gpt_status INTEGER NOT NULL,
+        midjourney_status INTEGER NOT NULL,
+        custom_platforms TEXT,
+        usage_count INTEGER NOT NULL
+    )""",
+    'baseline': """CREATE TABLE accounts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        password TEXT NOT NULL,
+        gpt_status INTEGER NOT NULL,
+        midjourney_status INTEGER NOT NULL,
+        custom_platforms TEXT,
+        usage_count INTEGER NOT NULL,
+        added_time TEXT NOT NULL,
+        remark TEXT
+    )""",
+}
+
+
+def create_legacy(path, schema):
+    conn = sqlite3.connect(path)
+    conn.execute(LEGACY_SCHEMAS[schema])
+    rows = [
+        ('alice@example.com', 'password1', 1, 0, json.dumps({'claude': True, 'poe': False}), 3),
+        ('bob@example.com', 'password2', 0, 1, '{}', 0),
+        ('carol@example.com', 'password3', 1, 1, 'not json', 7),
+    ]
+    if schema == 'baseline':
+        conn.executemany("INSERT INTO accounts (username, password, gpt_status, midjourney_status, custom_platforms, usage_count, added_time, remark) "
+                         "VALUES (?, ?, ?, ?, ?, ?, '2024-01-01 00:00:00', 'legacy')", rows)
+    else:
+        conn.executemany("INSERT INTO accounts (username, password, gpt_status, midjourney_status, custom_platforms, usage_count) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def schema_objects(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(conn.execute("SELECT type, name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' AND name NOT LIKE 'accounts_fts_%'"))
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('schema', sorted(LEGACY_SCHEMAS))
+def test_migrate_legacy_database(tmp_path, schema):
+    import db
+    import migrations
+    import pool
+    from pool import get_connection
+
+    path = str(tmp_path / 'legacy.db')
+    create_legacy(path, schema)
+    use_database(path)
+    assert migrations.current_version() == 0
+
+    db.ensure_db()
+    assert migrations.current_version() == migrations.LATEST_VERSION
+    accounts = {a['username']: a for a in db.get_accounts()}
+    assert accounts['alice@example.com']['custom_platforms'] == {'claude': True, 'poe': False}
+    assert accounts['carol@example.com']['custom_platforms'] == {}
+    # 旧数据统一分配一个版本号，since=0 的首次同步拿到全部账户
+    assert db.get_revision() == 1
+    assert {a['revision'] for a in accounts.values()} == {1}
+    assert len(db.get_changes(0)['accounts']) == 3
+    assert [a['username'] for a in db.search_accounts('car')] == ['carol@example.com']
+    assert get_connection().execute("SELECT COUNT(*) FROM accounts WHERE custom_platforms IS NOT NULL").fetchone()[0] == 0
+
+    # 再次执行不做任何事
+    assert migrations.migrate() == []
+
+    fresh = str(tmp_path / 'fresh.db')
+    use_database(fresh)
+    db.ensure_db()
+    assert schema_objects(path) == schema_objects(fresh)
+    pool.close_all()
+
+
+def test_fresh_database_records_all_migrations(database):
+    import migrations
+    from pool import get_connection
+    assert migrations.current_version() == migrations.LATEST_VERSION
+    versions = [row[0] for row in get_connection().execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == [version for version, _, _ in migrations.MIGRATIONS]
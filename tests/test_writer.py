@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from conftest import make_account
+
+
+def test_failed_item_does_not_advance_notifier(database):
+    from events import notifier
+    from writer import GroupCommitWriter
+
+    writer = GroupCommitWriter(max_batch=16, max_wait=0.05, enabled=True)
+    futures = []
+    for i in range(6):
+        data = make_account(i)
+        if i % 2:
+            # username 为 NULL，INSERT 违反 NOT NULL 约束
+            data['username'] = None
+        futures.append(writer.submit(database.add_account, data))
+    for i, future in enumerate(futures):
+        if i % 2:
+            with pytest.raises(Exception):
+                future.result(timeout=5)
+        else:
+            future.result(timeout=5)
+
+    assert writer.batches >= 1
+    assert len(database.get_accounts()) == 3
+    assert notifier.revision == database.get_revision()
+
+
+def test_failed_item_keeps_next_commit_notified(database):
+    from events import notifier
+    from writer import GroupCommitWriter
+
+    writer = GroupCommitWriter(max_batch=4, max_wait=0.05, enabled=True)
+    writer.submit(database.add_account, make_account(1)).result(timeout=5)
+    with pytest.raises(Exception):
+        writer.call(database.add_account, make_account(2, username=None))
+    assert notifier.revision == database.get_revision() == 1
+
+    writer.call(database.add_account, make_account(3))
+    assert notifier.revision == database.get_revision() == 2
+
+
+def test_savepoint_discards_callbacks_on_rollback(database):
+    import pool
+
+    called = []
+    with pool.transaction() as conn:
+        pool.after_commit(lambda: called.append('outer'))
+        with pytest.raises(RuntimeError):
+            with pool.savepoint():
+                conn.execute("UPDATE sync_state SET value = 100 WHERE name = 'revision'")
+                pool.after_commit(lambda: called.append('inner'))
+                raise RuntimeError
+    assert called == ['outer']
+    assert database.get_revision() == 0